@@ -0,0 +1,186 @@
+# assets/kb_artifact.py
+# 知識庫預編譯檔：把 JSON 知識庫一次編譯成單一 pickle（渲染好的文字、BM25 索引、表格資料、內容雜湊），
+# 冷啟動的 Streamlit worker 直接載入這個檔案，不必再讀三個 JSON、逐表逐塊格式化。
+#
+# 失效判斷（任一不符就重建）：
+# - 格式版本 ARTIFACT_FORMAT
+# - 編譯程式碼（knowledge.py / retrieval.py / 本檔）的雜湊
+# - 來源 JSON 的 (檔名, 大小, mtime)；若只有 mtime 變了（例如重新 checkout），再比對內容雜湊，相同就沿用
+#
+# 手動建置/檢查：
+#   python -m assets.kb_artifact build
+#   python -m assets.kb_artifact check
+
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import KB_ARTIFACT_PATH
+
+ARTIFACT_FORMAT = 1
+
+_ASSETS_DIR = Path(__file__).resolve().parent
+_PROJECT_DIR = _ASSETS_DIR.parent
+
+# 與 knowledge.load_knowledge_data 讀取的檔案一致（knowledge.json 為舊格式備援）
+SOURCE_FILES = ("1-company_info.json", "2-ai_config.json", "3-knowledge_base.json", "knowledge.json")
+CODE_FILES = ("knowledge.py", "retrieval.py", "kb_artifact.py")
+
+
+def artifact_path() -> Path:
+    return _PROJECT_DIR / KB_ARTIFACT_PATH
+
+
+def source_fingerprint() -> Tuple[Tuple[str, int, int], ...]:
+    """
+    來源 JSON 的 (檔名, 大小, mtime_ns)；只做 stat，不讀內容。
+    """
+    entries = []
+    for name in SOURCE_FILES:
+        path = _ASSETS_DIR / name
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        entries.append((name, st.st_size, st.st_mtime_ns))
+    return tuple(entries)
+
+
+def _hash_files(directory: Path, names) -> str:
+    digest = hashlib.sha256()
+    for name in names:
+        path = directory / name
+        if not path.exists():
+            continue
+        digest.update(name.encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def source_hash() -> str:
+    return _hash_files(_ASSETS_DIR, SOURCE_FILES)
+
+
+def code_hash() -> str:
+    return _hash_files(_ASSETS_DIR, CODE_FILES)
+
+
+def build_artifact() -> Dict[str, Any]:
+    """
+    從 JSON 編譯出所有衍生資料（與 knowledge.py 過去在 import 時做的事相同）。
+    """
+    from assets.knowledge import _format_load_errors, format_knowledge_json, load_knowledge_data
+    from assets.retrieval import KnowledgeIndex
+
+    kb_data, errors = load_knowledge_data()
+    if errors and not kb_data:
+        kb_text = _format_load_errors(errors)
+        core_text = kb_text
+    else:
+        kb_text = format_knowledge_json(kb_data)
+        core_text = format_knowledge_json(kb_data, include_chunks=False)
+
+    retrieval = kb_data.get("retrieval", {})
+    return {
+        "format": ARTIFACT_FORMAT,
+        "code_hash": code_hash(),
+        "source_fingerprint": source_fingerprint(),
+        "source_hash": source_hash(),
+        "kb_data": kb_data,
+        "errors": errors,
+        "kb_text": kb_text,
+        "core_text": core_text,
+        # 知識庫版本：內容雜湊，供提示詞/回覆快取判斷知識庫是否變更
+        "kb_version": hashlib.sha256(kb_text.encode("utf-8")).hexdigest()[:16],
+        "index": KnowledgeIndex(retrieval.get("chunks", []), retrieval.get("aliases", {})),
+        "tables": kb_data.get("entities", {}).get("tables", {}),
+    }
+
+
+def write_artifact(artifact: Dict[str, Any], path: Optional[Path] = None) -> Path:
+    """
+    原子寫入（先寫暫存檔再 rename），避免多個 worker 同時啟動時讀到寫一半的檔案。
+    """
+    path = Path(path or artifact_path())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def _is_fresh(artifact: Dict[str, Any]) -> bool:
+    if artifact.get("format") != ARTIFACT_FORMAT or artifact.get("code_hash") != code_hash():
+        return False
+    if artifact.get("source_fingerprint") == source_fingerprint():
+        return True
+    return artifact.get("source_hash") == source_hash()
+
+
+def load_artifact(path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """
+    載入預編譯檔；不存在、損毀或已過期時回傳 None。
+    """
+    path = Path(path or artifact_path())
+    try:
+        with open(path, "rb") as f:
+            artifact = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(artifact, dict) or not _is_fresh(artifact):
+        return None
+    return artifact
+
+
+def load_or_build(path: Optional[Path] = None, write: bool = True) -> Dict[str, Any]:
+    """
+    優先載入預編譯檔；過期或不存在時重新編譯，並（盡量）寫回檔案供下一個 worker 使用。
+    唯讀檔案系統等寫入失敗的情況直接忽略，本次仍使用剛編譯好的結果。
+    """
+    artifact = load_artifact(path)
+    if artifact is not None:
+        return artifact
+    artifact = build_artifact()
+    if write:
+        try:
+            write_artifact(artifact, path)
+        except OSError:
+            pass
+    return artifact
+
+
+def main(argv: List[str]) -> int:
+    command = argv[0] if argv else "build"
+    path = artifact_path()
+    if command == "build":
+        artifact = build_artifact()
+        write_artifact(artifact, path)
+        print(f"✅ 已建立知識庫預編譯檔：{path}（KB 版本 {artifact['kb_version']}，"
+              f"{len(artifact['index'].chunks)} 個知識塊）")
+        return 0
+    if command == "check":
+        artifact = load_artifact(path)
+        if artifact is None:
+            print(f"❌ 預編譯檔不存在或已過期：{path}")
+            return 1
+        print(f"✅ 預編譯檔為最新：{path}（KB 版本 {artifact['kb_version']}）")
+        return 0
+    print("用法：python -m assets.kb_artifact [build|check]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,210 @@
+# assets/kb_tables.py
+# 知識庫表格的結構化查詢：StageConfig / StageRevenueThresholds / EngineToDepartmentWeights /
+# GrossMarginUserSelection / IndustryCategoryInfo 轉成具型別的唯讀物件，
+# 讓階段判斷、部門權重等可以在本地確定性地計算，而不是交給模型閱讀表格文字後推理。
+
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class StageConfig(NamedTuple):
+    key: str
+    name: str
+    hr_ratio_min: float
+    hr_ratio_max: float
+    total_bonus_ratio: float
+    quarterly: float
+    year_end: float
+    description: str
+
+
+class EngineWeights(NamedTuple):
+    engine: str
+    departments: Tuple[str, ...]
+    weights: np.ndarray          # 與 departments 對齊的權重向量（float64，唯讀）
+    reasons: Tuple[str, ...]
+
+
+class IndustryCategory(NamedTuple):
+    key: str
+    name: str
+    icon: str
+
+
+class KBTables:
+    """
+    由 entities.tables（與 entities.enums）建立一次，之後所有查詢都是 dict 查詢或 bisect。
+    """
+
+    def __init__(self, tables: Dict[str, Any], enums: Optional[Dict[str, Any]] = None):
+        enums = enums or {}
+
+        self.stages: Dict[str, StageConfig] = {}
+        for key, data in tables.get("StageConfig", {}).items():
+            hr_range = data.get("hrRatioRange", {})
+            bonus = data.get("bonus", {})
+            self.stages[key] = StageConfig(
+                key=key,
+                name=data.get("name", key),
+                hr_ratio_min=float(hr_range.get("min", 0)),
+                hr_ratio_max=float(hr_range.get("max", 0)),
+                total_bonus_ratio=float(bonus.get("totalBonusRatio", 0)),
+                quarterly=float(bonus.get("quarterly", 0)),
+                year_end=float(bonus.get("yearEnd", 0)),
+                description=data.get("description", ""),
+            )
+
+        # 營收門檻（萬元）依由小到大排序，供 bisect
+        thresholds = tables.get("StageRevenueThresholds", {})
+        ordered = sorted(thresholds.get("base", {}).items(), key=lambda item: item[1])
+        self.stage_order: Tuple[str, ...] = tuple(key for key, _ in ordered)
+        self.base_thresholds: Tuple[float, ...] = tuple(float(v) for _, v in ordered)
+        self._base_thresholds_array = np.asarray(self.base_thresholds, dtype=np.float64)
+        self.margin_adjustment_base = float(thresholds.get("marginAdjustmentBase", 0.5))
+
+        # 部門順序：以 DepartmentType 枚舉為準，沒有時依第一個引擎的權重表順序
+        engine_table = tables.get("EngineToDepartmentWeights", {})
+        departments = list(enums.get("DepartmentType", []))
+        if not departments:
+            for data in engine_table.values():
+                departments = list(data.get("weights", {}))
+                break
+        self.departments: Tuple[str, ...] = tuple(departments)
+        self.department_index: Dict[str, int] = {d: i for i, d in enumerate(self.departments)}
+
+        self.engines: Dict[str, EngineWeights] = {}
+        for engine, data in engine_table.items():
+            weights = data.get("weights", {})
+            reasons = data.get("reasons", {})
+            # 權重表缺少的部門視為 1（與 R_ALLOCATE_STANDARD 的 weights[dept.type]||1 相同）
+            vector = np.array([float(weights.get(d, 1)) for d in self.departments], dtype=np.float64)
+            vector.setflags(write=False)
+            self.engines[engine] = EngineWeights(
+                engine=engine,
+                departments=self.departments,
+                weights=vector,
+                reasons=tuple(reasons.get(d, "") for d in self.departments),
+            )
+
+        self.gross_margin_selection: Dict[str, float] = {
+            key: float(value) for key, value in tables.get("GrossMarginUserSelection", {}).items()
+        }
+        self.industries: Dict[str, IndustryCategory] = {
+            key: IndustryCategory(key=key, name=info.get("name", key), icon=info.get("icon", ""))
+            for key, info in tables.get("IndustryCategoryInfo", {}).items()
+        }
+
+    # ==================== 階段 ====================
+
+    def stage(self, key: str) -> StageConfig:
+        try:
+            return self.stages[key]
+        except KeyError:
+            raise KeyError(f"未知的企業階段：{key}") from None
+
+    def margin_adjustment(self, gross_margin: float) -> float:
+        """
+        毛利率低於基準（0.5）時門檻等比放大：marginAdj = 0.5 / finalGrossMarginPct，否則為 1。
+        """
+        if gross_margin <= 0:
+            raise ValueError("毛利率需大於 0")
+        base = self.margin_adjustment_base
+        return base / gross_margin if gross_margin < base else 1.0
+
+    def stage_thresholds(self, gross_margin: float) -> List[Tuple[str, float]]:
+        """
+        回傳調整後的 [(階段, 營收門檻萬元)]，由小到大。
+        """
+        adj = self.margin_adjustment(gross_margin)
+        return [(key, t * adj) for key, t in zip(self.stage_order, self.base_thresholds)]
+
+    def stage_for(self, revenue_wan: float, gross_margin: float) -> StageConfig:
+        """
+        R_ENTERPRISE_STAGE：營收（萬元）達到調整後門檻的最高階段（只看營收 × 毛利，不看 HR Ratio）。
+        """
+        if not self.stage_order:
+            raise KeyError("知識庫缺少 StageRevenueThresholds")
+        adj = self.margin_adjustment(gross_margin)
+        scaled = [t * adj for t in self.base_thresholds]
+        idx = max(bisect_right(scaled, revenue_wan) - 1, 0)
+        return self.stage(self.stage_order[idx])
+
+    def stage_index_array(self, revenue_wan: Sequence[float], gross_margin: Sequence[float]) -> np.ndarray:
+        """
+        向量化版的 stage_for：回傳每筆在 stage_order 中的索引（批次/模擬用）。
+        """
+        revenue = np.asarray(revenue_wan, dtype=np.float64)
+        margin = np.asarray(gross_margin, dtype=np.float64)
+        if np.any(margin <= 0):
+            raise ValueError("毛利率需大於 0")
+        base = self.margin_adjustment_base
+        adj = np.where(margin < base, base / margin, 1.0)
+        scaled = self._base_thresholds_array * adj[..., None]
+        idx = (revenue[..., None] >= scaled).sum(axis=-1) - 1
+        return np.maximum(idx, 0)
+
+    # ==================== 增長引擎與部門權重 ====================
+
+    def engine_weights(self, engine: str) -> EngineWeights:
+        try:
+            return self.engines[engine]
+        except KeyError:
+            raise KeyError(f"未知的增長引擎：{engine}") from None
+
+    def department_weights(self, engine: str, departments: Optional[Sequence[str]] = None) -> np.ndarray:
+        """
+        回傳引擎對各部門的權重向量；departments 可指定順序/子集（可重複，例如一個部門類型有多個單位），
+        不在表中的部門類型權重為 1。
+        """
+        entry = self.engine_weights(engine)
+        if departments is None:
+            return entry.weights
+        index = self.department_index
+        return np.array(
+            [entry.weights[index[d]] if d in index else 1.0 for d in departments], dtype=np.float64
+        )
+
+    def weight_reason(self, engine: str, department: str) -> str:
+        entry = self.engine_weights(engine)
+        idx = self.department_index.get(department)
+        return entry.reasons[idx] if idx is not None else ""
+
+    # ==================== 毛利率與行業 ====================
+
+    def gross_margin_for_selection(self, selection: str) -> float:
+        try:
+            return self.gross_margin_selection[selection]
+        except KeyError:
+            raise KeyError(f"未知的毛利率選項：{selection}") from None
+
+    @staticmethod
+    def final_gross_margin(industry_margin: float, user_margin: Optional[float] = None) -> float:
+        """
+        R_GROSS_MARGIN_FINAL：行業中位數 70% + 老闆直覺 30%；沒有填寫時直接用行業中位數。
+        """
+        if user_margin is None:
+            return industry_margin
+        return industry_margin * 0.7 + user_margin * 0.3
+
+    def industry(self, key: str) -> IndustryCategory:
+        try:
+            return self.industries[key]
+        except KeyError:
+            raise KeyError(f"未知的行業類別：{key}") from None
+
+
+@lru_cache(maxsize=4)
+def _build_tables(kb_version: str) -> KBTables:
+    from assets.knowledge import KB_TABLES, _KB_DATA
+    return KBTables(KB_TABLES, _KB_DATA.get("entities", {}).get("enums", {}))
+
+
+def get_kb_tables() -> KBTables:
+    """
+    取得目前知識庫版本的表格查詢物件（每個 KB 版本只建立一次）。
+    """
+    from assets.knowledge import KB_VERSION
+    return _build_tables(KB_VERSION)
@@ -5,11 +5,21 @@ import json
 import os
 from pathlib import Path
 
-def load_knowledge_from_json():
+from config.settings import (
+    KB_ARTIFACT_ENABLED,
+    KNOWLEDGE_RETRIEVAL_ENABLED,
+    KNOWLEDGE_RETRIEVAL_MIN_SCORE,
+    KNOWLEDGE_RETRIEVAL_TOP_K,
+)
+
+def load_knowledge_data():
     """
-    從多個 JSON 文件讀取知識庫內容並格式化為文本
+    從多個 JSON 文件讀取知識庫原始資料（不做格式化）
     支持新格式：1-company_info.json, 2-ai_config.json, 3-knowledge_base.json
     也支持舊格式：knowledge.json（向後兼容）
+
+    Returns:
+        tuple: (kb_data, errors)
     """
     current_dir = Path(__file__).parent
     
@@ -63,17 +73,28 @@ def load_knowledge_from_json():
         else:
             errors.append("找不到 3-knowledge_base.json 或 knowledge.json")
     
+    return kb_data, errors
+
+def _format_load_errors(errors):
+    return f"⚠️ 知識庫加載失敗:\n" + "\n".join(f"- {e}" for e in errors)
+
+def load_knowledge_from_json():
+    """
+    從多個 JSON 文件讀取知識庫內容並格式化為文本
+    """
+    kb_data, errors = load_knowledge_data()
     if errors and not kb_data:
         # 如果所有文件都失敗，返回錯誤信息
-        return f"⚠️ 知識庫加載失敗:\n" + "\n".join(f"- {e}" for e in errors)
+        return _format_load_errors(errors)
     
     # 格式化為文本
     return format_knowledge_json(kb_data)
 
-def format_knowledge_json(kb_data):
+def format_knowledge_json(kb_data, include_chunks=True):
     """
     將 JSON 知識庫數據格式化為 Markdown 文本
     支持新格式（包含 company_info 和 ai_config）和舊格式
+    include_chunks=False 時不輸出「知識塊」段落（改由檢索挑選後再附上）
     """
     lines = []
     
@@ -310,37 +331,106 @@ def format_knowledge_json(kb_data):
         lines.append("")
     
     # 6. 檢索塊（知識塊）
-    if 'retrieval' in kb_data and 'chunks' in kb_data['retrieval']:
-        lines.append("## 知識塊 (Knowledge Chunks)")
-        lines.append("")
-        lines.append("以下知識塊用於回答常見問題：")
-        lines.append("")
-        
-        for chunk in kb_data['retrieval']['chunks']:
-            chunk_id = chunk.get('chunk_id', '')
-            title = chunk.get('title', '')
-            tags = chunk.get('tags', [])
-            q_triggers = chunk.get('q_triggers', [])
-            content = chunk.get('content', '')
-            
-            lines.append(f"### {title} ({chunk_id})")
-            lines.append("")
-            if tags:
-                lines.append(f"**標籤**: {', '.join(tags)}")
-                lines.append("")
-            if q_triggers:
-                lines.append("**相關問題**:")
-                for q in q_triggers:
-                    lines.append(f"- {q}")
-                lines.append("")
-            if content:
-                lines.append(f"**內容**: {content}")
-                lines.append("")
+    if include_chunks and 'retrieval' in kb_data and 'chunks' in kb_data['retrieval']:
+        lines.append(format_knowledge_chunks(kb_data['retrieval']['chunks']))
+    
+    return "\n".join(lines)
+
+def format_knowledge_chunks(chunks):
+    """
+    將知識塊清單格式化為 Markdown 段落（全部知識塊或檢索結果共用同一種格式）
+    """
+    lines = []
+    lines.append("## 知識塊 (Knowledge Chunks)")
+    lines.append("")
+    lines.append("以下知識塊用於回答常見問題：")
+    lines.append("")
+    
+    for chunk in chunks:
+        chunk_id = chunk.get('chunk_id', '')
+        title = chunk.get('title', '')
+        tags = chunk.get('tags', [])
+        q_triggers = chunk.get('q_triggers', [])
+        content = chunk.get('content', '')
         
-        lines.append("---")
+        lines.append(f"### {title} ({chunk_id})")
         lines.append("")
+        if tags:
+            lines.append(f"**標籤**: {', '.join(tags)}")
+            lines.append("")
+        if q_triggers:
+            lines.append("**相關問題**:")
+            for q in q_triggers:
+                lines.append(f"- {q}")
+            lines.append("")
+        if content:
+            lines.append(f"**內容**: {content}")
+            lines.append("")
     
+    lines.append("---")
+    lines.append("")
     return "\n".join(lines)
 
-# 從 JSON 加載知識庫
-BONUS_KB_TEXT = load_knowledge_from_json()
+def get_static_knowledge_text():
+    """
+    每個提示詞都固定會放的知識庫文字（檢索開啟時不含知識塊；關閉時即完整的 BONUS_KB_TEXT）。
+    """
+    artifact = _get_artifact()
+    return artifact["core_text"] if KNOWLEDGE_RETRIEVAL_ENABLED else artifact["kb_text"]
+
+def retrieve_knowledge_chunks_text(question, top_k=None):
+    """
+    依問題檢索知識塊，回傳要接在 get_static_knowledge_text() 後面的文字（沒有命中時為空字串）。
+    """
+    if not KNOWLEDGE_RETRIEVAL_ENABLED:
+        return ""
+    k = KNOWLEDGE_RETRIEVAL_TOP_K if top_k is None else top_k
+    chunks = _get_artifact()["index"].search(question or "", top_k=k, min_score=KNOWLEDGE_RETRIEVAL_MIN_SCORE)
+    if not chunks:
+        return ""
+    return "\n" + format_knowledge_chunks(chunks)
+
+def build_knowledge_context(question, top_k=None):
+    """
+    依問題組出要放進 {knowledge_base} 的文字：
+    知識庫主體（表格/規則/腳本等，不含知識塊）+ 檢索出的前 top_k 個相關知識塊。
+    檢索關閉時回傳完整的 BONUS_KB_TEXT（與舊行為相同）。
+    """
+    return get_static_knowledge_text() + retrieve_knowledge_chunks_text(question, top_k)
+
+# 知識庫內容延遲載入：第一次用到時才讀取預編譯檔（過期/不存在時才解析 JSON 並重建），
+# import 本模組本身不做任何檔案讀取或格式化
+_ARTIFACT = None
+
+def _get_artifact():
+    global _ARTIFACT
+    if _ARTIFACT is None:
+        from assets.kb_artifact import build_artifact, load_or_build
+        _ARTIFACT = load_or_build() if KB_ARTIFACT_ENABLED else build_artifact()
+    return _ARTIFACT
+
+def reload_knowledge():
+    """
+    丟掉已載入的知識庫，下次存取時重新檢查來源並載入（知識庫 JSON 在執行中被修改時使用）。
+    """
+    global _ARTIFACT
+    _ARTIFACT = None
+
+# 模組屬性 → 預編譯檔欄位；維持 `from assets.knowledge import BONUS_KB_TEXT` 等既有用法
+_LAZY_ATTRS = {
+    "BONUS_KB_TEXT": "kb_text",
+    "BONUS_KB_CORE_TEXT": "core_text",
+    # 知識庫版本：內容雜湊，供提示詞快取等判斷知識庫是否變更
+    "KB_VERSION": "kb_version",
+    # 知識塊檢索索引
+    "KB_INDEX": "index",
+    "KB_TABLES": "tables",
+    "_KB_DATA": "kb_data",
+    "_KB_ERRORS": "errors",
+}
+
+def __getattr__(name):
+    key = _LAZY_ATTRS.get(name)
+    if key is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _get_artifact()[key]
@@ -0,0 +1,127 @@
+# assets/retrieval.py
+# 知識塊檢索：用字元 n-gram + BM25 從 retrieval.chunks 挑出與問題最相關的幾塊，
+# 取代每次都把全部知識塊塞進 system prompt 的做法。
+
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+_CJK_RUN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+_LATIN_WORD = re.compile(r"[a-z0-9]+")
+
+# 各欄位的加權（以重複詞頻實作）：q_triggers / 標題最接近使用者的問法，權重較高
+FIELD_WEIGHTS = {
+    "title": 3,
+    "q_triggers": 3,
+    "tags": 2,
+    "aliases": 2,
+    "content": 1,
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文取連續字元的 bigram（單字時取 unigram），英數取小寫單字；
+    底線視為分隔（hr_ratio → hr, ratio），讓 tag 與中英混寫的問題能對上。
+    """
+    t = (text or "").lower().replace("_", " ")
+    tokens: List[str] = []
+    for run in _CJK_RUN.findall(t):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(_LATIN_WORD.findall(t))
+    return tokens
+
+
+class KnowledgeIndex:
+    """
+    建立一次、重複查詢的 BM25 索引。aliases（例如「獎金池」↔ bonus_pool/年終獎金）
+    同時用於擴充知識塊的可檢索文字與擴充查詢。
+    """
+
+    def __init__(self, chunks: List[Dict[str, Any]], aliases: Dict[str, List[str]] | None = None,
+                 k1: float = 1.5, b: float = 0.75):
+        self.chunks = list(chunks)
+        self.k1 = k1
+        self.b = b
+
+        # 同義詞群組：canonical 名稱與所有別名互相等價
+        self.alias_groups: List[List[str]] = [
+            [canonical, *names] for canonical, names in (aliases or {}).items()
+        ]
+
+        self.doc_terms: List[Counter] = []
+        for chunk in self.chunks:
+            terms: Counter = Counter()
+            fields = {
+                "title": [chunk.get("title", "")],
+                "q_triggers": chunk.get("q_triggers", []),
+                "tags": chunk.get("tags", []),
+                "content": [chunk.get("content", "")],
+            }
+            fields["aliases"] = self._alias_expansion(" ".join(
+                fields["title"] + fields["q_triggers"] + fields["tags"]
+            ))
+            for field, texts in fields.items():
+                weight = FIELD_WEIGHTS[field]
+                for text in texts:
+                    for token in tokenize(text):
+                        terms[token] += weight
+            self.doc_terms.append(terms)
+
+        self.doc_len = [sum(terms.values()) for terms in self.doc_terms]
+        self.avg_len = (sum(self.doc_len) / len(self.doc_len)) if self.doc_len else 0.0
+
+        df: Counter = Counter()
+        for terms in self.doc_terms:
+            df.update(terms.keys())
+        n = len(self.doc_terms)
+        self.idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+
+    def _alias_expansion(self, text: str) -> List[str]:
+        """
+        回傳 text 命中的同義詞群組中「其他」名稱，供索引/查詢擴充。
+        """
+        lowered = (text or "").lower()
+        expanded: List[str] = []
+        for group in self.alias_groups:
+            if any(name.lower() in lowered for name in group):
+                expanded.extend(group)
+        return expanded
+
+    def score(self, question: str) -> List[Tuple[float, int]]:
+        """
+        回傳 [(分數, chunk 索引)]，依分數由高到低排序（同分維持知識庫原順序）。
+        """
+        query = Counter(tokenize(question))
+        for name in self._alias_expansion(question):
+            for token in tokenize(name):
+                query.setdefault(token, 1)
+
+        results: List[Tuple[float, int]] = []
+        for idx, terms in enumerate(self.doc_terms):
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[idx] / (self.avg_len or 1.0))
+            s = 0.0
+            for token, qf in query.items():
+                tf = terms.get(token)
+                if not tf:
+                    continue
+                s += self.idf[token] * qf * tf * (self.k1 + 1) / (tf + norm)
+            results.append((s, idx))
+        results.sort(key=lambda item: (-item[0], item[1]))
+        return results
+
+    def search(self, question: str, top_k: int = 3, min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        回傳最相關的 top_k 個知識塊（分數需大於 min_score；完全沒命中時回傳空清單）。
+        """
+        if top_k <= 0:
+            return []
+        return [
+            self.chunks[idx]
+            for s, idx in self.score(question)[:top_k]
+            if s > min_score
+        ]
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# batch.py
+"""
+批次情境計算（不需開啟 Streamlit）：把 CSV / Parquet 中的公司輸入逐批送進 CalculatorNode（含風險規則），
+邊算邊寫出結果，記憶體只與批次大小與同時處理的批數有關，並以多程序分散到所有 CPU 核心。
+
+用法（在專案目錄）：
+    python batch.py portfolio.csv -o scored.csv
+    python batch.py portfolio.parquet -o scored.parquet --chunk-size 20000 --workers 8
+或在 repo 根目錄：
+    python -m golden_bonus_project.batch portfolio.csv -o scored.csv
+
+輸入欄位：net_profit（萬元）、employees、avg_salary（元）、retention_rate（0~1）或 retention（0~100）；
+其他欄位（例如公司代號）原樣帶到輸出。輸出額外加上 total_pool / per_head / months /
+risk_low_months / risk_low_retention / valid（不合法的列 valid=False、指標為 0，不會中斷整批）。
+Parquet 需要另外安裝 pyarrow。
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# 與 main.py 相同：確保可以導入同目錄下的模組
+current_dir = Path(__file__).parent.absolute()
+if str(current_dir) not in sys.path:
+    sys.path.insert(0, str(current_dir))
+
+import numpy as np
+
+from nodes.calculator import CalculatorNode
+
+REQUIRED_COLUMNS = ("net_profit", "employees", "avg_salary")
+OUTPUT_COLUMNS = ("total_pool", "per_head", "months", "risk_low_months", "risk_low_retention", "valid")
+
+Chunk = Dict[str, List[Any]]
+
+
+def _detect_format(path: str, explicit: Optional[str]) -> str:
+    if explicit:
+        return explicit
+    return "parquet" if Path(path).suffix.lower() in (".parquet", ".pq") else "csv"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("❌ 讀寫 Parquet 需要 pyarrow：pip install pyarrow") from None
+    return pq
+
+
+def _check_columns(columns: List[str]) -> None:
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if "retention_rate" not in columns and "retention" not in columns:
+        missing.append("retention_rate 或 retention")
+    if missing:
+        raise SystemExit(f"❌ 輸入缺少欄位：{', '.join(missing)}")
+
+
+def read_csv_chunks(path: str, chunk_size: int) -> Iterator[Chunk]:
+    """
+    逐批讀取 CSV（欄位式 dict of lists，值維持字串，轉數值交給 worker 平行處理）。
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [h.strip() for h in header]
+        _check_columns(header)
+        columns: List[List[str]] = [[] for _ in header]
+        for row in reader:
+            if not row:
+                continue
+            for i, column in enumerate(columns):
+                column.append(row[i] if i < len(row) else "")
+            if len(columns[0]) >= chunk_size:
+                yield dict(zip(header, columns))
+                columns = [[] for _ in header]
+        if columns and columns[0]:
+            yield dict(zip(header, columns))
+
+
+def read_parquet_chunks(path: str, chunk_size: int) -> Iterator[Chunk]:
+    pq = _require_pyarrow()
+    parquet_file = pq.ParquetFile(path)
+    _check_columns(parquet_file.schema_arrow.names)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        yield batch.to_pydict()
+
+
+def _to_float_array(values: List[Any]) -> np.ndarray:
+    """
+    轉成 float64；空白或非數值視為 NaN（該列會被標記為不合法，而不是讓整批失敗）。
+    """
+    try:
+        return np.asarray([v if v not in ("", None) else "nan" for v in values], dtype=np.float64)
+    except ValueError:
+        out = np.empty(len(values), dtype=np.float64)
+        for i, v in enumerate(values):
+            try:
+                out[i] = float(v)
+            except (TypeError, ValueError):
+                out[i] = np.nan
+        return out
+
+
+def score_chunk(chunk: Chunk) -> Chunk:
+    """
+    worker：一批輸入 → CalculatorNode.execute_batch（非 strict）→ 輸入欄位 + 指標/風險欄位。
+    """
+    batch_input = {
+        name: _to_float_array(chunk[name])
+        for name in (*REQUIRED_COLUMNS, "retention_rate", "retention")
+        if name in chunk
+    }
+    # 缺值/非數值（例如淨利欄空白）：計算器只檢查範圍，這裡先以 0 代入、算完再把這些列標記為不合法
+    missing = np.zeros(len(next(iter(batch_input.values()))), dtype=bool)
+    for values in batch_input.values():
+        missing |= ~np.isfinite(values)
+    if missing.any():
+        batch_input = {name: np.where(missing, 0.0, values) for name, values in batch_input.items()}
+
+    context = CalculatorNode("calculator").execute_batch({"batch_input": batch_input, "batch_strict": False})
+    metrics = context["batch_metrics"]
+    if missing.any():
+        for name in OUTPUT_COLUMNS:
+            metrics[name] = np.where(missing, np.zeros((), dtype=metrics[name].dtype), metrics[name])
+
+    out = dict(chunk)
+    for name in OUTPUT_COLUMNS:
+        out[name] = metrics[name].tolist()
+    return out
+
+
+class _CsvWriter:
+    def __init__(self, path: str):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._header: Optional[List[str]] = None
+
+    def write(self, chunk: Chunk) -> None:
+        if self._header is None:
+            self._header = list(chunk)
+            self._writer.writerow(self._header)
+        self._writer.writerows(zip(*(chunk[name] for name in self._header)))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path: str):
+        self._pq = _require_pyarrow()
+        self._path = path
+        self._writer = None
+
+    def write(self, chunk: Chunk) -> None:
+        import pyarrow as pa
+        table = pa.Table.from_pydict(chunk)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self._path, table.schema)
+        else:
+            table = table.cast(self._writer.schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+def run_batch(
+    input_path: str,
+    output_path: str,
+    chunk_size: int = 10000,
+    workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    input_format: Optional[str] = None,
+    output_format: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    逐批讀取 → 多程序計算 → 依輸入順序寫出。同時處理中的批數不超過 max_in_flight，
+    記憶體上限約為 (max_in_flight + 1) × chunk_size 列。
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    in_fmt = _detect_format(input_path, input_format)
+    out_fmt = _detect_format(output_path, output_format)
+
+    chunks = read_parquet_chunks(input_path, chunk_size) if in_fmt == "parquet" else read_csv_chunks(input_path, chunk_size)
+    writer = _ParquetWriter(output_path) if out_fmt == "parquet" else _CsvWriter(output_path)
+
+    stats = {"rows": 0, "invalid_rows": 0, "risk_low_months": 0, "risk_low_retention": 0, "chunks": 0}
+
+    def _collect(result: Chunk) -> None:
+        writer.write(result)
+        stats["chunks"] += 1
+        stats["rows"] += len(result["valid"])
+        stats["invalid_rows"] += result["valid"].count(False)
+        stats["risk_low_months"] += sum(result["risk_low_months"])
+        stats["risk_low_retention"] += sum(result["risk_low_retention"])
+
+    started = time.perf_counter()
+    try:
+        if workers <= 1:
+            for chunk in chunks:
+                _collect(score_chunk(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending: deque = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(score_chunk, chunk))
+                    # 背壓：在途批數達上限時，先等最舊的一批完成並寫出（同時保持輸出順序）
+                    while len(pending) >= max_in_flight:
+                        _collect(pending.popleft().result())
+                while pending:
+                    _collect(pending.popleft().result())
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    stats["elapsed_sec"] = round(elapsed, 3)
+    stats["rows_per_sec"] = int(stats["rows"] / elapsed) if elapsed > 0 else None
+    return stats
+
+
+def _parse_args(argv: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="年終獎金批次情境計算（CSV / Parquet）")
+    parser.add_argument("input", help="輸入檔（.csv / .parquet）")
+    parser.add_argument("-o", "--output", required=True, help="輸出檔（.csv / .parquet）")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="每批列數（預設 10000）")
+    parser.add_argument("--workers", type=int, default=None, help="程序數（預設為 CPU 核心數；1 表示不開程序池）")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="同時處理中的批數上限（預設 workers × 2）")
+    parser.add_argument("--input-format", choices=("csv", "parquet"), default=None)
+    parser.add_argument("--output-format", choices=("csv", "parquet"), default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _parse_args(argv)
+    if args.chunk_size <= 0:
+        raise SystemExit("❌ --chunk-size 必須大於 0")
+    stats = run_batch(
+        args.input,
+        args.output,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        input_format=args.input_format,
+        output_format=args.output_format,
+    )
+    print(
+        f"✅ 完成：{stats['rows']} 列（不合法 {stats['invalid_rows']} 列），"
+        f"低月數風險 {stats['risk_low_months']} 列、低保留風險 {stats['risk_low_retention']} 列，"
+        f"耗時 {stats['elapsed_sec']} 秒（{stats['rows_per_sec']} 列/秒）→ {args.output}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,15 @@
+# benchmarks/__init__.py
+"""
+顧問熱路徑的效能基準（模型呼叫以固定回覆的替身取代，結果可重現）。
+
+用法（在專案目錄）：
+    python -m benchmarks                      # 全部執行
+    python -m benchmarks -k postprocess       # 只跑名稱含 postprocess 的項目
+    python -m benchmarks --save v7            # 結果存成 benchmarks/baselines/v7.json
+    python -m benchmarks --compare v7         # 與基準比較（ops/sec 與 p50/p99 的倍率）
+
+每個項目回報 ops/sec、p50/p99（微秒）與每次操作的記憶體配置（tracemalloc：峰值與殘留位元組，獨立一輪量測，不影響計時）。
+
+並行會話負載測試（模擬多位使用者同時對話，找出飽和點）見 benchmarks/load.py：
+    python -m benchmarks.load --users 1,2,4,8,16,32
+"""
@@ -0,0 +1,38 @@
+# benchmarks/__main__.py
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+# 與 main.py 相同：確保可以導入專案目錄下的模組
+project_dir = Path(__file__).resolve().parent.parent
+if str(project_dir) not in sys.path:
+    sys.path.insert(0, str(project_dir))
+
+from benchmarks import cases  # noqa: F401  註冊基準項目
+from benchmarks.harness import format_results, load_baseline, run_all, save_baseline
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="顧問熱路徑效能基準")
+    parser.add_argument("-k", "--filter", default=None, help="只執行名稱含此字串的項目")
+    parser.add_argument("--min-time", type=float, default=0.5, help="每個項目至少計時秒數")
+    parser.add_argument("--min-ops", type=int, default=20, help="每個項目至少執行次數")
+    parser.add_argument("--save", default=None, help="存成基準（名稱或 .json 路徑；名稱存到 benchmarks/baselines/）")
+    parser.add_argument("--compare", default=None, help="與基準比較（名稱或 .json 路徑）")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    results = run_all(args.filter, min_time=args.min_time, min_ops=args.min_ops)
+    if not results:
+        print(f"❌ 沒有符合的基準項目：{args.filter}", file=sys.stderr)
+        return 1
+    print(format_results(results, baseline))
+    if args.save:
+        path = save_baseline(results, args.save)
+        print(f"\n✅ 基準已存到 {path}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
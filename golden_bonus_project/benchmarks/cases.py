@@ -0,0 +1,162 @@
+# benchmarks/cases.py
+"""
+基準項目：計算器、知識庫載入/格式化、提示詞組裝、回覆後處理與整條 Pipeline（模型以替身取代）。
+"""
+from core.pipeline import Pipeline
+from nodes.advisor import (
+    ADVISOR_ROUTER,
+    AdvisorNode,
+    _ensure_followup_format,
+    _looks_like_report_payload,
+    _needs_human_escalation,
+    _postprocess_response,
+)
+from nodes.calculator import CalculatorNode
+
+from benchmarks.harness import benchmark
+from benchmarks.reference import postprocess_chain, remove_questions, strip_internal_refs
+from benchmarks.stubs import STUB_RESPONSE
+
+USER_INPUT = {
+    "net_profit": 1200,
+    "employees": 45,
+    "avg_salary": 52000,
+    "retention_rate": 0.4,
+    "style": "留才優先 (Retention First)",
+}
+QUESTION = "今年獎金池應該怎麼分配給業務和研發部門？需要注意勞健保和稅務嗎"
+
+
+def _chat_context(stream: bool = False) -> dict:
+    return {
+        "user_input": dict(USER_INPUT),
+        "current_intent": "CHAT",
+        "latest_user_question": QUESTION,
+        "company_context_text": "",
+        "history": [
+            {"role": "user", "content": "我們公司今年營收成長 20%，毛利率約 35%。"},
+            {"role": "assistant", "content": "了解，以下先依知識庫框架說明階段判斷與獎金池結構。"},
+        ],
+        "stream": stream,
+    }
+
+
+# ==================== 計算器 ====================
+
+@benchmark("calculator.execute", setup=lambda: CalculatorNode("calculator"))
+def _calculator(node):
+    node.execute({"user_input": USER_INPUT})
+
+
+# ==================== 知識庫 ====================
+
+@benchmark("knowledge.load_knowledge_from_json")
+def _load_knowledge(_):
+    from assets.knowledge import load_knowledge_from_json
+    load_knowledge_from_json()
+
+
+def _kb_data():
+    from assets.knowledge import load_knowledge_data
+    return load_knowledge_data()[0]
+
+
+@benchmark("knowledge.format_knowledge_json", setup=_kb_data)
+def _format_knowledge(kb_data):
+    from assets.knowledge import format_knowledge_json
+    format_knowledge_json(kb_data)
+
+
+# ==================== 提示詞組裝 ====================
+
+def _advisor_with_metrics():
+    context = CalculatorNode("calculator").execute(_chat_context())
+    return AdvisorNode("advisor"), context
+
+
+@benchmark("advisor.build_request", setup=_advisor_with_metrics)
+def _build_request(state):
+    from benchmarks.stubs import stubbed_model
+    node, context = state
+    with stubbed_model():
+        node.build_request(dict(context))
+
+
+# ==================== 觸發詞路由 ====================
+# 問題很短；整段回覆（快取命中時的拒答判斷、問句偵測）與貼上的報告才是長文字
+
+@benchmark("router.match_question")
+def _route_question(_):
+    ADVISOR_ROUTER.match(QUESTION.replace(" ", ""))
+
+
+@benchmark("router.match_reply")
+def _route_reply(_):
+    ADVISOR_ROUTER.match(STUB_RESPONSE)
+
+
+@benchmark("router.contains_refusal")
+def _route_refusal(_):
+    ADVISOR_ROUTER.contains("refusal", STUB_RESPONSE)
+
+
+@benchmark("router.report_payload")
+def _route_report(_):
+    _looks_like_report_payload(STUB_RESPONSE)
+
+
+# ==================== 回覆後處理 ====================
+
+@benchmark("postprocess.strip_internal_refs")
+def _strip(_):
+    strip_internal_refs(STUB_RESPONSE)
+
+
+@benchmark("postprocess.remove_questions")
+def _remove(_):
+    remove_questions(STUB_RESPONSE)
+
+
+@benchmark("postprocess.ensure_followup_format")
+def _followup(_):
+    _ensure_followup_format(STUB_RESPONSE)
+
+
+@benchmark("postprocess.needs_human_escalation")
+def _escalation(_):
+    _needs_human_escalation(QUESTION, STUB_RESPONSE)
+
+
+# 整段後處理：逐步呼叫（benchmarks/reference.py 的參考實作）對照單次掃描版本，followup 模式走完所有規則
+@benchmark("postprocess.chain")
+def _chain(_):
+    response = postprocess_chain(STUB_RESPONSE, followup=True)
+    _needs_human_escalation(QUESTION, response)
+
+
+@benchmark("postprocess.fused")
+def _fused(_):
+    response, refusal = _postprocess_response(STUB_RESPONSE, followup=True)
+    _needs_human_escalation(QUESTION, response, refusal=refusal)
+
+
+# ==================== 整條 Pipeline ====================
+
+def _pipeline():
+    return Pipeline().add_node(CalculatorNode("calculator")).add_node(AdvisorNode("advisor"))
+
+
+@benchmark("pipeline.run", setup=_pipeline)
+def _pipeline_run(pipeline):
+    from benchmarks.stubs import stubbed_model
+    with stubbed_model():
+        pipeline.run(_chat_context())
+
+
+@benchmark("pipeline.run_stream", setup=_pipeline)
+def _pipeline_run_stream(pipeline):
+    from benchmarks.stubs import stubbed_model
+    with stubbed_model():
+        context = pipeline.run(_chat_context(stream=True))
+        for _ in context.pop("ai_response_stream"):
+            pass
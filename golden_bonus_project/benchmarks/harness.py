@@ -0,0 +1,170 @@
+# benchmarks/harness.py
+"""
+計時/配置量測與基準檔存取。基準項目以 @benchmark 註冊：setup() 回傳狀態，fn(state) 執行一次操作。
+"""
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+
+# 名稱 → {"fn", "setup", "group"}（依註冊順序執行）
+BENCHMARKS: Dict[str, Dict[str, Any]] = {}
+
+
+def benchmark(name: str, setup: Optional[Callable[[], Any]] = None):
+    """
+    註冊基準項目；名稱以「群組.項目」命名（例如 postprocess.strip_internal_refs）。
+    """
+    def decorator(fn: Callable[[Any], Any]):
+        if name in BENCHMARKS:
+            raise ValueError(f"基準項目名稱重複：{name}")
+        BENCHMARKS[name] = {"fn": fn, "setup": setup}
+        return fn
+    return decorator
+
+
+def _percentile(sorted_values: List[int], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return float(sorted_values[index])
+
+
+def run_benchmark(
+    name: str,
+    min_time: float = 0.5,
+    min_ops: int = 20,
+    max_ops: int = 200_000,
+    warmup: int = 3,
+    alloc_ops: int = 20,
+) -> Dict[str, Any]:
+    """
+    執行單一項目：暖身 → 逐次計時（至少 min_time 秒且至少 min_ops 次）→ 另一輪 tracemalloc 量測配置。
+    """
+    case = BENCHMARKS[name]
+    fn = case["fn"]
+    state = case["setup"]() if case["setup"] else None
+
+    for _ in range(warmup):
+        fn(state)
+
+    timings: List[int] = []
+    perf_ns = time.perf_counter_ns
+    deadline = time.perf_counter() + min_time
+    while len(timings) < max_ops and (len(timings) < min_ops or time.perf_counter() < deadline):
+        started = perf_ns()
+        fn(state)
+        timings.append(perf_ns() - started)
+
+    total_ns = sum(timings)
+    timings.sort()
+
+    # 配置量測：每次操作的峰值增量與殘留（不含 tracemalloc 本身的負擔）
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    peaks: List[int] = []
+    retained = 0
+    try:
+        for _ in range(alloc_ops):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn(state)
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained += current - before
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    return {
+        "ops": len(timings),
+        "ops_per_sec": round(len(timings) / (total_ns / 1e9), 1) if total_ns else None,
+        "mean_us": round(total_ns / len(timings) / 1000, 2),
+        "p50_us": round(_percentile(timings, 50) / 1000, 2),
+        "p99_us": round(_percentile(timings, 99) / 1000, 2),
+        "alloc_peak_bytes": int(sorted(peaks)[len(peaks) // 2]) if peaks else 0,
+        "alloc_retained_bytes": int(retained / alloc_ops) if alloc_ops else 0,
+    }
+
+
+def run_all(pattern: Optional[str] = None, **options) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for name in BENCHMARKS:
+        if pattern and pattern not in name:
+            continue
+        results[name] = run_benchmark(name, **options)
+    return results
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent, capture_output=True, text=True, timeout=5,
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _baseline_path(name_or_path: str) -> Path:
+    path = Path(name_or_path)
+    if path.suffix == ".json" or path.parent != Path("."):
+        return path
+    return BASELINE_DIR / f"{name_or_path}.json"
+
+
+def save_baseline(results: Dict[str, Dict[str, Any]], name_or_path: str) -> Path:
+    """
+    存成 JSON 基準檔（含 git 版本、Python 版本與平台，跨機器比較時可辨識）。
+    """
+    path = _baseline_path(name_or_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    return path
+
+
+def load_baseline(name_or_path: str) -> Dict[str, Any]:
+    return json.loads(_baseline_path(name_or_path).read_text(encoding="utf-8"))
+
+
+def format_results(results: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Any]] = None) -> str:
+    """
+    表格輸出；有基準時附上倍率（ops/sec 為 新/舊，越大越好；p50/p99 為 舊/新，越大越好）。
+    """
+    base = (baseline or {}).get("results", {})
+    header = f"{'項目':<40} {'ops/sec':>12} {'p50 µs':>10} {'p99 µs':>10} {'峰值配置 B':>12} {'殘留 B':>9}"
+    if base:
+        header += f" {'ops×':>7} {'p50×':>7} {'p99×':>7}"
+    lines = [header, "-" * len(header)]
+    for name, row in results.items():
+        line = (
+            f"{name:<40} {row['ops_per_sec']:>12,.1f} {row['p50_us']:>10.2f} {row['p99_us']:>10.2f}"
+            f" {row['alloc_peak_bytes']:>12,} {row['alloc_retained_bytes']:>9,}"
+        )
+        old = base.get(name)
+        if old:
+            line += (
+                f" {row['ops_per_sec'] / old['ops_per_sec']:>7.2f}"
+                f" {old['p50_us'] / row['p50_us'] if row['p50_us'] else 0:>7.2f}"
+                f" {old['p99_us'] / row['p99_us'] if row['p99_us'] else 0:>7.2f}"
+            )
+        elif base:
+            line += f" {'(新)':>7}"
+        lines.append(line)
+    return "\n".join(lines)
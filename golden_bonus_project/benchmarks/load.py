@@ -0,0 +1,385 @@
+# benchmarks/load.py
+"""
+並行會話負載測試：模擬 N 位使用者同時對話，估計一個 worker 能撐住多少個同時進行的顧問會話。
+
+每位模擬使用者依腳本逐輪提問，流程與 main.py 相同：
+開啟會話時載入最新一頁歷史 → 貼上企業補充資訊時先存回執、再走自動解說（CHAT_FOLLOWUP）→
+一般提問先存使用者訊息 → 共用的 Pipeline（串流）→ 存助理回覆與用量 → 歷史超過預算時在背景滾動摘要。
+模型為 utils/fake_gemini 的替身（可調 TTFT / 輸出速度 / 錯誤率），儲存為 benchmarks.stubs.FakeSupabase
+（照樣經過客戶端登錄表與背景寫入佇列）。回覆快取預設關閉，每輪都走完整路徑。
+
+逐級增加同時會話數，回報吞吐量（輪/秒）、每輪延遲與首段延遲百分位、錯誤數、RSS 記憶體增長，
+以及飽和點（再加倍使用者時吞吐量增幅低於門檻的那一級）。
+
+用法（在專案目錄）：
+    python -m benchmarks.load
+    python -m benchmarks.load --users 4,16,64 --turns 6 --ttft 0.5 --tps 40
+    python -m benchmarks.load --db-latency 0.05 --think 1.0 --error-429 0.05 --json load.json
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 與 main.py 相同：確保可以導入專案目錄下的模組
+project_dir = Path(__file__).resolve().parent.parent
+if str(project_dir) not in sys.path:
+    sys.path.insert(0, str(project_dir))
+
+from config.settings import (
+    FAKE_GEMINI_ERROR_429_RATE,
+    FAKE_GEMINI_ERROR_500_RATE,
+    FAKE_GEMINI_SEED,
+    FAKE_GEMINI_TOKENS_PER_SEC,
+    FAKE_GEMINI_TTFT_SEC,
+    HISTORY_PAGE_SIZE,
+)
+from benchmarks.harness import _percentile
+from benchmarks.stubs import _SECTION, FakeSupabase, stubbed_storage
+
+# 貼上的企業補充資訊（會觸發 looks_like_company_report_payload 與自動解說）
+COMPANY_REPORT = """report:
+company: 範例科技股份有限公司
+financials:
+  revenue: 120000000
+  gross_profit: 48000000
+  net_income: 15000000
+  hr_cost: 26000000
+bonus:
+  pool: 6000000
+  months: 1.8
+departments:
+  - name: 業務部
+    headcount: 18
+  - name: 研發部
+    headcount: 22
+  - name: 管理部
+    headcount: 8
+growthEngine: 產品研發驅動
+warnings:
+  - 人事成本占毛利比例接近警戒值
+recommendations:
+  - 保留部分獎金池作為季度激勵
+"""
+
+# 對話腳本：使用者依序送出；第 i 位使用者用第 i % len(SCRIPTS) 個腳本，輪數不足時循環
+SCRIPTS: List[List[str]] = [
+    [
+        COMPANY_REPORT,
+        "依這份資料，今年的獎金池抓多少比較安全？",
+        "人事成本比例偏高會有什麼風險？",
+        "研發部和業務部的獎金權重該怎麼分？",
+        "如果明年營收下滑兩成，現在的發放月數還撐得住嗎？",
+        "請幫我整理成可以跟老闆報告的重點。",
+    ],
+    [
+        "年終獎金一般發幾個月比較合理？",
+        "我們今年淨利下滑，還需要發年終嗎？",
+        "固定年終和績效獎金的比例要怎麼抓？",
+        COMPANY_REPORT,
+        "那以這家公司的情況，保留盈餘應該留多少？",
+        "發放前要怎麼跟主管溝通績效等級的分布？",
+    ],
+    [
+        "HR Ratio 是什麼？為什麼只用來看風險？",
+        "成長期的公司在獎金分配上有什麼不同？",
+        "員工離職率偏高時，年終獎金能怎麼設計留才？",
+        "季度獎金和年終獎金可以並行嗎？",
+        "獎金池應該用淨利還是毛利來算？",
+        "我們有一個部門虧損，還要發獎金嗎？",
+    ],
+]
+
+
+def _rss_mb() -> float:
+    """
+    目前的常駐記憶體（MB）；Linux 讀 /proc，其他平台退回 ru_maxrss（峰值）。
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def build_pipeline():
+    """
+    與 main.get_pipeline 相同的 Pipeline（所有會話共用一個，如同 st.cache_resource）。
+    """
+    from core.pipeline import Pipeline
+    from nodes.advisor import AdvisorNode
+    pipe = Pipeline()
+    pipe.add_node(AdvisorNode("Advisor"))
+    return pipe
+
+
+class SimulatedSession:
+    """
+    一位使用者的會話狀態（對應 main.py 的 st.session_state），send() 重現 main.py 處理一則輸入的步驟
+    （歷史準備與訊息保存直接呼叫 utils.chat_flow 中與 main.py 共用的函式）。
+    """
+
+    def __init__(self, pipeline, session_id: str):
+        from utils.summarizer import new_summary_state
+        self.pipeline = pipeline
+        self.session_id = session_id
+        self.messages: List[Dict[str, Any]] = []
+        self.history_summary = new_summary_state()
+        self.history_fold_job = None
+        self.company_context_text = ""
+
+    def open(self) -> None:
+        from utils.conversation_storage import load_conversation_page
+        from utils.summarizer import restore_summary_state
+        page = load_conversation_page(self.session_id, limit=HISTORY_PAGE_SIZE)
+        if page["messages"]:
+            self.history_summary = restore_summary_state(page["messages"], page["metadata"])
+            self.messages = page["messages"] + self.messages
+
+    def _run(self, context: Dict[str, Any], started: float, fallback: str):
+        """
+        執行 Pipeline 並消費串流（相當於 st.write_stream），回傳 (回覆, 首段延遲毫秒)。
+        """
+        result_context = self.pipeline.run(context)
+        stream = result_context.pop("ai_response_stream", None)
+        ttft_ms = None
+        if stream is None:
+            return result_context.get("ai_response", fallback), (time.perf_counter() - started) * 1000, result_context
+        pieces = []
+        for piece in stream:
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - started) * 1000
+            pieces.append(piece)
+        return result_context.get("ai_response") or "".join(pieces) or fallback, ttft_ms, result_context
+
+    def send(self, prompt: str) -> Dict[str, Any]:
+        from utils.chat_flow import (
+            chat_context,
+            company_info_followup_context,
+            looks_like_company_report_payload,
+            prepare_llm_history,
+            record_assistant_turn,
+            record_company_receipt,
+            record_error_turn,
+            record_user_turn,
+            turn_metadata,
+        )
+
+        started = time.perf_counter()
+        if looks_like_company_report_payload(prompt):
+            kind = "company_report"
+            self.company_context_text = prompt
+            record_company_receipt(self, self.session_id)
+            history, summary = prepare_llm_history(self, self.messages)
+            context = company_info_followup_context(self.company_context_text, history, summary)
+            fallback = "（已收到補充資訊，但暫時無法生成解說內容）"
+        else:
+            kind = "chat"
+            record_user_turn(self, self.session_id, prompt)
+            history, summary = prepare_llm_history(self, self.messages[:-1])
+            context = chat_context(prompt, self.company_context_text, history, summary)
+            fallback = "抱歉，我無法回答這個問題。"
+
+        error = None
+        ttft_ms = None
+        try:
+            response, ttft_ms, result_context = self._run(context, started, fallback)
+            record_assistant_turn(self, self.session_id, response, turn_metadata(context), result_context)
+            if response.lstrip().startswith("⚠️"):
+                error = response.strip().splitlines()[0]
+        except Exception as e:
+            error = f"⚠️ 系統錯誤：{str(e)}"
+            record_error_turn(self, self.session_id, error)
+        return {
+            "kind": kind,
+            "latency_ms": (time.perf_counter() - started) * 1000,
+            "ttft_ms": ttft_ms,
+            "error": error,
+        }
+
+
+def run_level(pipeline, users: int, turns: int, think: float = 0.0, engine=None) -> Dict[str, Any]:
+    """
+    同時啟動 users 個會話，每個會話送出 turns 則訊息；回傳這一級的吞吐量、延遲百分位、錯誤與記憶體變化。
+    """
+    from utils.conversation_storage import flush_conversations
+
+    results: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(users + 1)
+
+    def _user(index: int) -> None:
+        session = SimulatedSession(pipeline, f"load-{users}-{index}-{uuid.uuid4().hex[:8]}")
+        script = SCRIPTS[index % len(SCRIPTS)]
+        session.open()
+        barrier.wait()
+        for turn in range(turns):
+            outcome = session.send(script[turn % len(script)])
+            with lock:
+                results.append(outcome)
+            if think > 0 and turn + 1 < turns:
+                time.sleep(think)
+
+    if engine is not None:
+        engine.reset_stats()
+    gc.collect()
+    rss_before = _rss_mb()
+    threads = [threading.Thread(target=_user, args=(i,), name=f"load-user-{i}", daemon=True) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    flush_started = time.perf_counter()
+    flush_conversations(timeout=30.0)
+    flush_ms = (time.perf_counter() - flush_started) * 1000
+    gc.collect()
+    rss_after = _rss_mb()
+
+    latencies = sorted(r["latency_ms"] for r in results)
+    ttfts = sorted(r["ttft_ms"] for r in results if r["ttft_ms"] is not None)
+    level = {
+        "users": users,
+        "turns": len(results),
+        "company_report_turns": sum(1 for r in results if r["kind"] == "company_report"),
+        "errors": sum(1 for r in results if r["error"]),
+        "wall_sec": round(wall, 3),
+        "throughput": round(len(results) / wall, 3) if wall else 0.0,
+        "latency_p50_ms": round(_percentile(latencies, 50), 1),
+        "latency_p95_ms": round(_percentile(latencies, 95), 1),
+        "latency_p99_ms": round(_percentile(latencies, 99), 1),
+        "ttft_p50_ms": round(_percentile(ttfts, 50), 1),
+        "ttft_p95_ms": round(_percentile(ttfts, 95), 1),
+        "storage_flush_ms": round(flush_ms, 1),
+        "rss_before_mb": round(rss_before, 1),
+        "rss_after_mb": round(rss_after, 1),
+        "rss_growth_mb": round(rss_after - rss_before, 2),
+    }
+    if engine is not None:
+        level["model_max_in_flight"] = engine.stats()["max_in_flight"]
+    return level
+
+
+def find_saturation(levels: List[Dict[str, Any]], min_gain: float = 1.1) -> Optional[Dict[str, Any]]:
+    """
+    飽和點：第一個「再增加使用者，吞吐量增幅低於 min_gain 倍」的級距；測試範圍內都還在成長時回傳 None。
+    """
+    for previous, current in zip(levels, levels[1:]):
+        if current["throughput"] < previous["throughput"] * min_gain:
+            return {
+                "users": previous["users"],
+                "next_users": current["users"],
+                "throughput_gain": round(current["throughput"] / previous["throughput"], 3) if previous["throughput"] else None,
+                "p95_before_ms": previous["latency_p95_ms"],
+                "p95_after_ms": current["latency_p95_ms"],
+            }
+    return None
+
+
+def format_levels(levels: List[Dict[str, Any]], saturation: Optional[Dict[str, Any]]) -> str:
+    header = (
+        f"{'會話':>6} {'輪數':>6} {'錯誤':>5} {'輪/秒':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+        f"{'TTFT p50':>9} {'TTFT p95':>9} {'RSS MB':>8} {'增長':>7}"
+    )
+    lines = [header, "-" * len(header)]
+    for row in levels:
+        lines.append(
+            f"{row['users']:>6} {row['turns']:>6} {row['errors']:>5} {row['throughput']:>8.2f} "
+            f"{row['latency_p50_ms']:>9.1f} {row['latency_p95_ms']:>9.1f} {row['latency_p99_ms']:>9.1f} "
+            f"{row['ttft_p50_ms']:>9.1f} {row['ttft_p95_ms']:>9.1f} {row['rss_after_mb']:>8.1f} {row['rss_growth_mb']:>+7.2f}"
+        )
+    if levels:
+        total_growth = levels[-1]["rss_after_mb"] - levels[0]["rss_before_mb"]
+        total_turns = sum(row["turns"] for row in levels)
+        lines.append(f"\n記憶體：共增長 {total_growth:+.1f} MB（{total_turns} 輪，約每輪 {total_growth * 1024 / max(total_turns, 1):.1f} KB）")
+    if saturation:
+        lines.append(
+            f"飽和點：約 {saturation['users']} 個同時會話（增加到 {saturation['next_users']} 時吞吐量僅 ×{saturation['throughput_gain']}，"
+            f"p95 延遲 {saturation['p95_before_ms']:.0f} → {saturation['p95_after_ms']:.0f} ms）"
+        )
+    else:
+        lines.append("飽和點：測試範圍內吞吐量仍隨會話數成長（可再加大 --users）")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description="並行會話負載測試（替身模型與儲存）")
+    parser.add_argument("--users", default="1,2,4,8,16,32", help="逐級的同時會話數（逗號分隔）")
+    parser.add_argument("--turns", type=int, default=4, help="每個會話送出的訊息數")
+    parser.add_argument("--think", type=float, default=0.0, help="每輪之間的思考時間（秒）")
+    parser.add_argument("--ttft", type=float, default=FAKE_GEMINI_TTFT_SEC, help="模型首段延遲（秒）")
+    parser.add_argument("--tps", type=float, default=FAKE_GEMINI_TOKENS_PER_SEC, help="模型輸出速度（tokens/sec，0 不延遲）")
+    parser.add_argument("--error-429", type=float, default=FAKE_GEMINI_ERROR_429_RATE, help="模型回 429 的機率")
+    parser.add_argument("--error-500", type=float, default=FAKE_GEMINI_ERROR_500_RATE, help="模型回 500 的機率")
+    parser.add_argument("--seed", type=int, default=FAKE_GEMINI_SEED)
+    parser.add_argument("--db-latency", type=float, default=0.0, help="每次儲存操作的模擬延遲（秒）")
+    parser.add_argument("--cache", action="store_true", help="保留回覆快取（預設關閉，每輪都呼叫模型）")
+    parser.add_argument("--min-gain", type=float, default=1.1, help="判定飽和的吞吐量增幅門檻（倍）")
+    parser.add_argument("--json", default=None, help="另存結果為 JSON 檔")
+    args = parser.parse_args(argv)
+
+    levels_spec = [int(n) for n in args.users.split(",") if n.strip()]
+    if not levels_spec or min(levels_spec) < 1:
+        print("❌ --users 需為正整數清單，例如 1,2,4,8", file=sys.stderr)
+        return 1
+
+    import nodes.advisor as advisor
+    import utils.gemini_client as gemini_client
+    from utils.fake_gemini import FakeGemini
+
+    engine = FakeGemini(
+        ttft=args.ttft,
+        tokens_per_sec=args.tps,
+        error_429_rate=args.error_429,
+        error_500_rate=args.error_500,
+        default_response=_SECTION,
+        seed=args.seed,
+    )
+    saved_cache = advisor.get_response_cache
+    gemini_client.set_backend(engine)
+    if not args.cache:
+        advisor.get_response_cache = lambda: None
+    levels: List[Dict[str, Any]] = []
+    try:
+        with stubbed_storage(FakeSupabase(latency=args.db_latency)) as db:
+            pipeline = build_pipeline()
+            # 暖身：載入知識庫、編譯模板等一次性成本不計入第一級
+            run_level(pipeline, users=1, turns=1, engine=engine)
+            for users in levels_spec:
+                level = run_level(pipeline, users, args.turns, think=args.think, engine=engine)
+                levels.append(level)
+                print(
+                    f"  {users} 個會話：{level['throughput']:.2f} 輪/秒，p95 {level['latency_p95_ms']:.0f} ms，"
+                    f"錯誤 {level['errors']}",
+                    file=sys.stderr,
+                )
+            storage_stats = dict(db.stats)
+    finally:
+        advisor.get_response_cache = saved_cache
+        gemini_client.set_backend(None)
+
+    saturation = find_saturation(levels, args.min_gain)
+    print(format_levels(levels, saturation))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"levels": levels, "saturation": saturation, "storage": storage_stats,
+                       "config": vars(args)}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
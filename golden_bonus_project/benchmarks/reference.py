@@ -0,0 +1,108 @@
+# benchmarks/reference.py
+"""
+回覆後處理的參考實作：單次掃描版（nodes/advisor.py 的 _postprocess_response / _ResponseFilter）之前的逐步處理鏈，
+不在正式流程中使用，只作為行為基準：
+- benchmarks/cases.py 的 postprocess.chain 以它對照 postprocess.fused 的效能
+- tests/test_postprocess_equivalence.py 以隨機回覆對照兩者（整段與串流）的輸出必須完全相同
+"""
+from typing import Iterable, Iterator
+
+from nodes.advisor import (
+    _QUESTION_REWRITES,
+    _ensure_followup_format,
+    _escalation_block,
+    _iter_lines,
+    _join_stripped,
+    _needs_human_escalation,
+    _stream_followup_format,
+)
+
+# 舊版判斷「回覆含反問/問句」的特徵（原本在 ADVISOR_KEYWORDS 中；單次掃描版不再需要這個判斷）
+QUESTION_MARKERS = ("？", "?", "請問", "能否", "可以提供", "可否", "方便提供")
+
+
+def contains_questions(text: str) -> bool:
+    """
+    偵測回覆是否包含反問/問句特徵（保守判斷）。
+    """
+    t = (text or "")
+    if not t:
+        return False
+    return any(m in t for m in QUESTION_MARKERS)
+
+
+def remove_questions(text: str) -> str:
+    """
+    最小保守修正：移除含問句標點的行，並把常見反問句型替換成「下一步建議」陳述句。
+    """
+    if not text:
+        return text
+
+    kept = [line for line in text.splitlines() if "？" not in line and "?" not in line]
+    cleaned = "\n".join(kept).strip()
+    # 額外處理：若殘留「請問/能否」等但不含問號，改寫成指令式下一步
+    for old, new in _QUESTION_REWRITES:
+        cleaned = cleaned.replace(old, new)
+    return cleaned
+
+
+def strip_internal_refs(text: str) -> str:
+    """
+    保底清理：移除含知識庫內部代碼（C_XXXX / R_XXXX 等）的整行。
+    """
+    if not text:
+        return text
+    return "\n".join(line for line in text.splitlines() if "C_" not in line and "R_" not in line).strip()
+
+
+def postprocess_chain(text: str, followup: bool = False) -> str:
+    """
+    整段回覆的逐步後處理（原本 finalize_response 的順序）。
+    """
+    response = strip_internal_refs(text)
+    if contains_questions(response):
+        response = remove_questions(response)
+    if followup:
+        response = _ensure_followup_format(response)
+    return response
+
+
+def finalize_chain(question: str, text: str, followup: bool = False) -> str:
+    """
+    整段回覆的最終輸出：逐步後處理 + 重新掃描全文判斷是否補上「建議諮詢真人」段落。
+    """
+    response = postprocess_chain(text, followup=followup)
+    need_escalation, note = _needs_human_escalation(question, response)
+    if need_escalation:
+        response = (response or "").rstrip() + _escalation_block(note)
+    return response
+
+
+def filter_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    逐行版的 strip_internal_refs + remove_questions：丟掉含內部代碼或問號的行，並把反問句型改寫成「下一步建議」。
+    """
+    for line in lines:
+        if "C_" in line or "R_" in line:
+            continue
+        if "？" in line or "?" in line:
+            continue
+        for old, new in _QUESTION_REWRITES:
+            line = line.replace(old, new)
+        yield line
+
+
+def stream_chain(question: str, chunks: Iterable[str], followup: bool = False) -> str:
+    """
+    串流回覆的最終輸出（送到 UI 的全部片段接起來，也就是寫回 context["ai_response"] 的內容）：
+    逐行過濾 → followup 框架（累積全文找標題）→ 結尾空白與「建議諮詢真人」段落的處理同 _stream_advisor_response。
+    """
+    pieces: Iterable[str] = _join_stripped(filter_lines(_iter_lines(chunks)))
+    if followup:
+        pieces = _stream_followup_format(pieces)
+    joined = "".join(pieces)
+    response = joined.rstrip()
+    need_escalation, note = _needs_human_escalation(question, response)
+    if need_escalation:
+        return response + _escalation_block(note)
+    return joined
@@ -0,0 +1,186 @@
+# benchmarks/stubs.py
+"""
+模型呼叫替身：固定回覆（報告式長文，含標題、內部代碼行、問句與反問句型），讓後處理每條規則都會被走到。
+基準期間同時關閉回覆快取，每次都走完整的「組提示詞 → 呼叫模型 → 後處理」路徑。
+
+儲存替身：記憶體中的 Supabase（FakeSupabase），支援 conversation_storage 用到的查詢，
+可設定每次操作的延遲，負載測試時照樣經過客戶端登錄表與背景寫入佇列。
+"""
+import re
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+_SECTION = """### 原理總覽
+本次獎金池的規劃以「階段 / 用人成本風險 / 增長引擎與部門權重」三個面向說明，並依知識庫框架逐項推導。
+- 階段判斷：營收與毛利決定公司目前的養人能力，對應 C_STAGE_GROWTH 的門檻。
+- 用人成本：人事成本占毛利的比例落在安全區間，未觸發 R_HR_RATIO_HIGH。
+
+### 這份報告如何推導
+1. 獎金池 = 淨利 × (1 - 保留比例)，本次保留比例符合建議區間。
+2. 人均獎金 = 獎金池 ÷ 人數，換算約 1.8 個月。
+3. 部門權重依增長引擎映射，業務與研發權重較高。
+請問是否需要依部門再拆分？
+若方便提供各部門人數與月薪，可以提供更精確的分配。
+能否先確認年底與季度獎金的比例
+
+### 如何解讀這份結果
+- 月數落在市場常見區間，兼顧留才與現金流。
+- 保留盈餘足以支應明年營運週轉，風險可控。
+- 可否在發放前先與主管溝通績效等級分布，避免爭議。
+
+### 還可以回答的問題
+- 階段判斷的邏輯與門檻解讀
+- HR Ratio 的意義、風險區間、以及為什麼只用於風險而不決定階段
+- 增長引擎如何映射到部門權重（解讀分配理由）
+"""
+
+# 約 8 段（數千字），接近長篇報告式回覆
+STUB_RESPONSE = "\n".join(_SECTION for _ in range(8))
+STREAM_CHUNK_CHARS = 48
+
+
+def stub_call_gemini_logic(system_prompt, user_message, history=None, *args, **kwargs) -> str:
+    return STUB_RESPONSE
+
+
+def stub_stream_gemini_logic(system_prompt, user_message, history=None, *args, **kwargs) -> Iterator[str]:
+    for start in range(0, len(STUB_RESPONSE), STREAM_CHUNK_CHARS):
+        yield STUB_RESPONSE[start:start + STREAM_CHUNK_CHARS]
+
+
+@contextmanager
+def stubbed_model():
+    """
+    以替身取代 gemini_client 的呼叫函式並關閉回覆快取；離開時還原。
+    """
+    import nodes.advisor as advisor
+    import utils.gemini_client as gemini_client
+
+    saved = (
+        gemini_client.call_gemini_logic,
+        gemini_client.stream_gemini_logic,
+        advisor.get_response_cache,
+    )
+    gemini_client.call_gemini_logic = stub_call_gemini_logic
+    gemini_client.stream_gemini_logic = stub_stream_gemini_logic
+    advisor.get_response_cache = lambda: None
+    try:
+        yield
+    finally:
+        gemini_client.call_gemini_logic, gemini_client.stream_gemini_logic, advisor.get_response_cache = saved
+
+
+# ==================== 儲存替身 ====================
+
+_KEYSET_FILTER = re.compile(r'^(\w+)\.lt\."([^"]+)",and\(\1\.eq\."\2",(\w+)\.lt\.(-?\d+)\)$')
+
+
+class _FakeQuery:
+    """
+    supabase-py 查詢建構器的子集：insert / select / eq / or_（(created_at, id) 游標）/ order / limit / execute。
+    """
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self._db = db
+        self._table = table
+        self._rows: Optional[List[Dict[str, Any]]] = None
+        self._filters: List[Any] = []
+        self._order: List[tuple] = []
+        self._limit: Optional[int] = None
+
+    def insert(self, rows):
+        self._rows = list(rows) if isinstance(rows, list) else [rows]
+        return self
+
+    def select(self, columns: str = "*"):
+        return self
+
+    def eq(self, column: str, value: Any):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def or_(self, expression: str):
+        match = _KEYSET_FILTER.match(expression)
+        if not match:
+            raise NotImplementedError(f"FakeSupabase 不支援的 or_ 條件：{expression}")
+        column, value, tie_column, tie_value = match.group(1), match.group(2), match.group(3), int(match.group(4))
+        self._filters.append(
+            lambda row: row[column] < value or (row[column] == value and row[tie_column] < tie_value)
+        )
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def execute(self) -> SimpleNamespace:
+        return self._db._execute(self)
+
+
+class FakeSupabase:
+    """
+    記憶體中的 Supabase 客戶端（執行緒安全）；latency 為每次操作的模擬往返秒數。
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.stats = {"inserts": 0, "rows": 0, "selects": 0}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self, name)
+
+    def _execute(self, query: _FakeQuery) -> SimpleNamespace:
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self._lock:
+            table = self.tables.setdefault(query._table, [])
+            if query._rows is not None:
+                inserted = []
+                for row in query._rows:
+                    inserted.append({**row, "id": self._next_id})
+                    self._next_id += 1
+                table.extend(inserted)
+                self.stats["inserts"] += 1
+                self.stats["rows"] += len(inserted)
+                return SimpleNamespace(data=inserted)
+            self.stats["selects"] += 1
+            rows = [row for row in table if all(f(row) for f in query._filters)]
+        # 多欄排序：由次要欄位往主要欄位依序穩定排序
+        for column, desc in reversed(query._order):
+            rows.sort(key=lambda row: row.get(column), reverse=desc)
+        if query._limit is not None:
+            rows = rows[:query._limit]
+        return SimpleNamespace(data=[dict(row) for row in rows])
+
+
+@contextmanager
+def stubbed_storage(db: Optional[FakeSupabase] = None):
+    """
+    讓 conversation_storage 連到 FakeSupabase（設定檢查、客戶端登錄表與背景寫入佇列照常運作）；
+    離開前先把佇列寫完，再還原設定並清掉共用客戶端。
+    """
+    import utils.conversation_storage as storage
+
+    db = db or FakeSupabase()
+    registry = storage._registry
+    saved = (storage.get_supabase_config, registry._sdk, registry._sdk_missing)
+    registry.clear()
+    storage.get_supabase_config = lambda: ("http://fake-supabase.local", "fake-key")
+    registry._sdk = lambda url, key: db
+    registry._sdk_missing = False
+    try:
+        yield db
+    finally:
+        storage.flush_conversations(timeout=10.0)
+        storage.get_supabase_config, registry._sdk, registry._sdk_missing = saved
+        registry.clear()
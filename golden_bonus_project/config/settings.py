@@ -243,3 +243,214 @@ PAGE_HEADER = "🤖 WinLeaders-Bonus 年終獎金顧問"
 # Streamlit cache busting：若你更新了節點邏輯但雲端仍吃到舊快取，可調整此值強制重建 Pipeline
 PIPELINE_CACHE_VERSION = "v7-auto-feedback-on-supplement"
 
+
+# Gemini 模型實例快取：同一組 (model, system_prompt, temperature, max_tokens) 共用已配置好的實例
+# 以 LRU 淘汰；提示詞含企業補充資訊時組合會變多，數值可依記憶體調整
+GEMINI_MODEL_CACHE_SIZE = 32
+
+# ==================== 知識塊檢索 ====================
+# 每次只把與問題最相關的知識塊放進提示詞（知識庫主體的表格/規則仍完整保留）
+# 關閉時回到舊行為：把整份 BONUS_KB_TEXT 放進每一個提示詞
+KNOWLEDGE_RETRIEVAL_ENABLED = True
+KNOWLEDGE_RETRIEVAL_TOP_K = 3
+KNOWLEDGE_RETRIEVAL_MIN_SCORE = 0.0
+# 已載入企業補充資訊時，檢索查詢改用「補充資訊的欄位名/文字值 + 問題」；
+# 最多取這麼多個不重複詞，避免長報告把問題本身的詞稀釋掉
+KNOWLEDGE_RETRIEVAL_CONTEXT_TERMS = 40
+
+# ==================== 知識庫預編譯檔 ====================
+# 知識庫 JSON 預先編譯成單一二進位檔（渲染好的文字、檢索索引、表格資料、內容雜湊），冷啟動直接載入不再解析/格式化
+# 來源 JSON 或編譯程式碼變更時自動失效並重建；手動建置：python -m assets.kb_artifact build
+# PATH 相對於專案目錄
+KB_ARTIFACT_ENABLED = True
+KB_ARTIFACT_PATH = "assets/.kb_cache/knowledge.pkl"
+
+# ==================== 提示詞預算 ====================
+# system prompt + 歷史 + 本次提問的估計 token 上限；超過時依序裁切：舊歷史 → 企業補充資訊 → 檢索知識塊
+# 設為 None 或 0 表示不限制
+PROMPT_TOKEN_BUDGET = 16000
+
+# ==================== 顧問路由關鍵字 ====================
+# AdvisorNode 的意圖判斷/保底規則用的關鍵字表；啟動時編譯成單一多關鍵字比對器（utils/keyword_router.py）
+# 新增觸發詞只需改這裡；各表的比對對象：
+# - 提問（已去除空白）：intro / followup / explain / pro_*
+# - 提問（轉小寫）：report_company / report_block
+# - 模型回覆：refusal
+ADVISOR_KEYWORDS = {
+    # 自我介紹/怎麼用：本地直接回覆，避免被模型安全策略誤判而拒答
+    "intro": ["你是誰", "你是什麼", "你能做什麼", "你可以做什麼", "怎麼用", "如何使用", "使用方法", "你會什麼"],
+    # 覺得太少/不滿意/想更詳細：改走 followup 模板
+    "followup": [
+        "不滿意", "太少", "不夠", "更詳細", "詳細說明", "詳細解釋",
+        "說明一下", "再多一點", "多一點", "具體一點", "更具體", "怎麼調整",
+        "為什麼", "原因", "取捨", "方案",
+    ],
+    # 已有企業補充資訊時的「解說/原理/解讀」類問題
+    "explain": ["解說", "原理", "解讀", "推導", "介紹", "怎麼看", "如何看"],
+    # 結構化公司資料貼文：需同時命中 report_company 與 report_block
+    "report_company": ["company"],
+    "report_block": ["financials", "bonus", "departments", "growthengine", "warnings", "recommendations"],
+    # 高風險/專業領域：先回答，再建議諮詢真人
+    "pro_law_hr": ["勞基法", "勞資", "解雇", "資遣", "加班", "工時", "特休", "最低工資", "勞健保", "勞退"],
+    "pro_tax_accounting": ["稅", "扣繳", "申報", "所得稅", "營所稅", "二代健保", "費用化", "分錄", "審計", "財報"],
+    "pro_legal": ["契約", "合約", "法務", "訴訟", "違法", "合規"],
+    "pro_comp": ["薪酬制度", "股票", "期權", "ESOP", "分紅", "獎酬"],
+    # 模型明顯拒答/空泛
+    "refusal": [
+        "抱歉，我無法回答", "我無法回答", "不能回答", "無法提供", "我不知道",
+        "無法判斷", "不確定", "資訊不足", "超出我的範圍",
+    ],
+    # 回覆中的反問/問句特徵
+}
+
+# ==================== 對話記錄背景寫入 ====================
+# save_conversation 預設只排入背景佇列：累積到 BATCH_SIZE 筆或等待超過 FLUSH_INTERVAL 秒就批次寫入 Supabase
+# 寫入失敗會重試（指數退避），仍失敗則落地到 SPILL_FILE（相對於專案目錄），恢復連線後自動補送
+CONVERSATION_WRITE_BEHIND = True
+CONVERSATION_BATCH_SIZE = 20
+CONVERSATION_FLUSH_INTERVAL_SEC = 2.0
+CONVERSATION_MAX_RETRIES = 3
+CONVERSATION_RETRY_BACKOFF_SEC = 0.5
+CONVERSATION_SPILL_FILE = ".conversation_spill.jsonl"
+# 對話歷史分頁：啟動時只載入最新的 PAGE_SIZE 則，按「載入較早訊息」再以 (created_at, id) 游標往前取一頁
+# 畫面只渲染最後 RENDER_WINDOW 則（較早的訊息留在 session_state，按鈕展開時不需要重新查詢）
+HISTORY_PAGE_SIZE = 50
+HISTORY_RENDER_WINDOW = 50
+
+# ==================== Supabase 客戶端 ====================
+# 客戶端依 (url, key) 在程序內共用；連不上時冷卻 N 秒內不再嘗試連線，避免每則訊息都卡在逾時
+SUPABASE_FAILURE_COOLDOWN_SEC = 30.0
+# Secrets/環境變數讀取結果的快取秒數
+SUPABASE_CONFIG_TTL_SEC = 60.0
+
+# ==================== Pipeline 追蹤 ====================
+# 每個節點記錄牆鐘/CPU 時間與 context 大小；可選 exporter："jsonl"（本地檔案）、"otlp"（OpenTelemetry Collector）
+# 環境變數 GOLDEN_TRACE_EXPORTERS（逗號分隔）、OTEL_EXPORTER_OTLP_ENDPOINT 可覆寫以下設定
+TRACE_EXPORTERS: list = []
+# 相對路徑以專案目錄為準（不受啟動時的工作目錄影響）
+TRACE_JSONL_PATH = "traces/pipeline_spans.jsonl"
+TRACE_OTLP_ENDPOINT = "http://localhost:4318"
+TRACE_SERVICE_NAME = "golden-bonus-advisor"
+# OTLP 由單一背景執行緒送出；待送的 run（每次 run 一批 span）超過上限時丟棄新的一批，
+# 程序結束前最多等待 N 秒把已排入的送完
+TRACE_OTLP_MAX_QUEUE = 256
+TRACE_OTLP_FLUSH_TIMEOUT_SEC = 5.0
+
+# ==================== 顧問回覆快取 ====================
+# 相同/相近問題在相同條件（意圖、知識庫版本、模板版本、企業上下文）下直接回傳先前回覆，不呼叫模型
+# 企業上下文含對話歷史與摘要：同一句「為什麼」在不同對話中不會互相命中
+# FUZZY_THRESHOLD：問題字元 bigram 的 Jaccard 相似度門檻（設為 1.0 只做完全比對）
+# FUZZY_GUARD_WORDS：模糊命中時兩題的數字（阿拉伯/中文數字）與這些詞必須完全相同（依出現順序），
+#   避免「四十五人/九十五人」「五萬二/八萬二」「安全/危險」這類只差關鍵字的問題拿到別題的答案
+# SQLITE_PATH：設為檔案路徑即同時落地到 SQLite（跨程序/重啟共用）；None 表示只用記憶體
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_MAX_ENTRIES = 512
+RESPONSE_CACHE_TTL_SEC = 24 * 60 * 60
+RESPONSE_CACHE_FUZZY_THRESHOLD = 0.9
+RESPONSE_CACHE_FUZZY_GUARD_WORDS = [
+    # 金額/數量單位
+    "個月", "月", "年", "人", "元", "塊", "萬", "千", "百", "億", "成", "倍", "%", "趴",
+    # 方向/程度/否定
+    "安全", "危險", "風險", "保守", "積極", "穩健", "增加", "減少", "提高", "降低", "上升", "下滑", "下降",
+    "超過", "超支", "低於", "高於", "以上", "以下", "最多", "最少", "至少", "多", "少", "高", "低",
+    "不", "沒", "無", "未", "別",
+]
+RESPONSE_CACHE_SQLITE_PATH = None
+
+# ==================== 部門 / 績效等級分配 ====================
+# AllocationNode：獎金池先依增長引擎的部門權重（知識庫 EngineToDepartmentWeights）分給各部門，
+# 部門內再依「月薪 × 績效等級倍數」分給每位員工；倍數依人才投資策略（style）而定
+ALLOCATION_GRADE_MULTIPLIERS = {
+    "留才優先 (Retention First)": {"S": 1.5, "A": 1.2, "B": 1.0, "C": 0.7, "D": 0.3},
+    "戰功優先 (Performance First)": {"S": 2.0, "A": 1.4, "B": 1.0, "C": 0.5, "D": 0.0},
+    "團隊優先 (Team First)": {"S": 1.2, "A": 1.1, "B": 1.0, "C": 0.9, "D": 0.7},
+}
+# 未提供 style 時使用的倍數表；名冊沒有績效等級欄位（或等級不在表中）時視為此等級
+ALLOCATION_DEFAULT_STYLE = "留才優先 (Retention First)"
+ALLOCATION_DEFAULT_GRADE = "B"
+# 部門池的分配基礎：
+# - "department"：每個部門只看引擎權重（知識庫 R_ALLOCATE_STANDARD：deptBonus = pool × weight / Σweight）
+# - "headcount"：權重 × 部門人數
+# - "salary"：權重 × 部門月薪總額
+ALLOCATION_DEPARTMENT_BASIS = "department"
+
+# ==================== 敏感度分析（Monte Carlo） ====================
+# SensitivityNode：依使用者輸入為中心抽樣（可設定相關係數），以向量化計算器估計指標分位數與各風險規則觸發機率
+SENSITIVITY_SAMPLES = 200_000
+SENSITIVITY_CHUNK_SIZE = 1_000_000     # 每批抽樣/計算的筆數（控制暫存陣列記憶體）
+SENSITIVITY_PERCENTILES = (5, 25, 50, 75, 95)
+SENSITIVITY_SEED = None                # 固定數值可重現結果
+# 未指定分布時的預設：以使用者輸入為中心
+# - net_profit：常態，標準差 = 輸入 × 20%
+# - avg_salary：常態，標準差 = 輸入 × 5%
+# - employees：常態，標準差 = 輸入 × 5%（取整，至少 1 人）
+# - retention_rate：常態，標準差 0.05（截在 0~1）
+SENSITIVITY_DEFAULT_SPREAD = {
+    "net_profit": 0.20,
+    "avg_salary": 0.05,
+    "employees": 0.05,
+    "retention_rate": 0.05,
+}
+# 預設相關係數（未列出的組合為 0）：獲利好時通常人數與保留比例也會調整
+SENSITIVITY_DEFAULT_CORRELATION = {
+    ("net_profit", "employees"): 0.3,
+    ("net_profit", "retention_rate"): -0.2,
+}
+
+# ==================== 批次產生報告（report_batch.py） ====================
+# 多家公司同時產生 GENERATE_REPORT 草案：並行呼叫 Gemini，受 RPM/TPM 限流；429/5xx 以指數退避重試
+REPORT_BATCH_CONCURRENCY = 8
+REPORT_BATCH_RPM = 60
+REPORT_BATCH_TPM = 1_000_000
+REPORT_BATCH_OUTPUT_TOKENS_EST = 1500   # TPM 計算用的每份報告輸出 token 預估（輸入 token 依提示詞估算）
+REPORT_BATCH_MAX_RETRIES = 5
+REPORT_BATCH_RETRY_BACKOFF_SEC = 2.0
+
+# ==================== 對話摘要（滾動壓縮歷史） ====================
+# 未摘要的歷史訊息超過 TOKEN_BUDGET 時，把較舊的訊息與先前摘要一起交給模型濃縮成新摘要（增量更新，已摘要的訊息不會重送），
+# 壓縮到剩下約 TOKEN_BUDGET 的一半，且至少保留最近 KEEP_RECENT 則原文；摘要放進 system prompt 的【先前對話摘要】段落
+# 摘要在助理回覆送出後於背景執行緒進行，下一輪提問才採用（不增加首段延遲）；
+# 摘要失敗後依 RETRY_BACKOFF_SEC 指數退避（上限 RETRY_MAX_SEC），不會每一輪都重試
+HISTORY_SUMMARY_ENABLED = True
+HISTORY_TOKEN_BUDGET = 3000
+HISTORY_KEEP_RECENT = 6
+HISTORY_SUMMARY_MAX_TOKENS = 800
+HISTORY_SUMMARY_WORKERS = 4
+HISTORY_SUMMARY_RETRY_BACKOFF_SEC = 30.0
+HISTORY_SUMMARY_RETRY_MAX_SEC = 600.0
+HISTORY_SUMMARY_PROMPT = """你是對話紀錄整理員。請把「先前摘要」與「新增對話」合併成一份新的繁體中文摘要，供年終獎金顧問後續回答時參考。
+
+要求：
+- 保留使用者提供的公司數據、條件、偏好、已確認的決定與仍待解決的問題
+- 保留顧問已給出的關鍵建議與數字（不要改寫數字）
+- 刪除寒暄、重複內容與推導細節
+- 以條列呈現，總長度不超過 {max_tokens} 字
+- 只輸出摘要本身，不要加標題或說明
+"""
+
+# ==================== 用量計量（token / 成本 / 延遲） ====================
+# 每次顧問回覆記錄輸入/輸出 token（優先用 Gemini usage_metadata，缺少時以本地估算）、延遲、快取命中與提示詞各區段 token，
+# 寫進對話記錄 metadata 的 "usage" 欄位；彙總報表：python -m utils.metering --by day（或 --by session）
+METERING_ENABLED = True
+# 每百萬 token 價格（美元），用於估算成本；依實際使用的模型調整
+METERING_PRICE_PER_1M_INPUT = 0.10
+METERING_PRICE_PER_1M_OUTPUT = 0.40
+
+# ==================== 啟動匯入時間 ====================
+# main.py 在其他匯入之前安裝匯入計時器（utils/lazy.py），第一次執行完成時把各模組匯入耗時輸出到 stderr（部署平台日誌）
+# SDK（google.generativeai / supabase）、.env 與知識庫都在第一次使用時才載入，不計入冷啟動
+STARTUP_IMPORT_REPORT = True
+STARTUP_IMPORT_REPORT_TOP = 10
+
+# ==================== 模型後端 / 離線替身 ====================
+# "genai"（正式 Gemini）、"fake"（程序內替身）、"http://127.0.0.1:8089"（本地替身伺服器：python -m utils.fake_gemini serve）
+# 環境變數 GEMINI_BACKEND 可覆寫
+GEMINI_BACKEND = "genai"
+# 替身的行為（serve 子命令的參數預設值也取自這裡）
+FAKE_GEMINI_TTFT_SEC = 0.3              # 首段延遲
+FAKE_GEMINI_TOKENS_PER_SEC = 60.0       # 輸出速度（0 表示不延遲）
+FAKE_GEMINI_ERROR_429_RATE = 0.0        # 每次請求回 429 的機率
+FAKE_GEMINI_ERROR_500_RATE = 0.0        # 每次請求回 500 的機率
+FAKE_GEMINI_SEED = None                 # 固定數值讓錯誤注入可重現
+# 依提問比對的固定回覆：[(正規表示式, 回覆)]，由上而下取第一個符合的；都不符合時用預設回覆
+FAKE_GEMINI_RESPONSES: list = []
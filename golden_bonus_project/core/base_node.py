@@ -1,12 +1,21 @@
 # core/base_node.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 
 class BaseNode(ABC):
     """
     這是所有節點的「爸爸」（父類別）。
     它規定所有繼承它的「孩子」都必須會做 execute 這件事。
     """
+    # 依賴宣告（給 Pipeline.arun 排程用）：這個節點會讀/寫 context 的哪些 key
+    # None 表示沒有宣告，視為會讀寫整個 context，只能單獨依序執行（舊節點不用改也能跑）
+    reads: Optional[Tuple[str, ...]] = None
+    writes: Optional[Tuple[str, ...]] = None
+    # 串流輸出：節點若把產生器放在 context 的這個 key（由 UI 事後消費），追蹤 span 會延到產生器結束才關閉
+    stream_key: Optional[str] = None
+
     def __init__(self, name: str):
         self.name = name
 
@@ -18,3 +27,31 @@ class BaseNode(ABC):
         """
         pass
 
+    def trace_attributes(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        追蹤用的節點自訂屬性（會附加到這個節點的 span 上）；預設沒有。
+        """
+        return {}
+
+class AsyncBaseNode(BaseNode):
+    """
+    非同步節點：實作 aexecute，在 Pipeline.arun 中直接 await（適合 I/O 等待型工作，例如讀取歷史、寫入儲存）。
+    仍保留同步的 execute，讓它也能放進 Pipeline.run 使用。
+    """
+
+    @abstractmethod
+    async def aexecute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        輸入/輸出同 execute。
+        """
+        pass
+
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        # 同步呼叫：沒有 event loop 的執行緒直接跑完 aexecute；
+        # 已在 event loop 中（例如從協程呼叫 Pipeline.run）時 asyncio.run 會失敗，改在另一個執行緒跑
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aexecute(context))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.aexecute(context)).result()
@@ -1,24 +1,196 @@
 # core/pipeline.py
-from typing import List, Dict, Any
-from core.base_node import BaseNode
+import asyncio
+import warnings
+from typing import List, Dict, Any, Optional
+from core.base_node import BaseNode, AsyncBaseNode
+from core.tracing import Tracer, get_default_tracer
 
 class Pipeline:
-    def __init__(self):
+    def __init__(self, tracer: Optional[Tracer] = None):
         self.nodes: List[BaseNode] = [] # 準備一個空的清單來放節點
+        # 追蹤：未指定時依設定建立（沒有啟用任何 exporter 時為 None，不做任何記錄）
+        self.tracer = tracer if tracer is not None else get_default_tracer()
 
     def add_node(self, node: BaseNode):
         self.nodes.append(node)
         return self # 讓我們可以寫 .add().add() 這種鍊式語法
 
     def run(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        root = self.tracer.start_trace("pipeline.run", context) if self.tracer else None
         # 這是最關鍵的迴圈：像大隊接力一樣傳遞 context
         for node in self.nodes:
             try:
-                context = node.execute(context) # 接棒！
+                context = self._traced_execute(node, context, root) # 接棒！
             except Exception as e:
                 # 把錯誤記下來，不要讓程式崩潰；同時提供 UI 可直接顯示的訊息
-                context["error"] = f"{node.name}: {e}"
-                context.setdefault("ai_response", f"⚠️ 系統錯誤：{context['error']}")
+                self._record_error(context, node, e)
                 break # 停止產線
+        if root is not None:
+            self._finish_trace(root, context)
         return context
 
+    def _traced_execute(self, node: BaseNode, context: Dict[str, Any], root: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        執行同步節點；有追蹤時在同一個執行緒內量測牆鐘/CPU 時間（CPU 時間因此只算這個節點）。
+        """
+        if root is None:
+            return node.execute(context)
+        span = self.tracer.start_span(node, root, context)
+        try:
+            result = node.execute(context)
+        except Exception as e:
+            self._finish_span(span, node, context, e, root)
+            raise
+        stream = result.get(node.stream_key) if node.stream_key else None
+        if stream is not None:
+            # 串流節點返回時模型還沒開始回覆：span（與整個 trace）延到產生器耗盡/關閉時才結束，
+            # 才量得到模型呼叫時間與 response_chars 等串流結束後才寫入的屬性
+            root["_open_streams"] = root.get("_open_streams", 0) + 1
+            result[node.stream_key] = self._traced_stream(stream, span, node, result, root)
+            return result
+        self._finish_span(span, node, result, None, root)
+        return result
+
+    def _traced_stream(self, stream, span: Dict[str, Any], node: BaseNode, context: Dict[str, Any],
+                       root: Dict[str, Any]):
+        """
+        包住節點的串流產生器；結束時關閉節點 span，若 run 已返回且這是最後一個串流，再結束整個 trace。
+        CPU 時間包含 UI 在同一執行緒消費串流期間的其他工作，僅供參考。
+        """
+        error: Optional[BaseException] = None
+        try:
+            yield from stream
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._finish_span(span, node, context, error, root)
+            root["_open_streams"] -= 1
+            if root["_open_streams"] == 0 and root.get("_deferred"):
+                self._finish_trace(root, context)
+
+    def _finish_trace(self, root: Dict[str, Any], context: Dict[str, Any]) -> None:
+        if root.get("_open_streams"):
+            root["_deferred"] = True
+            return
+        root.pop("_open_streams", None)
+        root.pop("_deferred", None)
+        self.tracer.finish_trace(root, context)
+
+    def _finish_span(self, span: Dict[str, Any], node: BaseNode, context: Dict[str, Any],
+                     error: Optional[Exception], root: Dict[str, Any]) -> None:
+        try:
+            attributes = node.trace_attributes(context)
+        except Exception:
+            attributes = {}
+        self.tracer.end_span(span, context, error, attributes)
+        root["children"].append(span)
+
+    @staticmethod
+    def _record_error(context: Dict[str, Any], node: BaseNode, e: Exception) -> None:
+        context["error"] = f"{node.name}: {e}"
+        context.setdefault("ai_response", f"⚠️ 系統錯誤：{context['error']}")
+
+    def stages(self) -> List[List[BaseNode]]:
+        """
+        依節點宣告的 reads/writes 把節點切成「階段」：同一階段內的節點彼此沒有讀寫衝突，可以同時執行；
+        階段之間維持加入順序。沒有宣告 reads/writes 的節點自成一個階段（等同依序執行）。
+        """
+        stages: List[List[BaseNode]] = []
+        current: List[BaseNode] = []
+        current_reads: set = set()
+        current_writes: set = set()
+        for node in self.nodes:
+            if node.reads is None or node.writes is None:
+                if current:
+                    stages.append(current)
+                stages.append([node])
+                current, current_reads, current_writes = [], set(), set()
+                continue
+
+            reads, writes = set(node.reads), set(node.writes)
+            # 讀到同階段別人要寫的 key、或寫到別人要讀/寫的 key → 必須等前面的節點完成
+            if (reads & current_writes) or (writes & (current_reads | current_writes)):
+                stages.append(current)
+                current, current_reads, current_writes = [], set(), set()
+            current.append(node)
+            current_reads |= reads
+            current_writes |= writes
+        if current:
+            stages.append(current)
+        return stages
+
+    async def _execute_node(self, node: BaseNode, context: Dict[str, Any], root: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if not isinstance(node, AsyncBaseNode):
+            # 同步節點丟到執行緒，避免卡住 event loop（也讓同階段的其他節點能同時進行）
+            return await asyncio.to_thread(self._traced_execute, node, context, root)
+        if root is None:
+            return await node.aexecute(context)
+        # 非同步節點的 CPU 時間包含 await 期間同一個 event loop 上其他協程的時間，僅供參考
+        span = self.tracer.start_span(node, root, context)
+        try:
+            result = await node.aexecute(context)
+        except Exception as e:
+            self._finish_span(span, node, context, e, root)
+            raise
+        self._finish_span(span, node, result, None, root)
+        return result
+
+    @staticmethod
+    def _warn_undeclared_writes(node: BaseNode, before: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """
+        併發階段只合併節點宣告的 writes；節點新增或改寫了未宣告的 key 時會被丟掉，這裡提出警告
+        （通常代表 writes 宣告漏了，該 key 在 run 中有效、在 arun 中卻消失）。
+        """
+        undeclared = sorted(
+            str(key) for key, value in result.items()
+            if key not in node.writes and (key not in before or before[key] is not value)
+        )
+        if undeclared:
+            warnings.warn(
+                f"節點 {node.name} 寫入了未宣告於 writes 的 key（arun 併發階段不會合併）：{', '.join(undeclared)}",
+                RuntimeWarning,
+                stacklevel=2,
+            )
+
+    async def arun(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        非同步版的 run：同一階段（見 stages）的節點併發執行，結果依宣告的 writes 合併回 context。
+        錯誤處理與 run 相同：記錄第一個失敗節點（依加入順序）的錯誤並停止後續階段。
+        """
+        root = self.tracer.start_trace("pipeline.arun", context) if self.tracer else None
+        for stage in self.stages():
+            if len(stage) == 1:
+                node = stage[0]
+                try:
+                    context = await self._execute_node(node, context, root)
+                except Exception as e:
+                    self._record_error(context, node, e)
+                    break
+                continue
+
+            # 併發節點各自拿一份淺拷貝，避免互相看到對方寫到一半的結果；
+            # before 是階段開始時的內容（節點可能直接改自己那份再回傳），檢查未宣告寫入時以它為準，
+            # 不與已合併了同階段其他節點結果的 context 比較
+            before = dict(context)
+            results = await asyncio.gather(
+                *(self._execute_node(node, dict(before), root) for node in stage),
+                return_exceptions=True,
+            )
+            failed = False
+            for node, result in zip(stage, results):
+                if isinstance(result, Exception):
+                    self._record_error(context, node, result)
+                    failed = True
+                    break
+                if isinstance(result, BaseException):
+                    raise result
+                for key in node.writes:
+                    if key in result:
+                        context[key] = result[key]
+                self._warn_undeclared_writes(node, before, result)
+            if failed:
+                break
+        if root is not None:
+            self._finish_trace(root, context)
+        return context
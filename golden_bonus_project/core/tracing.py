@@ -0,0 +1,265 @@
+# core/tracing.py
+"""
+Pipeline 追蹤：每個節點的 execute 記錄一個 span（牆鐘時間、CPU 時間、輸入/輸出 context 大小、節點自訂屬性），
+整次 run 另有一個 pipeline span 當作父節點。span 可輸出到本地 JSONL 檔，或以 OTLP/HTTP JSON 送到
+OpenTelemetry Collector（不需要安裝 opentelemetry 套件）。
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config.settings import (
+    TRACE_EXPORTERS,
+    TRACE_JSONL_PATH,
+    TRACE_OTLP_ENDPOINT,
+    TRACE_OTLP_FLUSH_TIMEOUT_SEC,
+    TRACE_OTLP_MAX_QUEUE,
+    TRACE_SERVICE_NAME,
+)
+
+_PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """
+    粗估 context 內容大小（字元數）：字串取長度、容器遞迴加總；
+    產生器等無法展開的物件不計（避免追蹤本身消耗串流內容）。
+    """
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (int, float, bool)):
+        return 8
+    if _depth >= 4:
+        return 0
+    if isinstance(value, dict):
+        return sum(len(str(k)) + estimate_size(v, _depth + 1) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sum(estimate_size(v, _depth + 1) for v in value)
+    nbytes = getattr(value, "nbytes", None)  # numpy 陣列
+    if isinstance(nbytes, int):
+        return nbytes
+    return 0
+
+
+class JsonlSpanExporter:
+    """
+    每個 span 一行 JSON，附加寫入本地檔案（方便用 jq/pandas 分析延遲回歸）。
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                for span in spans:
+                    f.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+        except OSError:
+            pass  # 追蹤失敗不影響主流程
+
+
+class OtlpHttpSpanExporter:
+    """
+    以 OTLP/HTTP JSON 格式送到 Collector 的 /v1/traces；由單一背景執行緒依序送出，不佔用請求時間。
+    待送佇列有上限：Collector 太慢而佇列已滿時直接丟棄新的一批（計入 stats["dropped"]），
+    不會無限累積執行緒或記憶體；程序結束前以 flush 等待已排入的送完（最多 TRACE_OTLP_FLUSH_TIMEOUT_SEC 秒）。
+    """
+
+    def __init__(self, endpoint: str, service_name: str, timeout: float = 3.0,
+                 max_queue: int = TRACE_OTLP_MAX_QUEUE):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.timeout = timeout
+        self._queue: "queue.Queue[bytes]" = queue.Queue(maxsize=max(1, max_queue))
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # 已排入但尚未送完（成功或失敗）的批數；歸零時喚醒 flush() 的等待者
+        self._pending = 0
+        self._idle = threading.Condition()
+        self.stats = {"exported": 0, "failed": 0, "dropped": 0}
+
+    @staticmethod
+    def _attr(key: str, value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def _to_otlp(self, spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+        otlp_spans = []
+        for span in spans:
+            attrs = {
+                "node.class": span.get("node_class"),
+                "wall_ms": span["wall_ms"],
+                "cpu_ms": span["cpu_ms"],
+                "context.input_size": span["input_size"],
+                "context.output_size": span["output_size"],
+                **span.get("attributes", {}),
+            }
+            otlp_span = {
+                "traceId": span["trace_id"],
+                "spanId": span["span_id"],
+                "name": span["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(span["start_ns"]),
+                "endTimeUnixNano": str(span["end_ns"]),
+                "attributes": [self._attr(k, v) for k, v in attrs.items() if v is not None],
+                "status": {"code": 2, "message": span["error"]} if span.get("error") else {"code": 1},
+            }
+            if span.get("parent_span_id"):
+                otlp_span["parentSpanId"] = span["parent_span_id"]
+            otlp_spans.append(otlp_span)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [self._attr("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": "golden_bonus.pipeline"}, "spans": otlp_spans}],
+            }]
+        }
+
+    def _post(self, payload: bytes) -> None:
+        request = urllib.request.Request(
+            self.url, data=payload, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        try:
+            urllib.request.urlopen(request, timeout=self.timeout).close()
+            self.stats["exported"] += 1
+        except Exception:
+            self.stats["failed"] += 1  # Collector 不在線時直接丟棄，不影響主流程
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        payload = json.dumps(self._to_otlp(spans), default=str).encode("utf-8")
+        self._ensure_started()
+        with self._idle:
+            self._pending += 1
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            with self._idle:
+                self.stats["dropped"] += 1
+            self._done()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待已排入的 span 送完；timeout 秒內未完成回傳 False。
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def _done(self) -> None:
+        with self._idle:
+            self._pending -= 1
+            if self._pending <= 0:
+                self._idle.notify_all()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._thread is None:
+                atexit.register(self.flush, TRACE_OTLP_FLUSH_TIMEOUT_SEC)
+            self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            payload = self._queue.get()
+            try:
+                self._post(payload)
+            finally:
+                self._done()
+
+
+class Tracer:
+    """
+    收集一次 Pipeline 執行的所有 span，run 結束時一次交給各 exporter。
+    """
+
+    def __init__(self, exporters: Optional[List[Any]] = None):
+        self.exporters = list(exporters or [])
+
+    def start_trace(self, name: str, context: Dict[str, Any]) -> Dict[str, Any]:
+        return self._start_span(name, None, uuid.uuid4().hex, None, context)
+
+    def start_span(self, node: Any, parent: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        return self._start_span(node.name, type(node).__name__, parent["trace_id"], parent["span_id"], context)
+
+    @staticmethod
+    def _start_span(name, node_class, trace_id, parent_span_id, context) -> Dict[str, Any]:
+        return {
+            "trace_id": trace_id,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_span_id": parent_span_id,
+            "name": name,
+            "node_class": node_class,
+            "start_ns": time.time_ns(),
+            "_wall": time.perf_counter(),
+            "_cpu": time.thread_time(),
+            "input_size": estimate_size(context),
+            "attributes": {},
+            "error": None,
+            "children": [],
+        }
+
+    @staticmethod
+    def end_span(span: Dict[str, Any], context: Dict[str, Any], error: Optional[BaseException] = None,
+                 attributes: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        span["wall_ms"] = round((time.perf_counter() - span.pop("_wall")) * 1000, 3)
+        span["cpu_ms"] = round((time.thread_time() - span.pop("_cpu")) * 1000, 3)
+        span["end_ns"] = time.time_ns()
+        span["output_size"] = estimate_size(context)
+        if attributes:
+            span["attributes"].update(attributes)
+        if error is not None:
+            span["error"] = f"{type(error).__name__}: {error}"
+        return span
+
+    def finish_trace(self, root: Dict[str, Any], context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        結束整次執行的 span，並把 [root, *children] 交給所有 exporter；回傳攤平後的 span 清單。
+        """
+        children = root.pop("children")
+        self.end_span(root, context, attributes={"nodes": len(children)})
+        for child in children:
+            child.pop("children", None)
+        spans = [root, *children]
+        for exporter in self.exporters:
+            try:
+                exporter.export(spans)
+            except Exception:
+                pass
+        return spans
+
+
+def get_default_tracer() -> Optional[Tracer]:
+    """
+    依設定（或環境變數 GOLDEN_TRACE_EXPORTERS / OTEL_EXPORTER_OTLP_ENDPOINT）建立預設 Tracer；
+    沒有啟用任何 exporter 時回傳 None（Pipeline 完全不做追蹤）。
+    """
+    names = os.getenv("GOLDEN_TRACE_EXPORTERS")
+    selected = [n.strip() for n in names.split(",")] if names is not None else list(TRACE_EXPORTERS)
+    exporters: List[Any] = []
+    if "jsonl" in selected:
+        # 相對路徑以專案目錄為準（與 KB_ARTIFACT_PATH 相同），不因啟動目錄不同而四散
+        exporters.append(JsonlSpanExporter(_PROJECT_DIR / os.getenv("GOLDEN_TRACE_JSONL_PATH", TRACE_JSONL_PATH)))
+    if "otlp" in selected:
+        endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", TRACE_OTLP_ENDPOINT)
+        exporters.append(OtlpHttpSpanExporter(endpoint, os.getenv("OTEL_SERVICE_NAME", TRACE_SERVICE_NAME)))
+    return Tracer(exporters) if exporters else None
@@ -9,21 +9,48 @@ current_dir = Path(__file__).parent.absolute()
 if str(current_dir) not in sys.path:
     sys.path.insert(0, str(current_dir))
 
+# 啟動匯入計時：先於其他專案模組安裝（utils.lazy 只用標準函式庫），連 config.settings 的匯入也計入；
+# 第一次執行完成時輸出各模組匯入耗時並移除計時器（見 utils/lazy.py），設定關閉時立即移除
+from utils.lazy import install_import_timer, report_startup_once, uninstall_import_timer
+install_import_timer()
+from config.settings import STARTUP_IMPORT_REPORT, STARTUP_IMPORT_REPORT_TOP
+if not STARTUP_IMPORT_REPORT:
+    uninstall_import_timer()
+
 import streamlit as st
-from nodes.advisor import AdvisorNode
 from core.pipeline import Pipeline
-from config.settings import PAGE_TITLE, PAGE_HEADER, PIPELINE_CACHE_VERSION
+from config.settings import (
+    PAGE_TITLE,
+    PAGE_HEADER,
+    PIPELINE_CACHE_VERSION,
+    HISTORY_PAGE_SIZE,
+    HISTORY_RENDER_WINDOW,
+)
+from utils.chat_flow import (
+    COMPANY_INFO_RECEIPT_MSG,
+    chat_context as build_chat_context,
+    company_info_followup_context,
+    looks_like_company_report_payload,
+    prepare_llm_history,
+    record_assistant_turn,
+    record_company_receipt,
+    record_error_turn,
+    record_user_turn,
+    turn_metadata,
+)
 
-def looks_like_company_report_payload(text: str) -> bool:
+def render_ai_response(result_context: dict, fallback: str) -> str:
     """
-    判斷使用者是否貼上「結構化公司補充資訊」。
-    嚴格但不依賴 report: 開頭：只要包含 company: 且同時包含其他常見區塊即可。
+    顯示 Pipeline 的回覆：有串流就用 st.write_stream 邊收邊顯示，否則（本地回覆/錯誤）直接顯示整段。
+    回傳完整回覆文字，供寫入對話歷史與 Supabase。
     """
-    t = (text or "").lower()
-    if "company" not in t:
-        return False
-    blocks = ["financials", "bonus", "departments", "growthengine", "warnings", "recommendations"]
-    return any(b in t for b in blocks)
+    stream = result_context.pop("ai_response_stream", None)
+    if stream is not None:
+        streamed = st.write_stream(stream)
+        return result_context.get("ai_response") or streamed or fallback
+    ai_response = result_context.get("ai_response", fallback)
+    st.markdown(ai_response)
+    return ai_response
 
 # 1. 頁面設定
 st.set_page_config(page_title=PAGE_TITLE, layout="wide")
@@ -61,6 +88,14 @@ with st.sidebar:
 
         if st.button("清除快取 / 重建 Pipeline", use_container_width=True):
             st.cache_resource.clear()
+            from utils.gemini_client import clear_model_cache
+            clear_model_cache()
+            from utils.conversation_storage import reset_supabase_clients
+            reset_supabase_clients()
+            from utils.response_cache import get_response_cache
+            response_cache = get_response_cache()
+            if response_cache is not None:
+                response_cache.clear()
             st.rerun()
     except Exception as e:
         st.warning(f"無法載入連線檢查：{str(e)}")
@@ -91,173 +126,174 @@ if "_session_id" not in st.session_state:
 if "messages" not in st.session_state:
     st.session_state.messages = []  # 用來存對話歷史
 
-# 初始化 Supabase 對話記錄：從資料庫載入歷史對話
-if "conversations_loaded" not in st.session_state:
+# 側邊欄：本會話用量（token / 成本 / 延遲；跨會話與每日報表：python -m utils.metering）
+# 先佔位，這一輪的回覆記帳後再重畫一次，數字才不會落後一則
+with st.sidebar:
+    usage_placeholder = st.empty()
+
+
+def render_session_usage() -> None:
+    session_id = st.session_state.get("_session_id")
+    if not session_id:
+        return  # 沒有 session_id 時 report 會彙總所有會話，不顯示
     try:
-        from utils.conversation_storage import load_conversation_history
-        session_id = st.session_state._session_id
-        # 嘗試載入歷史對話（最多 50 條，用於顯示）
-        # 使用 try-except 確保即使 Supabase 未配置也不會影響應用啟動
-        loaded_messages = load_conversation_history(session_id, limit=50)
-        if loaded_messages and len(loaded_messages) > 0:
-            st.session_state.messages = loaded_messages
-        st.session_state.conversations_loaded = True
-    except Exception as e:
-        # 如果 Supabase 未配置或載入失敗，使用空列表，不影響應用啟動
-        # 在調試模式下可以輸出錯誤（但在生產環境中靜默失敗）
-        st.session_state.conversations_loaded = True
+        from utils.metering import get_usage_ledger
+        session_usage = get_usage_ledger().report(by="all", session_id=session_id).get("all")
+    except Exception:
+        return
+    if not session_usage:
+        return
+    with usage_placeholder.container():
+        st.markdown("### 📊 本次會話用量")
+        st.caption(
+            f"{session_usage['requests']} 次回覆（快取命中 {session_usage['cache_hits']} 次）｜"
+            f"輸入 {session_usage['tokens_in']} / 輸出 {session_usage['tokens_out']} token｜"
+            f"約 ${session_usage['cost_usd']:.4f}｜平均 {session_usage['latency_ms_avg']} ms"
+        )
+
+
+render_session_usage()
+
+
+def load_older_history() -> None:
+    """
+    以 session_state 中的游標往前載入一頁歷史對話，接在目前訊息的前面（已載入的頁面不會重新查詢）。
+    """
+    try:
+        from utils.conversation_storage import load_conversation_page
+        page = load_conversation_page(
+            st.session_state._session_id,
+            limit=HISTORY_PAGE_SIZE,
+            before=st.session_state.history_cursor,
+        )
+    except Exception:
+        # 如果 Supabase 未配置或載入失敗，維持現有訊息，不影響應用
+        st.session_state.history_has_more = False
+        return
+    if page["messages"]:
+        from utils.summarizer import restore_summary_state, shift_summary_state
+        if st.session_state.history_cursor is None:
+            # 第一頁：由最新一則帶摘要的記錄還原對話摘要
+            st.session_state.history_summary = restore_summary_state(page["messages"], page["metadata"])
+        else:
+            # 更早的頁面接在前面：摘要邊界跟著位移；進行中的背景摘要以舊邊界計算，直接作廢（下一次回覆後重排）
+            st.session_state.history_summary = shift_summary_state(
+                st.session_state.history_summary, len(page["messages"])
+            )
+            st.session_state.history_fold_job = None
+        st.session_state.messages = page["messages"] + st.session_state.messages
+        st.session_state.history_cursor = page["cursor"]
+    st.session_state.history_has_more = page["has_more"]
 
-# 精實化：限制送進 LLM 的歷史訊息數量，避免 token 膨脹造成延遲與成本上升
-MAX_HISTORY_MESSAGES = 10
+
+# 初始化 Supabase 對話記錄：只在 session 第一次執行時載入最新一頁，之後的 rerun 直接使用 session_state
+for _key, _default in (
+    ("history_cursor", None),
+    ("history_has_more", False),
+    ("history_render_count", HISTORY_RENDER_WINDOW),
+    ("history_summary", {"summary": "", "covered": 0}),
+    ("history_fold_job", None),
+):
+    if _key not in st.session_state:
+        st.session_state[_key] = _default
+
+if "conversations_loaded" not in st.session_state:
+    load_older_history()
+    st.session_state.conversations_loaded = True
 
 # 3. 初始化 Pipeline（只包含 AdvisorNode）
+# AdvisorNode（連同提示詞/知識庫/快取等模組）延到第一次提問才載入，冷啟動先把頁面與歷史對話顯示出來
 @st.cache_resource
 def get_pipeline(_cache_version: str):
+    from nodes.advisor import AdvisorNode
     pipe = Pipeline()
     pipe.add_node(AdvisorNode("Advisor"))
     return pipe
 
-pipeline = get_pipeline(PIPELINE_CACHE_VERSION)
-
 # 4. 對話機器人介面
 st.markdown("---")
 st.subheader("💬 年終獎金顧問對話機器人")
 st.info("💡 **使用提示**：您可以詢問任何關於年終獎金發放策略的問題，AI 顧問會根據專業知識庫為您提供建議。")
 
-# 顯示歷史對話
-for message in st.session_state.messages:
+# 顯示歷史對話（只渲染最後 history_render_count 則；較早的訊息先從 session_state 展開，用完才往資料庫取下一頁）
+hidden_count = max(0, len(st.session_state.messages) - st.session_state.history_render_count)
+if hidden_count or st.session_state.history_has_more:
+    if st.button("⬆️ 載入較早訊息", key="load_older_history"):
+        if hidden_count < HISTORY_PAGE_SIZE and st.session_state.history_has_more:
+            load_older_history()
+        st.session_state.history_render_count += HISTORY_PAGE_SIZE
+        st.rerun()
+
+for message in st.session_state.messages[hidden_count:]:
     with st.chat_message(message["role"], avatar="🤖" if message["role"] == "assistant" else "👤"):
         st.markdown(message["content"])
 
+# 頁面已可互動：輸出啟動匯入報告（每個程序只輸出一次）
+report_startup_once(top=STARTUP_IMPORT_REPORT_TOP)
+
 # 處理用戶輸入
 if prompt := st.chat_input("請輸入您的問題或是貼上參考資訊... (例如：公司報告、問卷結果、討論紀錄等)"):
     # A) 若使用者貼的是公司補充資訊：先儲存，避免立刻進入顧問回覆
     if looks_like_company_report_payload(prompt):
         st.session_state.company_context_text = prompt
-        receipt_msg = "已收到企業補充資訊，後續提問將以此作為背景資料。以下先提供一段依知識庫框架的原理解讀。"
         with st.chat_message("assistant", avatar="🤖"):
-            st.markdown(receipt_msg)
-        st.session_state.messages.append({"role": "assistant", "content": receipt_msg})
-        
-        # 保存到 Supabase
-        try:
-            from utils.conversation_storage import save_conversation
-            session_id = st.session_state._session_id
-            save_conversation(session_id, "assistant", receipt_msg, {"intent": "company_info_receipt"})
-        except Exception:
-            pass  # 靜默失敗，不影響主流程
+            st.markdown(COMPANY_INFO_RECEIPT_MSG)
+        # 加入對話並保存到 Supabase
+        record_company_receipt(st.session_state, st.session_state._session_id)
 
         # 立即輸出回饋：用「原理解讀模式」解說補充資訊（不需使用者再問一次）
-        auto_context = {
-            "current_intent": "CHAT_FOLLOWUP",
-            "latest_user_question": "請用知識庫框架解說這份企業補充資訊的推導與解讀，全中文，不要給建議，不要反問。",
-            "company_context_text": st.session_state.company_context_text,
-            "history": [
-                {"role": msg["role"], "content": msg["content"]}
-                for msg in st.session_state.messages
-            ],
-        }
+        history, conversation_summary = prepare_llm_history(st.session_state, st.session_state.messages)
+        auto_context = company_info_followup_context(
+            st.session_state.company_context_text, history, conversation_summary
+        )
         with st.chat_message("assistant", avatar="🤖"):
             with st.spinner("AI 思考中..."):
                 try:
-                    result_context = pipeline.run(auto_context)
-                    ai_response = result_context.get("ai_response", "（已收到補充資訊，但暫時無法生成解說內容）")
-                    st.markdown(ai_response)
-                    st.session_state.messages.append({"role": "assistant", "content": ai_response})
-                    
-                    # 保存到 Supabase
-                    try:
-                        from utils.conversation_storage import save_conversation
-                        session_id = st.session_state._session_id
-                        save_conversation(session_id, "assistant", ai_response, {
-                            "intent": "CHAT_FOLLOWUP",
-                            "company_context": "present"
-                        })
-                    except Exception:
-                        pass  # 靜默失敗，不影響主流程
+                    result_context = get_pipeline(PIPELINE_CACHE_VERSION).run(auto_context)
+                    ai_response = render_ai_response(result_context, "（已收到補充資訊，但暫時無法生成解說內容）")
+                    # 加入對話、保存到 Supabase（附摘要/用量），必要時排程背景摘要
+                    record_assistant_turn(
+                        st.session_state, st.session_state._session_id, ai_response,
+                        turn_metadata(auto_context), result_context,
+                    )
+                    render_session_usage()
                 except Exception as e:
                     error_msg = f"⚠️ 系統錯誤：{str(e)}"
                     st.error(error_msg)
-                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
-                    
-                    # 保存錯誤訊息到 Supabase
-                    try:
-                        from utils.conversation_storage import save_conversation
-                        session_id = st.session_state._session_id
-                        save_conversation(session_id, "assistant", error_msg, {"error": True})
-                    except Exception:
-                        pass
+                    record_error_turn(st.session_state, st.session_state._session_id, error_msg)
         st.stop()
 
-    # 1. 將用戶訊息加入對話歷史
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    
-    # 1.5. 保存用戶訊息到 Supabase
-    try:
-        from utils.conversation_storage import save_conversation
-        session_id = st.session_state._session_id
-        save_conversation(session_id, "user", prompt, {
-            "intent": "CHAT",
-            "company_context": "present" if st.session_state.get("company_context_text") else "absent"
-        })
-    except Exception:
-        pass  # 靜默失敗，不影響主流程
+    # 1. 將用戶訊息加入對話歷史並保存到 Supabase
+    record_user_turn(st.session_state, st.session_state._session_id, prompt)
     
     # 2. 顯示用戶訊息
     with st.chat_message("user"):
         st.markdown(prompt)
     
-    # 3. 準備聊天用的 context
-    chat_context = {
-        "current_intent": "CHAT",
-        "latest_user_question": prompt,
-        "company_context_text": st.session_state.get("company_context_text", ""),
-        "history": [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in st.session_state.messages[-(MAX_HISTORY_MESSAGES + 1):-1]  # 保留最近 N 則，排除最後一條（剛加入的用戶訊息）
-        ]
-    }
+    # 3. 準備聊天用的 context（較舊的歷史已併入摘要，排除最後一條剛加入的用戶訊息）
+    history, conversation_summary = prepare_llm_history(st.session_state, st.session_state.messages[:-1])
+    chat_context = build_chat_context(
+        prompt, st.session_state.get("company_context_text", ""), history, conversation_summary
+    )
     
     # 4. 執行 AdvisorNode
     with st.chat_message("assistant", avatar="🤖"):
         with st.spinner("AI 思考中..."):
             try:
                 # 執行聊天 Pipeline
-                result_context = pipeline.run(chat_context)
+                result_context = get_pipeline(PIPELINE_CACHE_VERSION).run(chat_context)
                 
-                # 5. 顯示 AI 回應
-                ai_response = result_context.get("ai_response", "抱歉，我無法回答這個問題。")
-                st.markdown(ai_response)
+                # 5. 顯示 AI 回應（串流：第一行安全內容產生後就開始顯示）
+                ai_response = render_ai_response(result_context, "抱歉，我無法回答這個問題。")
                 
-                # 6. 將 AI 回應加入對話歷史
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": ai_response
-                })
-                
-                # 7. 保存 AI 回應到 Supabase
-                try:
-                    from utils.conversation_storage import save_conversation
-                    session_id = st.session_state._session_id
-                    save_conversation(session_id, "assistant", ai_response, {
-                        "intent": chat_context.get("current_intent", "CHAT"),
-                        "company_context": "present" if chat_context.get("company_context_text") else "absent"
-                    })
-                except Exception:
-                    pass  # 靜默失敗，不影響主流程
+                # 6. 加入對話歷史、保存到 Supabase；歷史超過預算時在背景摘要（下一輪才用，不佔這一輪的等待時間）
+                record_assistant_turn(
+                    st.session_state, st.session_state._session_id, ai_response,
+                    turn_metadata(chat_context), result_context,
+                )
+                render_session_usage()
                 
             except Exception as e:
                 error_msg = f"⚠️ 系統錯誤：{str(e)}"
                 st.error(error_msg)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": error_msg
-                })
-                
-                # 保存錯誤訊息到 Supabase
-                try:
-                    from utils.conversation_storage import save_conversation
-                    session_id = st.session_state._session_id
-                    save_conversation(session_id, "assistant", error_msg, {"error": True})
-                except Exception:
-                    pass
+                record_error_turn(st.session_state, st.session_state._session_id, error_msg)
@@ -1,105 +1,78 @@
 # nodes/advisor.py
 from core.base_node import BaseNode
-from config.settings import PROMPT_TEMPLATES  # 從配置中心讀取提示詞模板
-from assets.knowledge import BONUS_KB_TEXT
-from typing import Dict, Any
+from config.settings import PROMPT_TEMPLATES, ADVISOR_KEYWORDS  # 從配置中心讀取提示詞模板與觸發詞
+from config.settings import KNOWLEDGE_RETRIEVAL_CONTEXT_TERMS
+from assets.knowledge import retrieve_knowledge_chunks_text
+from utils.metering import meter_request
+from utils.prompt_builder import build_prompt
+from utils.keyword_router import KeywordRouter
+from utils.response_cache import context_hash, get_response_cache
+from typing import Dict, Any, Iterable, Iterator
 
-def _needs_human_escalation(question: str, response: str) -> tuple[bool, str]:
+import re
+import time
+
+# 所有觸發詞表編譯成單一比對器（只在 import 時建立一次）
+ADVISOR_ROUTER = KeywordRouter(ADVISOR_KEYWORDS)
+_PRO_CATEGORIES = frozenset(c for c in ADVISOR_KEYWORDS if c.startswith("pro_"))
+
+def _needs_human_escalation(question: str, response: str, question_hits: frozenset | None = None,
+                            refusal: bool | None = None) -> tuple[bool, str]:
     """
     最小保守判斷：若問題可能涉及法規/稅務/勞資等高風險領域，或模型回覆明顯拒答/空泛，
     則建議諮詢真人專業顧問。回傳 (是否需要, 建議諮詢方向文字)。
+    question_hits：呼叫端若已對（去空白的）問題跑過 ADVISOR_ROUTER，可直接傳入避免重掃。
+    refusal：呼叫端若已在後處理時偵測過回覆的拒答特徵（_ResponseFilter），可直接傳入避免重掃。
     """
-    q = (question or "").replace(" ", "")
-    r = (response or "")
-
     # 1) 明顯拒答/空泛
-    refusal_markers = [
-        "抱歉，我無法回答", "我無法回答", "不能回答", "無法提供", "我不知道",
-        "無法判斷", "不確定", "資訊不足", "超出我的範圍",
-    ]
-    if any(m in r for m in refusal_markers):
+    if refusal is None:
+        refusal = ADVISOR_ROUTER.contains("refusal", response or "")
+    if refusal:
         return (True, "目前回覆有限，建議補充資訊或諮詢真人專業以避免誤判。")
 
     # 2) 高風險/專業領域關鍵字（先回答能回答的，再建議詢問）
-    pro_keywords = {
-        "law_hr": ["勞基法", "勞資", "解雇", "資遣", "加班", "工時", "特休", "最低工資", "勞健保", "勞退"],
-        "tax_accounting": ["稅", "扣繳", "申報", "所得稅", "營所稅", "二代健保", "費用化", "分錄", "審計", "財報"],
-        "legal": ["契約", "合約", "法務", "訴訟", "違法", "合規"],
-        "comp": ["薪酬制度", "股票", "期權", "ESOP", "分紅", "獎酬"],
-    }
-    if any(k in q for ks in pro_keywords.values() for k in ks):
+    if question_hits is None:
+        question_hits = ADVISOR_ROUTER.match((question or "").replace(" ", ""))
+    if question_hits & _PRO_CATEGORIES:
         return (True, "此題牽涉法規/稅務/勞資或薪酬制度細節，建議由真人專業顧問確認。")
 
     return (False, "")
 
-def _contains_questions(text: str) -> bool:
-    """
-    偵測回覆是否包含反問/問句特徵（保守判斷）。
-    """
-    t = (text or "")
-    if not t:
-        return False
-    markers = ["？", "?", "請問", "能否", "可以提供", "可否", "方便提供"]
-    return any(m in t for m in markers)
-
 def _looks_like_report_payload(text: str) -> bool:
     """
     嚴格判斷：只有當輸入明顯是「結構化公司資料貼文」時才進入「原理解讀模式」。
     注意：使用者可能不會帶 report: 開頭，可能直接從 company:/financials: 開始。
     """
+    # 嚴格：至少出現 company 且同時出現 1 個以上常見區塊（financials/bonus/departments/growthEngine/warnings/recommendations）
     t = (text or "").lower()
-    # 嚴格：至少出現 company: 且同時出現 1 個以上常見區塊（financials/bonus/departments/growthEngine/warnings/recommendations）
-    has_company_block = "company" in t
-    other_blocks = [
-        "financials",
-        "bonus",
-        "departments",
-        "growthengine",
-        "warnings",
-        "recommendations",
-    ]
-    has_any_other = any(b in t for b in other_blocks)
-    return has_company_block and has_any_other
-
-def _remove_questions(text: str) -> str:
-    """
-    最小保守修正：移除含問句標點的行，並把常見反問句型替換成「下一步建議」陳述句。
-    目標是保證 UI 不出現反問，而不是做完美語言改寫。
-    """
-    if not text:
-        return text
+    return ADVISOR_ROUTER.contains("report_company", t) and ADVISOR_ROUTER.contains("report_block", t)
 
-    lines = text.splitlines()
-    kept: list[str] = []
-    for line in lines:
-        if "？" in line or "?" in line:
-            continue
-        kept.append(line)
-
-    cleaned = "\n".join(kept).strip()
-    # 額外處理：若殘留「請問/能否」等但不含問號，改寫成指令式下一步
-    cleaned = cleaned.replace("請問", "下一步建議：")
-    cleaned = cleaned.replace("能否", "下一步建議：")
-    cleaned = cleaned.replace("可否", "下一步建議：")
-    cleaned = cleaned.replace("可以提供", "下一步建議：提供")
-    cleaned = cleaned.replace("方便提供", "下一步建議：提供")
-    return cleaned
-
-def _strip_internal_refs(text: str) -> str:
+# 企業補充資訊中可用於檢索的詞：英文欄位名（hr_cost、grossMargin…）與中文文字值；數字不參與
+_CONTEXT_TERM_RE = re.compile(r"[A-Za-z][A-Za-z_]*|[\u3400-\u9fff\uf900-\ufaff]+")
+
+def _company_context_query(company_context_text: str, question: str) -> str:
     """
-    保底清理：移除知識庫內部代碼（C_XXXX / R_XXXX 等）。
+    已載入企業補充資訊時的檢索查詢：補充資訊的欄位名與文字值（去重、依出現順序、限制詞數）接上問題，
+    讓每份報告依其內容（例如人事成本警示、研發驅動）檢索到不同的知識塊。
     """
-    if not text:
-        return text
-
-    lines = text.splitlines()
-    out: list[str] = []
-    for line in lines:
-        if "C_" in line or "R_" in line:
-            # 移除包含內部代碼的整行（避免露出 chunk id/規則代碼）
+    terms: list[str] = []
+    seen: set[str] = set()
+    for term in _CONTEXT_TERM_RE.findall(company_context_text or ""):
+        key = term.lower()
+        if key in seen:
             continue
-        out.append(line)
-    return "\n".join(out).strip()
+        seen.add(key)
+        terms.append(term)
+        if len(terms) >= KNOWLEDGE_RETRIEVAL_CONTEXT_TERMS:
+            break
+    return " ".join(terms + [question or ""]).strip()
+
+FOLLOWUP_MARKERS = (
+    "### 原理總覽",
+    "### 這份報告如何推導",
+    "### 如何解讀這份結果",
+    "### 還可以回答的問題",
+)
 
 def _ensure_followup_format(text: str) -> str:
     """
@@ -119,13 +92,7 @@ def _ensure_followup_format(text: str) -> str:
             "- 增長引擎如何映射到部門權重（解讀分配理由）\n"
         )
 
-    required_markers = [
-        "### 原理總覽",
-        "### 這份報告如何推導",
-        "### 如何解讀這份結果",
-        "### 還可以回答的問題",
-    ]
-    if all(m in text for m in required_markers):
+    if all(m in text for m in FOLLOWUP_MARKERS):
         return text
 
     # 若模型沒有依格式輸出：用最小包裝補齊標題，並把原文放進「解讀」段落避免資訊流失
@@ -146,41 +113,323 @@ def _ensure_followup_format(text: str) -> str:
         "- 增長引擎如何映射到部門權重（解讀分配理由）\n"
     )
 
+def _escalation_block(note: str) -> str:
+    """
+    「建議諮詢真人專業」段落（接在已 rstrip 的回覆後面）。
+    """
+    return (
+        "\n\n"
+        + "### 建議諮詢真人專業\n"
+        + f"- {note}\n"
+        + "- 若涉及稅務/扣繳/費用化：建議詢問會計師或稅務顧問（帶上薪資結構、獎金發放規則、員工清冊）。\n"
+        + "- 若涉及勞資/工時/加班/勞退勞健保：建議詢問勞資顧問或律師（帶上勞動契約、出勤/加班制度、薪資項目）。\n"
+        + "- 若涉及制度設計與留才：建議詢問薪酬顧問（帶上績效制度、職等/職族、過往流動率與關鍵人才名單）。\n"
+    )
+
+# ==================== 單次掃描後處理 ====================
+# 把原本逐步處理的「移除內部代碼行 → 有問句特徵時移除問句並改寫反問句型 → _ensure_followup_format 的標題檢查
+# → _needs_human_escalation 的拒答偵測」合併成一次逐行處理：只分行、接回一次，
+# 拒答特徵在後處理時就記下，補「建議諮詢真人」段落時不必再掃一次全文。
+# 比對一律用 str 的 in/replace 與純字面正規表示式（都在 C 層完成），不在 Python 層逐一處理命中位置。
+# 整段回覆與串流共用同一個過濾器。逐步處理的參考實作在 benchmarks/reference.py，
+# tests/test_postprocess_equivalence.py 以隨機回覆對照兩者輸出相同。
+
+_QUESTION_REWRITES = [
+    ("請問", "下一步建議："),
+    ("能否", "下一步建議："),
+    ("可否", "下一步建議："),
+    ("可以提供", "下一步建議：提供"),
+    ("方便提供", "下一步建議：提供"),
+]
+_REFUSAL_RE = re.compile("|".join(re.escape(k) for k in ADVISOR_KEYWORDS["refusal"]))
+# followup 補上的框架文字本身是否含拒答特徵（固定文字，import 時判斷一次）
+_FOLLOWUP_FRAME_REFUSAL = bool(_REFUSAL_RE.search(_ensure_followup_format("") + _ensure_followup_format("\x00")))
+
+
+def _keep_line(line: str) -> bool:
+    # 丟行條件：內部代碼或問號
+    return "C_" not in line and "R_" not in line and "？" not in line and "?" not in line
+
+
+class _ResponseFilter:
+    """
+    後處理過濾器：丟掉含內部代碼或問號的行、把反問句型改寫成「下一步建議」，
+    同時記下出現過的 followup 標題與回覆是否有拒答特徵（之後不必再掃一次全文）。
+    逐步處理版只在回覆含問號或改寫句型（benchmarks/reference.py 的 QUESTION_MARKERS）時才改寫：
+    沒有任何改寫句型時改寫本來就不會生效，因此一律套用結果相同。關鍵字都不跨行，逐行處理與整段處理結果相同；
+    被丟掉的行裡的標題/拒答特徵不算數。
+    """
+    __slots__ = ("headings", "refusal")
+
+    def __init__(self):
+        self.headings: set[str] = set()
+        self.refusal = False
+
+    def scan(self, lines: list[str]) -> str:
+        """
+        處理已分好的行（不含換行），回傳留下的行改寫後以 \n 接回的結果。
+        """
+        text = "\n".join([line for line in lines if _keep_line(line)])
+        for old, new in _QUESTION_REWRITES:
+            if old in text:
+                text = text.replace(old, new)
+        self.headings.update(m for m in FOLLOWUP_MARKERS if m in text)
+        self.refusal = self.refusal or _REFUSAL_RE.search(text) is not None
+        return text
+
+    def line(self, line: str) -> str | None:
+        """
+        處理一行（不含換行）；應丟掉時回傳 None。
+        """
+        return self.scan([line]) if _keep_line(line) else None
+
+    def filter_lines(self, lines: Iterable[str]) -> Iterator[str]:
+        for line in lines:
+            out = self.line(line)
+            if out is not None:
+                yield out
+
+
+def _postprocess_response(text: str, followup: bool = False) -> tuple[str, bool]:
+    """
+    整段回覆的單次後處理，結果與逐步處理的參考實作（benchmarks/reference.py 的 postprocess_chain）相同；
+    另回傳回覆是否有拒答特徵（傳給 _needs_human_escalation）。
+    """
+    if not text:
+        if not followup:
+            return text, False
+        framed = _ensure_followup_format(text)
+        return framed, bool(_REFUSAL_RE.search(framed))
+
+    line_filter = _ResponseFilter()
+    # 與 splitlines 的分行規則一致（\r\n、\r 等都視為換行）
+    cleaned = line_filter.scan(text.splitlines()).strip()
+    refusal = line_filter.refusal
+    if followup and len(line_filter.headings) < len(FOLLOWUP_MARKERS):
+        cleaned = _ensure_followup_format(cleaned)
+        refusal = refusal or _FOLLOWUP_FRAME_REFUSAL
+    return cleaned, refusal
+
+# ==================== 串流後處理（逐行過濾） ====================
+# 與整段後處理使用同一個 _ResponseFilter，以「完整的一行」為單位處理，讓第一行安全內容一出現就能送到 UI。
+
+def _iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    把模型的任意切段重新切成完整行（不含換行符號）；最後不完整的一行在串流結束時送出。
+    """
+    buffer = ""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        # "\r\n" 可能被切在兩段之間：結尾是 \r 時先留著，等下一段再判斷
+        pending = buffer[-1] == "\r"
+        parts = (buffer[:-1] if pending else buffer).splitlines(keepends=True)
+        buffer = "\r" if pending else ""
+        if parts and parts[-1] == parts[-1].splitlines()[0]:
+            buffer = parts.pop() + buffer
+        for part in parts:
+            yield part.splitlines()[0]
+    if buffer:
+        yield from buffer.splitlines()
+
+def _join_stripped(lines: Iterable[str]) -> Iterator[str]:
+    """
+    串流版的 "\n".join(lines).strip()：前導空白行直接丟掉，
+    中間/結尾的空白先暫存，等到下一行實際內容出現才一起送出（結尾空白因此自然被去掉）。
+    """
+    held = ""
+    started = False
+    for line in lines:
+        if not started:
+            if not line.strip():
+                continue
+            line = line.lstrip()
+            started = True
+        elif not line.strip():
+            held += "\n" + line
+            continue
+        else:
+            held += "\n"
+        body = line.rstrip()
+        yield held + body
+        held = line[len(body):]
+
+def _stream_followup_format(pieces: Iterable[str], headings: set[str] | None = None) -> Iterator[str]:
+    """
+    串流版的 _ensure_followup_format：
+    - 開頭就是「### 原理總覽」→ 視為模型有照格式輸出，直接轉送；結束時若缺標題，補上空段落
+    - 開頭不是 → 先送出框架前段，原文作為「如何解讀這份結果」段落，結束時補上後段
+    （整段版能在看完全文後才決定，串流版只能依開頭判斷，這是兩者唯一的差異。）
+    headings：pieces 來自 _ResponseFilter 時傳入它的 headings，結束時直接查，不必累積全文再掃。
+    """
+    required_markers = FOLLOWUP_MARKERS
+    head = ""
+    iterator = iter(pieces)
+    for piece in iterator:
+        head += piece
+        if len(head) >= len(required_markers[0]) or "\n" in head:
+            break
+
+    if not head:
+        yield _ensure_followup_format("")
+        return
+
+    if head.startswith(required_markers[0]):
+        seen = [head]
+        yield head
+        for piece in iterator:
+            if headings is None:
+                seen.append(piece)
+            yield piece
+        if headings is None:
+            text = "".join(seen)
+            headings = {marker for marker in required_markers if marker in text}
+        for marker in required_markers:
+            if marker not in headings:
+                yield f"\n\n{marker}\n（內容暫缺）"
+        return
+
+    wrapped = _ensure_followup_format("\x00")
+    prefix, suffix = wrapped.split("\x00", 1)
+    yield prefix + head
+    yield from iterator
+    yield suffix
+
+def _stream_advisor_response(
+    context: Dict[str, Any],
+    system_prompt: str,
+    user_msg: str,
+    history: list,
+    intent: str,
+    latest_q: str,
+    cached: str | None = None,
+    cache_key: tuple | None = None,
+) -> Iterator[str]:
+    """
+    呼叫串流 API 並套用逐行後處理；串流結束後把完整回覆寫回 context["ai_response"]。
+    cached：命中回覆快取時的（已後處理）回覆，直接送出不呼叫模型；
+    cache_key：未命中時，串流正常結束後以此鍵寫入快取。
+    用量（含首段延遲）在串流結束後寫入 context["usage"]。
+    """
+    started = time.perf_counter()
+    ttft_ms = None
+    failed: list[bool] = []
+    if cached is not None:
+        pieces: Iterable[str] = [cached]
+    else:
+        from utils.gemini_client import stream_gemini_logic
+
+        def _watch(chunks: Iterable[str]) -> Iterator[str]:
+            for chunk in chunks:
+                if chunk and chunk.startswith("⚠️"):
+                    failed.append(True)
+                yield chunk
+
+        line_filter = _ResponseFilter()
+        pieces = _join_stripped(line_filter.filter_lines(_iter_lines(
+            _watch(stream_gemini_logic(system_prompt, user_msg, history))
+        )))
+        if intent == "CHAT_FOLLOWUP":
+            pieces = _stream_followup_format(pieces, headings=line_filter.headings)
+
+    emitted: list[str] = []
+    trailing = ""
+    for piece in pieces:
+        # 結尾空白先不送：若之後要接「建議諮詢真人」段落，需與整段版一樣先 rstrip
+        body = piece.rstrip()
+        if body:
+            out = trailing + body
+            trailing = piece[len(body):]
+        else:
+            trailing += piece
+            continue
+        if ttft_ms is None:
+            ttft_ms = (time.perf_counter() - started) * 1000
+        emitted.append(out)
+        yield out
+
+    response = "".join(emitted)
+    if cached is None and cache_key is not None and not failed:
+        get_response_cache().put(*cache_key, response + trailing)
+    if cached is None:
+        from utils.gemini_client import get_last_usage
+        usage = get_last_usage()
+    else:
+        usage = None
+    context["usage"] = meter_request(
+        context.get("prompt_stats"), response, (time.perf_counter() - started) * 1000,
+        cache_hit=cached is not None, usage=usage, ttft_ms=ttft_ms, intent=intent,
+    )
+    if cached is None:
+        # 拒答特徵已在逐行過濾時偵測（followup 框架文字另外判斷過）
+        refusal = line_filter.refusal or (intent == "CHAT_FOLLOWUP" and _FOLLOWUP_FRAME_REFUSAL)
+    else:
+        refusal = None
+    need_escalation, escalation_note = _needs_human_escalation(latest_q, response, refusal=refusal)
+    if need_escalation:
+        tail = _escalation_block(escalation_note)
+    else:
+        tail = trailing
+    if tail:
+        response += tail
+        yield tail
+
+    context["ai_response"] = response
+
 class AdvisorNode(BaseNode):
-    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+    reads = (
+        "current_intent", "user_input", "metrics", "risks", "company_context_text",
+        "latest_user_question", "history", "conversation_summary", "stream",
+    )
+    writes = ("ai_response", "ai_response_stream", "system_prompt", "prompt_stats", "cache_hit", "usage")
+    stream_key = "ai_response_stream"
+
+    def trace_attributes(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        stats = context.get("prompt_stats") or {}
+        attributes = {
+            "template": stats.get("template", context.get("system_prompt", "")[:32]),
+            "prompt_chars": len(context.get("system_prompt") or ""),
+            "prompt_tokens_est": stats.get("prompt_tokens"),
+        }
+        # 串流模式下 span 延到串流結束才關閉（Pipeline._traced_stream），回覆此時已寫回；串流中途被放棄時留空
+        if "ai_response" in context:
+            attributes["response_chars"] = len(context.get("ai_response") or "")
+        attributes["streaming"] = "ai_response_stream" in context
+        attributes["cache_hit"] = bool(context.get("cache_hit"))
+        usage = context.get("usage")
+        if usage:
+            attributes["tokens_in"] = usage["tokens_in"]
+            attributes["tokens_out"] = usage["tokens_out"]
+        return attributes
+
+    def build_request(self, context: Dict[str, Any]) -> Dict[str, Any] | None:
+        """
+        第一步：判斷意圖、檢索知識塊、組出提示詞並查回覆快取（不呼叫模型）。
+        回傳要送給模型的請求內容；已在本地直接回覆（例如自我介紹）時回傳 None。
+        批次產生報告（report_batch.py）會自行呼叫模型，再交給 finalize_response。
+        """
         intent = context.get("current_intent", "CHAT")
         user_data = context.get("user_input", {})
         metrics = context.get("metrics", {})
         risks = "\n".join(context.get("risks", []))
         company_context_text = (context.get("company_context_text") or "").strip()
-        company_context_block = ""
-        if company_context_text:
-            company_context_block = f"\n\n【企業補充資訊】\n{company_context_text}\n"
 
         # 針對「自我介紹/怎麼用」類問題做保守處理：避免被模型安全策略誤判而拒答
         latest_q = (context.get("latest_user_question") or "").strip()
+        q_hits = ADVISOR_ROUTER.match(latest_q.replace(" ", ""))
         if intent == "CHAT" and latest_q:
-            q_norm = latest_q.replace(" ", "")
-            intro_triggers = [
-                "你是誰", "你是什麼", "你能做什麼", "你可以做什麼",
-                "怎麼用", "如何使用", "使用方法", "你會什麼",
-            ]
-            if any(t in q_norm for t in intro_triggers):
+            if "intro" in q_hits:
                 context["ai_response"] = (
                     "我是 WinLeaders-Bonus 年終獎金顧問。"
                     "我可以協助你制定年終獎金策略、評估風險、以及把獎金發放邏輯講清楚。"
                     "下一步你可以直接貼上公司報告（stage/revenue/grossMargin/hrRatio/bonus pool/部門分配/增長引擎），我會用同一套框架幫你做策略判斷與可執行建議。"
                 )
                 context["system_prompt"] = "local_intro_fallback"
-                return context
+                return None
 
             # 若是「覺得太少/不滿意/想更詳細」等 follow-up 型問題，改用 followup 模板產出更顧問式內容
-            followup_triggers = [
-                "不滿意", "太少", "不夠", "更詳細", "詳細說明", "詳細解釋",
-                "說明一下", "再多一點", "多一點", "具體一點", "更具體", "怎麼調整",
-                "為什麼", "原因", "取捨", "方案",
-            ]
-            if any(t in q_norm for t in followup_triggers):
+            if "followup" in q_hits:
                 intent = "CHAT_FOLLOWUP"
 
             # 若使用者貼的是 report 結構化資料，走「原理解讀」模式
@@ -188,73 +437,143 @@ class AdvisorNode(BaseNode):
                 intent = "CHAT_FOLLOWUP"
 
             # 若已載入企業補充資訊，且使用者在問「解說/原理/解讀」類問題，優先走原理解讀模式
-            if company_context_text:
-                explain_triggers = ["解說", "原理", "解讀", "推導", "介紹", "怎麼看", "如何看"]
-                if any(t in q_norm for t in explain_triggers):
-                    intent = "CHAT_FOLLOWUP"
+            if company_context_text and "explain" in q_hits:
+                intent = "CHAT_FOLLOWUP"
         
+        # 知識庫：主體完整保留，知識塊只放與問題相關的前幾塊（降低每輪提示詞大小）
+        if intent == "GENERATE_REPORT":
+            retrieval_query = f"{user_data.get('style', '')} 年終獎金池 分配 風險 話術"
+        elif company_context_text:
+            # 自動解說的問題是固定句，查詢需帶入補充資訊本身，否則每份報告都檢索到同樣的知識塊
+            retrieval_query = _company_context_query(company_context_text, latest_q)
+        else:
+            retrieval_query = latest_q
+        knowledge_chunks = retrieve_knowledge_chunks_text(retrieval_query)
+
         if intent == "GENERATE_REPORT":
             # 使用配置中心的提示詞模板
-            system_prompt = PROMPT_TEMPLATES["generate_report"].format(
-                knowledge_base=BONUS_KB_TEXT,
-                net_profit=user_data.get('net_profit', 'N/A'),
-                style=user_data.get('style', 'N/A'),
-                total_pool=metrics.get('total_pool', 'N/A'),
-                per_head=metrics.get('per_head', 'N/A'),
-                months=metrics.get('months', 'N/A'),
-                risks=risks if risks else "無"
-            ) + company_context_block
+            template_name = "generate_report"
             user_msg = "請根據上述數據，生成一份完整的年終獎金分配草案。"
         
         elif intent == "CHAT_FOLLOWUP":
             # 使用配置中心的聊天提示詞模板
-            system_prompt = PROMPT_TEMPLATES["chat_followup"].format(
-                knowledge_base=BONUS_KB_TEXT,
-                net_profit=user_data.get('net_profit', 'N/A'),
-                employees=user_data.get('employees', 'N/A'),
-                avg_salary=user_data.get('avg_salary', 'N/A'),
-                style=user_data.get('style', 'N/A'),
-                total_pool=metrics.get('total_pool', 'N/A'),
-                per_head=metrics.get('per_head', 'N/A'),
-                months=metrics.get('months', 'N/A'),
-                risks=risks if risks else "無"
-            ) + company_context_block
+            template_name = "chat_followup"
             user_msg = context.get("latest_user_question", "")
         
         elif intent == "CHAT":
             # 純對話模式：走顧問建議模板（仍不反問、不用問號）
-            system_prompt = PROMPT_TEMPLATES.get("chat_advice", PROMPT_TEMPLATES["chat"]).format(
-                knowledge_base=BONUS_KB_TEXT
-            ) + company_context_block
+            template_name = "chat_advice" if "chat_advice" in PROMPT_TEMPLATES else "chat"
             user_msg = context.get("latest_user_question", "")
-        
-        # 呼叫 Gemini API
-        from utils.gemini_client import call_gemini_logic
-        history = context.get("history", [])
-        response = call_gemini_logic(system_prompt, user_msg, history)
 
-        # 精實化：只呼叫模型一次；其餘用本地後處理做保底（降低延遲/成本/不確定性）
-        response = _strip_internal_refs(response)
-        if _contains_questions(response):
-            response = _remove_questions(response)
-        if intent == "CHAT_FOLLOWUP":
-            response = _ensure_followup_format(response)
+        # 靜態前綴（模板 + 知識庫主體）已預先渲染快取，這裡只拼接本次請求的欄位，並依 token 預算裁切
+        built = build_prompt(
+            template_name,
+            fields={
+                "net_profit": user_data.get('net_profit', 'N/A'),
+                "employees": user_data.get('employees', 'N/A'),
+                "avg_salary": user_data.get('avg_salary', 'N/A'),
+                "style": user_data.get('style', 'N/A'),
+                "total_pool": metrics.get('total_pool', 'N/A'),
+                "per_head": metrics.get('per_head', 'N/A'),
+                "months": metrics.get('months', 'N/A'),
+                "risks": risks if risks else "無",
+            },
+            knowledge_chunks=knowledge_chunks,
+            company_context_text=company_context_text,
+            history=context.get("history", []),
+            user_message=user_msg,
+            conversation_summary=context.get("conversation_summary", ""),
+        )
+        system_prompt = built["system_prompt"]
+        history = built["history"]
+        context["prompt_stats"] = built["stats"]
+
+        # 回覆快取：鍵含意圖、知識庫/模板版本與企業上下文（含實際送出的對話歷史與摘要）；命中時完全略過模型呼叫
+        # （快取的是後處理後、補上「建議諮詢真人」段落前的回覆，該段落依本次問題另外判斷）
+        cache = get_response_cache()
+        cache_key = None
+        cached = None
+        if cache is not None:
+            from assets.knowledge import KB_VERSION
+            cache_key = (
+                user_msg, intent, KB_VERSION, built["stats"]["template_version"],
+                context_hash(
+                    company_context_text, user_data, metrics, risks,
+                    history, context.get("conversation_summary", ""),
+                ),
+            )
+            cached = cache.get(*cache_key)
+        context["cache_hit"] = cached is not None
+
+        return {
+            "intent": intent,
+            "latest_q": latest_q,
+            "q_hits": q_hits,
+            "system_prompt": system_prompt,
+            "user_msg": user_msg,
+            "history": history,
+            "cache_key": cache_key,
+            "cached": cached,
+        }
+
+    def finalize_response(self, context: Dict[str, Any], request: Dict[str, Any], response: str | None,
+                          failed: bool = False, latency_ms: float | None = None) -> Dict[str, Any]:
+        """
+        第二步：對模型原始回覆做本地後處理、寫入回覆快取、補上「建議諮詢真人」段落，寫回 context。
+        response 為 None 表示使用快取命中的回覆；failed=True 時（模型呼叫失敗）不寫入快取。
+        同時記錄用量（context["usage"]）：token 取自本執行緒最近一次 Gemini 呼叫，latency_ms 由呼叫端量測。
+        """
+        intent = request["intent"]
+        refusal = None
+        if response is None:
+            response = request["cached"]
+            context["usage"] = meter_request(context.get("prompt_stats"), response, latency_ms, cache_hit=True, intent=intent)
+        else:
+            from utils.gemini_client import get_last_usage
+            context["usage"] = meter_request(
+                context.get("prompt_stats"), response, latency_ms, usage=get_last_usage(), intent=intent,
+            )
+            # 精實化：只呼叫模型一次；其餘用本地後處理做保底（降低延遲/成本/不確定性）
+            # 內部代碼/問句/followup 標題/拒答特徵一次逐行處理完（見 _postprocess_response）
+            response, refusal = _postprocess_response(response, followup=intent == "CHAT_FOLLOWUP")
+            if request["cache_key"] is not None and not failed:
+                get_response_cache().put(*request["cache_key"], response)
 
         # 若看起來超出知識庫/專業高風險領域：先保留既有回答，再補上「建議諮詢真人」提示
-        need_escalation, escalation_note = _needs_human_escalation(latest_q, response)
+        need_escalation, escalation_note = _needs_human_escalation(
+            request["latest_q"], response, request["q_hits"], refusal=refusal
+        )
         if need_escalation:
-            response = (
-                (response or "").rstrip()
-                + "\n\n"
-                + "### 建議諮詢真人專業\n"
-                + f"- {escalation_note}\n"
-                + "- 若涉及稅務/扣繳/費用化：建議詢問會計師或稅務顧問（帶上薪資結構、獎金發放規則、員工清冊）。\n"
-                + "- 若涉及勞資/工時/加班/勞退勞健保：建議詢問勞資顧問或律師（帶上勞動契約、出勤/加班制度、薪資項目）。\n"
-                + "- 若涉及制度設計與留才：建議詢問薪酬顧問（帶上績效制度、職等/職族、過往流動率與關鍵人才名單）。\n"
-            )
+            response = (response or "").rstrip() + _escalation_block(escalation_note)
         
         context["ai_response"] = response
-        context.setdefault("system_prompt", system_prompt)
+        context.setdefault("system_prompt", request["system_prompt"])
         
         return context
 
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        request = self.build_request(context)
+        if request is None:
+            return context
+
+        # 串流模式：回傳產生器，由 UI（st.write_stream）逐段消費；完整回覆在串流結束後寫回 context["ai_response"]
+        if context.get("stream"):
+            context.setdefault("system_prompt", request["system_prompt"])
+            context["ai_response_stream"] = _stream_advisor_response(
+                context, request["system_prompt"], request["user_msg"], request["history"],
+                request["intent"], request["latest_q"], request["cached"], request["cache_key"],
+            )
+            return context
+
+        if request["cached"] is not None:
+            return self.finalize_response(context, request, None, latency_ms=(time.perf_counter() - started) * 1000)
+
+        # 呼叫 Gemini API
+        from utils.gemini_client import call_gemini_logic
+        response = call_gemini_logic(request["system_prompt"], request["user_msg"], request["history"])
+        return self.finalize_response(
+            context, request, response,
+            failed=(response or "").startswith("⚠️"),
+            latency_ms=(time.perf_counter() - started) * 1000,
+        )
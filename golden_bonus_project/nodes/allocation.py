@@ -0,0 +1,207 @@
+# nodes/allocation.py
+from core.base_node import BaseNode
+from config.settings import (
+    ALLOCATION_DEFAULT_GRADE,
+    ALLOCATION_DEFAULT_STYLE,
+    ALLOCATION_DEPARTMENT_BASIS,
+    ALLOCATION_GRADE_MULTIPLIERS,
+)
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+
+def largest_remainder(exact: np.ndarray, groups: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """
+    最大餘數法取整：每組先無條件捨去，再把差額逐一補給小數部分最大的成員，
+    保證每組整數合計恰好等於 targets[組]（groups 為 0..len(targets)-1 的組別代碼）。
+    """
+    floors = np.floor(exact)
+    frac = exact - floors
+    floors = floors.astype(np.int64)
+    n_groups = len(targets)
+
+    group_sizes = np.bincount(groups, minlength=n_groups)
+    shortfall = targets - np.bincount(groups, weights=floors, minlength=n_groups).astype(np.int64)
+    # 浮點誤差保護：差額只會落在 [0, 組內人數) 之間
+    shortfall = np.clip(shortfall, 0, group_sizes)
+    if not shortfall.any():
+        return floors
+
+    # 組內依小數部分由大到小排名（同值時維持原順序，結果可重現）
+    order = np.lexsort((np.arange(len(exact)), -frac, groups))
+    starts = np.concatenate(([0], np.cumsum(group_sizes)[:-1]))
+    rank = np.empty(len(exact), dtype=np.int64)
+    rank[order] = np.arange(len(exact)) - starts[groups[order]]
+    return floors + (rank < shortfall[groups])
+
+
+def allocate_pool(
+    total_pool: int,
+    department,
+    salary,
+    grade=None,
+    headcount=None,
+    department_type=None,
+    engine: Optional[str] = None,
+    style: Optional[str] = None,
+    basis: Optional[str] = None,
+    tables=None,
+) -> Dict[str, Any]:
+    """
+    把獎金池分給部門與員工（名冊為欄位式陣列，每個位置一位員工；或搭配 headcount 代表一群同薪同等級的人）。
+
+    1. 部門池：引擎權重（缺少的部門類型為 1）× basis（見 ALLOCATION_DEPARTMENT_BASIS），依比例分配
+    2. 部門內：月薪 × 績效等級倍數 × 人數，依比例分配
+    兩層都用最大餘數法取整，部門合計 = 部門池、全部合計 = total_pool（整數、完全守恆）。
+    部門內有效權重為 0（例如全部是倍數 0 的等級）的部門不分配，池子由其他部門分。
+
+    Args:
+        total_pool: 獎金池（元，整數）
+        department: 部門名稱
+        salary: 月薪（元）
+        grade: 績效等級（S/A/B/C/D…），省略時全部視為 ALLOCATION_DEFAULT_GRADE
+        headcount: 每列人數，省略時為 1
+        department_type: 部門類型（知識庫 DepartmentType），省略時與部門名稱相同
+        engine: 增長引擎（知識庫 GrowthEngine），省略時各部門權重相同
+        style: 人才投資策略，決定績效等級倍數
+        basis: "department" / "headcount" / "salary"
+
+    Returns:
+        Dict: employee_bonus（int64，與名冊對齊）與 departments（依部門首次出現順序的彙總清單）
+    """
+    total_pool = int(total_pool)
+    if total_pool < 0:
+        raise ValueError("獎金池不能為負數")
+    basis = basis or ALLOCATION_DEPARTMENT_BASIS
+    if basis not in ("department", "headcount", "salary"):
+        raise ValueError(f"未知的部門分配基礎：{basis}")
+
+    department = np.asarray(department)
+    salary = np.asarray(salary, dtype=np.float64)
+    n = len(department)
+    if salary.shape != (n,):
+        raise ValueError("名冊欄位長度不一致")
+    heads = np.ones(n, dtype=np.float64) if headcount is None else np.asarray(headcount, dtype=np.float64)
+    if heads.shape != (n,):
+        raise ValueError("名冊欄位長度不一致")
+    if n and (np.any(salary < 0) or np.any(heads < 0)):
+        raise ValueError("月薪與人數不能為負數")
+
+    # 績效等級 → 倍數（先對不重複的等級查表，再以索引展開）
+    multipliers = ALLOCATION_GRADE_MULTIPLIERS.get(style or ALLOCATION_DEFAULT_STYLE)
+    if multipliers is None:
+        raise KeyError(f"未知的人才投資策略：{style}")
+    default_multiplier = multipliers.get(ALLOCATION_DEFAULT_GRADE, 1.0)
+    if grade is None:
+        grade_multiplier = np.full(n, default_multiplier)
+    else:
+        grade_values, grade_codes = np.unique(np.asarray(grade).astype(str), return_inverse=True)
+        lookup = np.array([multipliers.get(g.strip().upper(), default_multiplier) for g in grade_values])
+        grade_multiplier = lookup[grade_codes.ravel()] if n else np.zeros(0)
+
+    # 部門代碼：依首次出現順序
+    _, first_index, dept_codes = np.unique(department, return_index=True, return_inverse=True)
+    appearance = np.argsort(first_index, kind="stable")
+    remap = np.empty_like(appearance)
+    remap[appearance] = np.arange(len(appearance))
+    dept_codes = remap[dept_codes.ravel()]
+    dept_first = first_index[appearance]
+    n_depts = len(dept_first)
+
+    dept_names = department[dept_first]
+    dept_types = dept_names if department_type is None else np.asarray(department_type)[dept_first]
+
+    emp_weight = salary * grade_multiplier * heads
+    dept_emp_weight = np.bincount(dept_codes, weights=emp_weight, minlength=n_depts)
+    dept_heads = np.bincount(dept_codes, weights=heads, minlength=n_depts)
+
+    if engine:
+        if tables is None:
+            from assets.kb_tables import get_kb_tables
+            tables = get_kb_tables()
+        dept_weight = tables.department_weights(engine, [str(t) for t in dept_types])
+        reasons = [tables.weight_reason(engine, str(t)) for t in dept_types]
+    else:
+        dept_weight = np.ones(n_depts)
+        reasons = [""] * n_depts
+
+    if basis == "headcount":
+        dept_score = dept_weight * dept_heads
+    elif basis == "salary":
+        dept_score = dept_weight * np.bincount(dept_codes, weights=salary * heads, minlength=n_depts)
+    else:
+        dept_score = dept_weight.copy()
+    dept_score = np.where(dept_emp_weight > 0, dept_score, 0.0)
+
+    score_total = dept_score.sum()
+    if total_pool and score_total <= 0:
+        raise ValueError("沒有可分配的部門（權重或名冊有效權重皆為 0）")
+
+    # 第一層：部門池
+    if score_total > 0:
+        dept_exact = total_pool * dept_score / score_total
+        dept_pool = largest_remainder(
+            dept_exact, np.zeros(n_depts, dtype=np.int64), np.array([total_pool], dtype=np.int64)
+        )
+    else:
+        dept_pool = np.zeros(n_depts, dtype=np.int64)
+
+    # 第二層：部門內員工
+    safe_dept_weight = np.where(dept_emp_weight > 0, dept_emp_weight, 1.0)
+    emp_exact = dept_pool[dept_codes] * (emp_weight / safe_dept_weight[dept_codes])
+    employee_bonus = largest_remainder(emp_exact, dept_codes, dept_pool)
+
+    departments: List[Dict[str, Any]] = []
+    for i in range(n_depts):
+        bonus = int(dept_pool[i])
+        head = float(dept_heads[i])
+        departments.append({
+            "department": str(dept_names[i]),
+            "department_type": str(dept_types[i]),
+            "weight": float(dept_weight[i]),
+            "headcount": int(head) if head.is_integer() else head,
+            "bonus": bonus,
+            "percentage": round(bonus / total_pool * 100, 2) if total_pool else 0.0,
+            "per_capita": int(bonus / head) if head else 0,
+            "reason": reasons[i],
+        })
+
+    return {"employee_bonus": employee_bonus, "departments": departments}
+
+
+class AllocationNode(BaseNode):
+    """
+    接在 CalculatorNode 後面：把 metrics["total_pool"] 依部門權重與績效等級分到部門與員工。
+    context["roster"]：欄位式名冊（dict of arrays），欄位 department / salary，
+    可選 grade / headcount / department_type；增長引擎取自 context["growth_engine"] 或 user_input["growth_engine"]。
+    """
+    reads = ("metrics", "user_input", "roster", "growth_engine")
+    writes = ("allocations", "employee_bonus")
+
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        roster = context.get("roster")
+        if not roster:
+            # 沒有名冊：不做分配（維持只有公司層級指標的舊流程）
+            return context
+
+        user_data = context.get("user_input", {})
+        result = allocate_pool(
+            total_pool=context["metrics"]["total_pool"],
+            department=roster["department"],
+            salary=roster["salary"],
+            grade=roster.get("grade"),
+            headcount=roster.get("headcount"),
+            department_type=roster.get("department_type"),
+            engine=context.get("growth_engine") or user_data.get("growth_engine"),
+            style=user_data.get("style"),
+        )
+        context["allocations"] = result["departments"]
+        context["employee_bonus"] = result["employee_bonus"]
+        return context
+
+    def trace_attributes(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "roster_rows": len((context.get("roster") or {}).get("department", ())),
+            "departments": len(context.get("allocations") or ()),
+        }
@@ -2,7 +2,93 @@
 from core.base_node import BaseNode
 from typing import Dict, Any
 
+import numpy as np
+
+# 風險規則門檻（單筆與批次共用，避免兩邊規則飄移）
+LOW_MONTHS_THRESHOLD = 0.5       # 規則 1：平均獎金低於 0.5 個月
+LOW_RETENTION_THRESHOLD = 0.1    # 規則 2：保留盈餘低於 10%
+
+RISK_LOW_MONTHS = "⚠️ **紅色警報**：平均獎金低於 0.5 個月，根據統計，這會導致年後離職率上升 30%。"
+RISK_LOW_RETENTION = "⚠️ **財務警告**：您的保留盈餘過低，公司現金流抗風險能力將減弱。"
+
+
+def compute_metrics_array(
+    net_profit,
+    employees,
+    avg_salary,
+    retention_rate=None,
+    retention=None,
+    strict: bool = True,
+) -> Dict[str, np.ndarray]:
+    """
+    批次版計算：輸入欄位式陣列（每個位置代表一個情境），一次向量化算出所有情境的指標與風險旗標。
+    公式、驗證與風險規則與 CalculatorNode.execute 完全一致。
+
+    Args:
+        net_profit: 稅前淨利（萬元）
+        employees: 發放人數
+        avg_salary: 平均月薪（元）
+        retention_rate: 保留比例 0.0 ~ 1.0（與 retention 二擇一）
+        retention: 保留比例 0 ~ 100（百分比，向後相容）
+        strict: True 時只要有任一列不合法就 raise（同單筆行為）；
+                False 時不合法的列標記 valid=False，指標填 0、風險旗標為 False
+
+    Returns:
+        Dict[str, np.ndarray]: total_pool / per_head（int64）、months（float64，兩位小數）、
+        risk_low_months / risk_low_retention / valid（bool）
+    """
+    if retention_rate is not None:
+        retention_arr = np.asarray(retention_rate, dtype=np.float64)
+    elif retention is not None:
+        retention_arr = np.asarray(retention, dtype=np.float64) / 100.0
+    else:
+        raise KeyError("缺少 retention_rate 或 retention")
+
+    net_profit_arr = np.asarray(net_profit, dtype=np.float64)
+    employees_arr = np.asarray(employees, dtype=np.float64)
+    salary_arr = np.asarray(avg_salary, dtype=np.float64)
+    net_profit_arr, employees_arr, salary_arr, retention_arr = np.broadcast_arrays(
+        net_profit_arr, employees_arr, salary_arr, retention_arr
+    )
+
+    # 驗證順序與單筆一致：保留比例 → 人數 → 月薪
+    bad_retention = ~((retention_arr >= 0.0) & (retention_arr <= 1.0))
+    bad_employees = ~(employees_arr > 0)
+    bad_salary = ~(salary_arr > 0)
+    valid = ~(bad_retention | bad_employees | bad_salary)
+
+    if strict and not valid.all():
+        for mask, msg in (
+            (bad_retention, "保留比例必須介於 0.0 到 1.0（或 0 到 100%）"),
+            (bad_employees, "員工人數不能為 0 或負數"),
+            (bad_salary, "平均月薪不能為 0 或負數"),
+        ):
+            if mask.any():
+                first = int(np.flatnonzero(mask.ravel())[0])
+                raise ValueError(f"第 {first} 列：{msg}（共 {int(mask.sum())} 列不合法）")
+
+    # 不合法的列用安全值代入，避免除以零警告；最後再以 valid 遮罩清掉
+    safe_employees = np.where(valid, employees_arr, 1.0)
+    safe_salary = np.where(valid, salary_arr, 1.0)
+
+    pool = (net_profit_arr * 10000) * (1 - retention_arr)
+    per_head = pool / safe_employees
+    months = per_head / safe_salary
+
+    return {
+        "total_pool": np.where(valid, np.trunc(pool), 0).astype(np.int64),
+        "per_head": np.where(valid, np.trunc(per_head), 0).astype(np.int64),
+        "months": np.where(valid, np.round(months, 2), 0.0),
+        "risk_low_months": valid & (months < LOW_MONTHS_THRESHOLD),
+        "risk_low_retention": valid & (retention_arr < LOW_RETENTION_THRESHOLD),
+        "valid": valid,
+    }
+
+
 class CalculatorNode(BaseNode):
+    reads = ("user_input",)
+    writes = ("metrics", "risks")
+
     def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
         data = context["user_input"]
 
@@ -49,15 +135,31 @@ class CalculatorNode(BaseNode):
         risks = []
         
         # 規則 1: 發太少 (低於 0.5 個月)
-        if months < 0.5:
-            risks.append("⚠️ **紅色警報**：平均獎金低於 0.5 個月，根據統計，這會導致年後離職率上升 30%。")
+        if months < LOW_MONTHS_THRESHOLD:
+            risks.append(RISK_LOW_MONTHS)
         
         # 規則 2: 發太多 (透支保留盈餘)
         # 假設我們不希望老闆保留盈餘低於 10%
-        if retention_rate < 0.1:
-            risks.append("⚠️ **財務警告**：您的保留盈餘過低，公司現金流抗風險能力將減弱。")
+        if retention_rate < LOW_RETENTION_THRESHOLD:
+            risks.append(RISK_LOW_RETENTION)
         
         context["risks"] = risks
         
         return context
 
+    def execute_batch(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        批次模式：context["batch_input"] 為欄位式資料（dict of arrays，欄位同 user_input），
+        結果寫入 context["batch_metrics"]（dict of arrays，見 compute_metrics_array）。
+        context["batch_strict"] 預設 True，與單筆模式一樣遇到不合法資料直接 raise。
+        """
+        columns = context["batch_input"]
+        context["batch_metrics"] = compute_metrics_array(
+            net_profit=columns["net_profit"],
+            employees=columns["employees"],
+            avg_salary=columns["avg_salary"],
+            retention_rate=columns.get("retention_rate"),
+            retention=columns.get("retention"),
+            strict=bool(context.get("batch_strict", True)),
+        )
+        return context
@@ -0,0 +1,221 @@
+# nodes/sensitivity.py
+from core.base_node import BaseNode
+from config.settings import (
+    SENSITIVITY_CHUNK_SIZE,
+    SENSITIVITY_DEFAULT_CORRELATION,
+    SENSITIVITY_DEFAULT_SPREAD,
+    SENSITIVITY_PERCENTILES,
+    SENSITIVITY_SAMPLES,
+    SENSITIVITY_SEED,
+)
+from nodes.calculator import compute_metrics_array
+from typing import Dict, Any, Optional, Tuple
+
+import time
+
+import numpy as np
+
+# 抽樣變數（順序即相關矩陣的行列順序）
+VARIABLES = ("net_profit", "employees", "avg_salary", "retention_rate")
+
+_SQRT1_2 = 1.0 / np.sqrt(2.0)
+
+
+def _erf(x: np.ndarray) -> np.ndarray:
+    """
+    向量化 erf（Abramowitz & Stegun 7.1.26，最大誤差約 1.5e-7），避免為了常態 CDF 引入 scipy。
+    """
+    sign = np.sign(x)
+    a = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * a)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1.0 - poly * np.exp(-a * a))
+
+
+def normal_cdf(z: np.ndarray) -> np.ndarray:
+    return 0.5 * (1.0 + _erf(z * _SQRT1_2))
+
+
+def _transform(z: np.ndarray, spec: Dict[str, Any]) -> np.ndarray:
+    """
+    把標準常態樣本（已含相關結構）轉成指定的邊際分布（Gaussian copula）。
+    支援：fixed / normal / lognormal / uniform / triangular，並可用 min/max 截斷。
+    """
+    dist = spec.get("dist", "normal")
+    if dist == "fixed":
+        x = np.full(z.shape, float(spec["value"]))
+    elif dist == "normal":
+        x = float(spec["mean"]) + float(spec["std"]) * z
+    elif dist == "lognormal":
+        # median 為中位數，sigma 為 log 空間的標準差
+        x = float(spec["median"]) * np.exp(float(spec["sigma"]) * z)
+    elif dist == "uniform":
+        low, high = float(spec["low"]), float(spec["high"])
+        x = low + (high - low) * normal_cdf(z)
+    elif dist == "triangular":
+        low, mode, high = float(spec["low"]), float(spec["mode"]), float(spec["high"])
+        if not (low <= mode <= high) or low == high:
+            raise ValueError("三角分布需滿足 low <= mode <= high 且 low < high")
+        u = normal_cdf(z)
+        cut = (mode - low) / (high - low)
+        x = np.where(
+            u < cut,
+            low + np.sqrt(u * (high - low) * (mode - low)),
+            high - np.sqrt((1.0 - u) * (high - low) * (high - mode)),
+        )
+    else:
+        raise ValueError(f"未知的分布：{dist}")
+
+    if "min" in spec or "max" in spec:
+        x = np.clip(x, spec.get("min", -np.inf), spec.get("max", np.inf))
+    return x
+
+
+def correlation_cholesky(correlation: Optional[Dict[Tuple[str, str], float]]) -> np.ndarray:
+    """
+    由 {(變數A, 變數B): 相關係數} 組出相關矩陣並做 Cholesky 分解（矩陣需為正定）。
+    """
+    k = len(VARIABLES)
+    matrix = np.eye(k)
+    for (a, b), rho in (correlation or {}).items():
+        if a not in VARIABLES or b not in VARIABLES:
+            raise KeyError(f"未知的抽樣變數：{a if a not in VARIABLES else b}")
+        if a == b:
+            continue
+        if not -1.0 <= rho <= 1.0:
+            raise ValueError("相關係數必須介於 -1 到 1")
+        i, j = VARIABLES.index(a), VARIABLES.index(b)
+        matrix[i, j] = matrix[j, i] = rho
+    try:
+        return np.linalg.cholesky(matrix)
+    except np.linalg.LinAlgError:
+        raise ValueError("相關係數組合不合理（相關矩陣不是正定）") from None
+
+
+def default_spec(user_data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    以使用者輸入為中心的預設分布（見 SENSITIVITY_DEFAULT_SPREAD）。
+    """
+    if "retention_rate" in user_data:
+        retention_rate = float(user_data["retention_rate"])
+    elif "retention" in user_data:
+        retention_rate = float(user_data["retention"]) / 100.0
+    else:
+        raise KeyError("缺少 retention_rate 或 retention")
+
+    spread = SENSITIVITY_DEFAULT_SPREAD
+    net_profit = float(user_data["net_profit"])
+    employees = float(user_data["employees"])
+    avg_salary = float(user_data["avg_salary"])
+    return {
+        "net_profit": {"dist": "normal", "mean": net_profit, "std": abs(net_profit) * spread["net_profit"]},
+        "employees": {"dist": "normal", "mean": employees, "std": employees * spread["employees"]},
+        "avg_salary": {"dist": "normal", "mean": avg_salary, "std": avg_salary * spread["avg_salary"]},
+        "retention_rate": {"dist": "normal", "mean": retention_rate, "std": spread["retention_rate"]},
+    }
+
+
+def sample_inputs(spec: Dict[str, Dict[str, Any]], n: int, rng: np.random.Generator,
+                  cholesky: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    抽 n 組（可相關的）輸入；人數取整且至少 1 人、保留比例截在 0~1。
+    """
+    z = rng.standard_normal((n, len(VARIABLES)))
+    if cholesky is not None:
+        z = z @ cholesky.T
+    columns = {name: _transform(z[:, i], spec[name]) for i, name in enumerate(VARIABLES)}
+    columns["employees"] = np.maximum(np.rint(columns["employees"]), 1.0)
+    columns["retention_rate"] = np.clip(columns["retention_rate"], 0.0, 1.0)
+    return columns
+
+
+def run_sensitivity(
+    spec: Dict[str, Dict[str, Any]],
+    samples: Optional[int] = None,
+    correlation: Optional[Dict[Tuple[str, str], float]] = None,
+    percentiles=None,
+    seed: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Monte Carlo：分批抽樣並送進 compute_metrics_array（strict=False），
+    回傳 months / per_head / total_pool 的分位數，以及各風險規則的觸發機率（以有效樣本為分母）。
+    """
+    n = int(SENSITIVITY_SAMPLES if samples is None else samples)
+    if n <= 0:
+        raise ValueError("樣本數必須大於 0")
+    chunk = int(chunk_size or SENSITIVITY_CHUNK_SIZE)
+    pcts = tuple(SENSITIVITY_PERCENTILES if percentiles is None else percentiles)
+    rng = np.random.default_rng(SENSITIVITY_SEED if seed is None else seed)
+    cholesky = correlation_cholesky(correlation) if correlation else None
+
+    started = time.perf_counter()
+    months = np.empty(n, dtype=np.float64)
+    per_head = np.empty(n, dtype=np.int64)
+    total_pool = np.empty(n, dtype=np.int64)
+    valid = np.empty(n, dtype=bool)
+    risk_counts = {"low_months": 0, "low_retention": 0, "any": 0}
+
+    for start in range(0, n, chunk):
+        size = min(chunk, n - start)
+        columns = sample_inputs(spec, size, rng, cholesky)
+        metrics = compute_metrics_array(
+            net_profit=columns["net_profit"],
+            employees=columns["employees"],
+            avg_salary=columns["avg_salary"],
+            retention_rate=columns["retention_rate"],
+            strict=False,
+        )
+        end = start + size
+        months[start:end] = metrics["months"]
+        per_head[start:end] = metrics["per_head"]
+        total_pool[start:end] = metrics["total_pool"]
+        valid[start:end] = metrics["valid"]
+        risk_counts["low_months"] += int(np.count_nonzero(metrics["risk_low_months"]))
+        risk_counts["low_retention"] += int(np.count_nonzero(metrics["risk_low_retention"]))
+        risk_counts["any"] += int(np.count_nonzero(metrics["risk_low_months"] | metrics["risk_low_retention"]))
+
+    valid_count = int(np.count_nonzero(valid))
+    result_percentiles: Dict[str, Dict[str, float]] = {}
+    if valid_count:
+        all_valid = valid_count == n
+        for name, values in (("months", months), ("per_head", per_head), ("total_pool", total_pool)):
+            data = values if all_valid else values[valid]
+            bands = np.percentile(data, pcts)
+            result_percentiles[name] = {f"p{p:g}": round(float(v), 2) for p, v in zip(pcts, bands)}
+
+    elapsed = time.perf_counter() - started
+    return {
+        "samples": n,
+        "valid_samples": valid_count,
+        "percentiles": result_percentiles,
+        "risk_probability": {
+            key: (count / valid_count if valid_count else 0.0) for key, count in risk_counts.items()
+        },
+        "elapsed_sec": round(elapsed, 4),
+        "samples_per_sec": int(n / elapsed) if elapsed > 0 else None,
+    }
+
+
+class SensitivityNode(BaseNode):
+    """
+    敏感度模式：context["sensitivity_spec"] 可指定各變數分布（未指定的變數用 default_spec），
+    context["sensitivity_correlation"] 可覆寫相關係數，結果寫入 context["sensitivity"]。
+    """
+    reads = ("user_input", "sensitivity_spec", "sensitivity_correlation", "sensitivity_samples")
+    writes = ("sensitivity",)
+
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        spec = default_spec(context["user_input"])
+        spec.update(context.get("sensitivity_spec") or {})
+        correlation = context.get("sensitivity_correlation")
+        context["sensitivity"] = run_sensitivity(
+            spec,
+            samples=context.get("sensitivity_samples"),
+            correlation=SENSITIVITY_DEFAULT_CORRELATION if correlation is None else correlation,
+        )
+        return context
+
+    def trace_attributes(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        result = context.get("sensitivity") or {}
+        return {"samples": result.get("samples"), "samples_per_sec": result.get("samples_per_sec")}
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# report_batch.py
+"""
+批次產生年終獎金分配草案（GENERATE_REPORT）：一次處理多家公司，
+並行呼叫 Gemini（受 RPM / TPM 限流），429/5xx 自動重試，可中斷後續跑，輸出依輸入順序排列。
+
+用法（在專案目錄）：
+    python report_batch.py companies.csv -o reports.jsonl
+    python report_batch.py companies.jsonl -o reports.jsonl --concurrency 16 --rpm 300 --tpm 2000000
+
+輸入（CSV 或 JSONL）每列一家公司：net_profit、employees、avg_salary、retention_rate 或 retention，
+可選 style、company_context_text、company_id。
+輸出 JSONL 每列：index / company_id / metrics / risks / report / cache_hit / attempts / usage / error。
+已完成的公司記錄在 <輸出檔>.checkpoint.jsonl，重新執行時自動略過（--no-resume 可重跑全部）；
+全部成功後 checkpoint 會被刪除。
+"""
+import argparse
+import csv
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# 與 main.py 相同：確保可以導入同目錄下的模組
+current_dir = Path(__file__).parent.absolute()
+if str(current_dir) not in sys.path:
+    sys.path.insert(0, str(current_dir))
+
+from config.settings import (
+    FORM_FIELDS,
+    REPORT_BATCH_CONCURRENCY,
+    REPORT_BATCH_MAX_RETRIES,
+    REPORT_BATCH_OUTPUT_TOKENS_EST,
+    REPORT_BATCH_RETRY_BACKOFF_SEC,
+    REPORT_BATCH_RPM,
+    REPORT_BATCH_TPM,
+)
+from nodes.advisor import AdvisorNode
+from nodes.calculator import CalculatorNode
+from utils.gemini_client import GeminiCallError, generate_gemini_text
+from utils.rate_limiter import RateLimiter
+
+NUMERIC_FIELDS = ("net_profit", "employees", "avg_salary", "retention_rate", "retention")
+DEFAULT_STYLE = FORM_FIELDS["style"]["options"][0]
+
+
+def read_companies(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    逐列讀取公司資料（CSV 或 JSONL，依副檔名判斷）。
+    """
+    if Path(path).suffix.lower() in (".jsonl", ".ndjson"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            yield {k.strip(): v for k, v in row.items() if k}
+
+
+def _row_hash(row: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(row, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def _user_input(row: Dict[str, Any]) -> Dict[str, Any]:
+    user_input: Dict[str, Any] = {"style": row.get("style") or DEFAULT_STYLE}
+    for name in NUMERIC_FIELDS:
+        value = row.get(name)
+        if value not in (None, ""):
+            user_input[name] = float(value)
+    return user_input
+
+
+class ReportBatch:
+    """
+    一家公司 = CalculatorNode → AdvisorNode.build_request → 限流 + 重試呼叫 Gemini → AdvisorNode.finalize_response。
+    """
+
+    def __init__(self, limiter: RateLimiter, max_retries: int = REPORT_BATCH_MAX_RETRIES,
+                 backoff: float = REPORT_BATCH_RETRY_BACKOFF_SEC, generate=generate_gemini_text):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.generate = generate
+        self.calculator = CalculatorNode("calculator")
+        self.advisor = AdvisorNode("advisor")
+
+    def _call_with_retry(self, request: Dict[str, Any], tokens: int) -> Tuple[str, int]:
+        attempt = 0
+        while True:
+            attempt += 1
+            self.limiter.acquire(tokens)
+            try:
+                return self.generate(request["system_prompt"], request["user_msg"], request["history"]), attempt
+            except GeminiCallError as e:
+                if not e.retryable or attempt > self.max_retries:
+                    e.attempts = attempt
+                    raise
+                delay = self.backoff * (2 ** (attempt - 1)) * (0.5 + random.random())
+                if e.status == 429:
+                    self.limiter.penalize(delay)
+                time.sleep(delay)
+
+    def run_one(self, index: int, row: Dict[str, Any]) -> Dict[str, Any]:
+        record: Dict[str, Any] = {
+            "index": index,
+            "company_id": row.get("company_id") or row.get("id"),
+            "row_hash": _row_hash(row),
+            "metrics": None,
+            "risks": None,
+            "report": None,
+            "cache_hit": False,
+            "attempts": 0,
+            "usage": None,
+            "error": None,
+        }
+        try:
+            context: Dict[str, Any] = {
+                "user_input": _user_input(row),
+                "current_intent": "GENERATE_REPORT",
+                "company_context_text": row.get("company_context_text") or "",
+                "history": [],
+            }
+            self.calculator.execute(context)
+            record["metrics"] = context["metrics"]
+            record["risks"] = context["risks"]
+
+            started = time.perf_counter()
+            request = self.advisor.build_request(context)
+            if request["cached"] is not None:
+                self.advisor.finalize_response(context, request, None, latency_ms=(time.perf_counter() - started) * 1000)
+                record["cache_hit"] = True
+            else:
+                tokens = context["prompt_stats"]["total_tokens"] + REPORT_BATCH_OUTPUT_TOKENS_EST
+                response, record["attempts"] = self._call_with_retry(request, tokens)
+                # 延遲含限流等待與重試
+                self.advisor.finalize_response(context, request, response, latency_ms=(time.perf_counter() - started) * 1000)
+            record["report"] = context["ai_response"]
+            record["usage"] = context.get("usage")
+        except GeminiCallError as e:
+            record["attempts"] = getattr(e, "attempts", record["attempts"])
+            record["error"] = f"Gemini 呼叫失敗（{e.status or '無狀態碼'}）：{e}"
+        except (KeyError, ValueError, TypeError) as e:
+            record["error"] = f"輸入資料錯誤：{type(e).__name__}: {e}"
+        except Exception as e:
+            # 單一公司的任何意外（例如計算或後處理錯誤）只記在這一列，不中斷整批
+            record["error"] = f"處理失敗：{type(e).__name__}: {e}"
+        return record
+
+
+def _load_checkpoint(path: Path) -> Dict[int, Dict[str, Any]]:
+    done: Dict[int, Dict[str, Any]] = {}
+    if not path.exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 中斷時寫到一半的最後一行
+            done[record["index"]] = record
+    return done
+
+
+def _is_ready(item: Any) -> bool:
+    return not isinstance(item, Future) or item.done()
+
+
+def _resolve(item: Any) -> Dict[str, Any]:
+    return item.result() if isinstance(item, Future) else item
+
+
+def run_report_batch(
+    input_path: str,
+    output_path: str,
+    concurrency: int = REPORT_BATCH_CONCURRENCY,
+    rpm: Optional[float] = REPORT_BATCH_RPM,
+    tpm: Optional[float] = REPORT_BATCH_TPM,
+    resume: bool = True,
+    generate=generate_gemini_text,
+) -> Dict[str, Any]:
+    """
+    並行產生報告；同時處理中的公司數上限為 concurrency × 2，結果依輸入順序寫出。
+    """
+    checkpoint_path = Path(str(output_path) + ".checkpoint.jsonl")
+    done = _load_checkpoint(checkpoint_path) if resume else {}
+    if not resume and checkpoint_path.exists():
+        checkpoint_path.unlink()
+
+    batch = ReportBatch(RateLimiter(rpm, tpm), generate=generate)
+    checkpoint_lock = threading.Lock()
+    stats = {"companies": 0, "generated": 0, "resumed": 0, "cache_hits": 0, "errors": 0}
+
+    def _work(index: int, row: Dict[str, Any]) -> Dict[str, Any]:
+        record = batch.run_one(index, row)
+        if record["error"] is None:
+            with checkpoint_lock, open(checkpoint_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+    started = time.perf_counter()
+    with open(output_path, "w", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending: deque = deque()
+
+        def _emit(record: Dict[str, Any]) -> None:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            stats["companies"] += 1
+            if record["error"]:
+                stats["errors"] += 1
+            elif record["cache_hit"]:
+                stats["cache_hits"] += 1
+
+        for index, row in enumerate(read_companies(input_path)):
+            previous = done.get(index)
+            if previous is not None and previous.get("row_hash") == _row_hash(row):
+                pending.append(previous)
+                stats["resumed"] += 1
+            else:
+                pending.append(pool.submit(_work, index, row))
+                stats["generated"] += 1
+            # 依序寫出已完成的前段；在途數量達上限時等待最舊的一筆
+            while pending and (_is_ready(pending[0]) or len(pending) >= concurrency * 2):
+                _emit(_resolve(pending.popleft()))
+        while pending:
+            _emit(_resolve(pending.popleft()))
+
+    if stats["errors"] == 0 and checkpoint_path.exists():
+        checkpoint_path.unlink()
+    stats["elapsed_sec"] = round(time.perf_counter() - started, 2)
+    stats["rate_limit_wait_sec"] = round(batch.limiter.waited_sec, 2)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="批次產生年終獎金分配草案")
+    parser.add_argument("input", help="公司清單（.csv / .jsonl）")
+    parser.add_argument("-o", "--output", required=True, help="輸出 JSONL")
+    parser.add_argument("--concurrency", type=int, default=REPORT_BATCH_CONCURRENCY, help="同時呼叫 Gemini 的數量")
+    parser.add_argument("--rpm", type=float, default=REPORT_BATCH_RPM, help="每分鐘請求上限（0 表示不限）")
+    parser.add_argument("--tpm", type=float, default=REPORT_BATCH_TPM, help="每分鐘 token 上限（0 表示不限）")
+    parser.add_argument("--no-resume", action="store_true", help="忽略 checkpoint，全部重新產生")
+    args = parser.parse_args(argv)
+
+    stats = run_report_batch(
+        args.input, args.output,
+        concurrency=max(1, args.concurrency), rpm=args.rpm, tpm=args.tpm, resume=not args.no_resume,
+    )
+    print(
+        f"{'✅' if not stats['errors'] else '⚠️'} 完成 {stats['companies']} 家公司："
+        f"新產生 {stats['generated']}、沿用 checkpoint {stats['resumed']}、快取命中 {stats['cache_hits']}、"
+        f"失敗 {stats['errors']}；耗時 {stats['elapsed_sec']} 秒（限流等待 {stats['rate_limit_wait_sec']} 秒）→ {args.output}",
+        file=sys.stderr,
+    )
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
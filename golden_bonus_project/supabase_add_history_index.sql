@@ -0,0 +1,12 @@
+-- 可選：為對話歷史分頁載入（load_conversation_page）建立複合索引
+-- 游標為 (created_at, id)，查詢條件為 session_id = ? AND (created_at, id) < 游標，依 created_at DESC, id DESC 排序
+-- 有此索引時每一頁都只讀取需要的列，長對話翻到越前面也不會變慢
+
+CREATE INDEX IF NOT EXISTS idx_conversations_session_created_id
+ON conversations(session_id, created_at DESC, id DESC);
+
+-- 驗證：查看 conversations 表的索引
+SELECT indexname, indexdef
+FROM pg_indexes
+WHERE tablename = 'conversations'
+ORDER BY indexname;
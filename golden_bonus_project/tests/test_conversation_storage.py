@@ -0,0 +1,58 @@
+# tests/test_conversation_storage.py
+"""
+對話記錄背景寫入：暫存檔補送到一半失敗時只留下未送出的資料，殘行移到隔離檔不擋住其餘資料。
+"""
+import json
+
+import pytest
+
+import utils.conversation_storage as storage
+
+
+@pytest.fixture
+def write_queue(tmp_path):
+    return storage._ConversationWriteQueue(
+        batch_size=2, flush_interval=0.01, max_retries=0, retry_backoff=0.0,
+        spill_path=tmp_path / "spill.jsonl",
+    )
+
+
+def _rows(n):
+    return [{"session_id": "s", "content": f"m{i}"} for i in range(n)]
+
+
+def _read(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_replay_keeps_unsent_rows(write_queue, monkeypatch):
+    write_queue._append_spill(_rows(5))
+    sent = []
+
+    def insert(rows):
+        if len(sent) >= 2:
+            raise ConnectionError("down")
+        sent.extend(rows)
+        return True
+
+    monkeypatch.setattr(storage, "_insert_rows", insert)
+    write_queue._replay_spill()
+    assert sent == _rows(5)[:2]
+    assert _read(write_queue.spill_path) == _rows(5)[2:]
+    assert write_queue.stats["replayed"] == 2
+
+
+def test_replay_quarantines_partial_line(write_queue, monkeypatch):
+    write_queue._append_spill(_rows(2))
+    with open(write_queue.spill_path, "ab") as f:
+        f.write(b'{"session_id": "s", "cont')  # 寫到一半就中斷
+    write_queue._append_spill(_rows(3)[2:])
+    sent = []
+    monkeypatch.setattr(storage, "_insert_rows", lambda rows: sent.extend(rows) or True)
+
+    write_queue._replay_spill()
+    assert sent == _rows(3)
+    assert not write_queue.spill_path.exists()
+    bad = write_queue.spill_path.with_name("spill.jsonl.bad").read_bytes()
+    assert bad == b'{"session_id": "s", "cont\n'
+    assert write_queue.stats["quarantined"] == 1
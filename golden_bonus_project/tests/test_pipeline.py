@@ -0,0 +1,51 @@
+# tests/test_pipeline.py
+"""
+Pipeline.arun：同一階段的節點併發執行，只合併宣告的 writes；未宣告的寫入才提出警告。
+"""
+import asyncio
+import warnings
+
+import pytest
+
+from core.base_node import BaseNode
+from core.pipeline import Pipeline
+
+
+class _WriteNode(BaseNode):
+    def __init__(self, name, key, extra=None):
+        super().__init__(name)
+        self.reads = ("x",)
+        self.writes = (key,)
+        self.key = key
+        self.extra = extra
+
+    def execute(self, context):
+        context[self.key] = f"{self.name}:{context['x']}"
+        if self.extra:
+            context[self.extra] = self.name
+        return context
+
+
+def _arun(*nodes, **initial):
+    pipeline = Pipeline()
+    pipeline.tracer = None  # 不受追蹤設定影響
+    for node in nodes:
+        pipeline.add_node(node)
+    assert len(pipeline.stages()) == 1
+    return asyncio.run(pipeline.arun({"x": 1, **initial}))
+
+
+@pytest.mark.parametrize("initial", [{}, {"a": None, "b": None}], ids=["new_keys", "existing_keys"])
+def test_concurrent_declared_writes_merge_without_warning(initial):
+    # existing_keys：B 的輸入副本中 a 仍是舊值，不可被當成 B 的未宣告寫入
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        context = _arun(_WriteNode("A", "a"), _WriteNode("B", "b"), **initial)
+    assert context == {"x": 1, "a": "A:1", "b": "B:1"}
+
+
+def test_undeclared_write_warns_and_is_dropped():
+    with pytest.warns(RuntimeWarning, match="節點 B .*c") as record:
+        context = _arun(_WriteNode("A", "a"), _WriteNode("B", "b", extra="c"))
+    assert len(record) == 1
+    assert "c" not in context
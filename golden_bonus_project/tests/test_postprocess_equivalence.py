@@ -0,0 +1,83 @@
+# tests/test_postprocess_equivalence.py
+"""
+單次掃描的回覆後處理（整段與串流）必須與逐步處理的參考實作（benchmarks/reference.py）輸出完全相同。
+以固定種子隨機組合各種關鍵字、換行與空白，串流版另外隨機切分成不同大小的片段。
+"""
+import random
+
+import pytest
+
+import utils.gemini_client as gemini_client
+from benchmarks.reference import finalize_chain, stream_chain
+from benchmarks.stubs import STUB_RESPONSE
+from config.settings import ADVISOR_KEYWORDS
+from nodes.advisor import (
+    FOLLOWUP_MARKERS,
+    _escalation_block,
+    _needs_human_escalation,
+    _postprocess_response,
+    _stream_advisor_response,
+)
+
+CASES = 1500
+QUESTIONS = ["今年獎金池應該怎麼分配", "年終獎金要注意勞健保和稅務嗎"]
+FRAGMENTS = [
+    "獎金池建議", "依績效分配", "業務部", "研發", "C_", "C_01", "R_", "R_07", "C", "R", "_",
+    "？", "?", "請問", "能否", "可否", "可以提供", "方便提供", "提供", "請", "可以",
+    *FOLLOWUP_MARKERS, "###", "### 原理", "原理總覽",
+    *ADVISOR_KEYWORDS["refusal"], "無法", "不",
+    " ", "  ", "\t", "\n", "\n", "\n\n", "\r\n", "\r", "\x0b", "\x1c", " ", "- ",
+]
+
+
+def _random_reply(rng: random.Random) -> str:
+    return "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 30)))
+
+
+def _random_chunks(rng: random.Random, text: str) -> list[str]:
+    chunks = []
+    i = 0
+    while i < len(text):
+        size = rng.randint(1, 12)
+        chunks.append(text[i:i + size])
+        i += size
+    return chunks
+
+
+def _finalize(question: str, text: str, followup: bool) -> str:
+    # 與 AdvisorNode.finalize_response 相同的組合方式
+    response, refusal = _postprocess_response(text, followup=followup)
+    need_escalation, note = _needs_human_escalation(question, response, refusal=refusal)
+    if need_escalation:
+        response = (response or "").rstrip() + _escalation_block(note)
+    return response
+
+
+def _stream(monkeypatch, question: str, chunks: list[str], followup: bool) -> tuple[str, str]:
+    monkeypatch.setattr(gemini_client, "stream_gemini_logic", lambda *args: iter(chunks))
+    context = {}
+    intent = "CHAT_FOLLOWUP" if followup else "CHAT"
+    emitted = "".join(_stream_advisor_response(context, "", "", [], intent, question))
+    return emitted, context["ai_response"]
+
+
+@pytest.mark.parametrize("followup", [False, True], ids=["chat", "followup"])
+def test_whole_reply_matches_reference(followup):
+    rng = random.Random(20261017 + followup)
+    replies = ["", "\n", STUB_RESPONSE] + [_random_reply(rng) for _ in range(CASES)]
+    for text in replies:
+        question = rng.choice(QUESTIONS)
+        assert _finalize(question, text, followup) == finalize_chain(question, text, followup), repr(text)
+
+
+@pytest.mark.parametrize("followup", [False, True], ids=["chat", "followup"])
+def test_stream_matches_reference(monkeypatch, followup):
+    rng = random.Random(20261018 + followup)
+    replies = ["", "\n", STUB_RESPONSE] + [_random_reply(rng) for _ in range(CASES // 3)]
+    for text in replies:
+        question = rng.choice(QUESTIONS)
+        chunks = _random_chunks(rng, text)
+        expected = stream_chain(question, chunks, followup)
+        emitted, response = _stream(monkeypatch, question, chunks, followup)
+        assert emitted == expected, (repr(text), chunks)
+        assert response == expected, (repr(text), chunks)
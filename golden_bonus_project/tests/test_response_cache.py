@@ -0,0 +1,82 @@
+# tests/test_response_cache.py
+"""
+回覆快取：模糊命中不可跨越數字/金額/方向詞的差異，對話歷史與摘要要進快取鍵。
+"""
+import pytest
+
+from nodes.advisor import AdvisorNode
+from utils.response_cache import ResponseCache, context_hash
+
+BUCKET = ("CHAT", "kb1", "tpl1", "ctx1")
+
+
+@pytest.fixture(params=[False, True], ids=["memory", "sqlite"])
+def cache(request, tmp_path):
+    sqlite_path = str(tmp_path / "cache.sqlite") if request.param else None
+    return ResponseCache(max_entries=32, ttl=60.0, sqlite_path=sqlite_path)
+
+
+def _get(cache, question):
+    return cache.get(question, *BUCKET)
+
+
+def _seed(cache, question, response):
+    cache.put(question, *BUCKET, response)
+    if cache._db is not None:
+        # 只留 SQLite 層，確認兩層都套用同樣的規則
+        cache._entries.clear()
+
+
+def test_exact_and_filler_only_difference_hit(cache):
+    _seed(cache, "年終獎金池應該怎麼分配給各部門？", "A")
+    assert _get(cache, "年終獎金池應該怎麼分配給各部門") == "A"
+    assert _get(cache, "年終獎金池應該怎麼分配給各部門呢？") == "A"
+    assert cache.stats["fuzzy_hits"] == 1
+
+
+@pytest.mark.parametrize("cached_q, asked_q", [
+    ("我們公司有四十五人，年終獎金池應該抓多少比較合理", "我們公司有九十五人，年終獎金池應該抓多少比較合理"),
+    ("我們公司有45人，年終獎金池應該抓多少比較合理", "我們公司有95人，年終獎金池應該抓多少比較合理"),
+    ("平均月薪五萬二的話年終發幾個月比較合理", "平均月薪八萬二的話年終發幾個月比較合理"),
+    ("今年年終獎金發一點五個月算安全嗎", "今年年終獎金發一點五個月算危險嗎"),
+    ("今年年終獎金發一點五個月算安全嗎", "今年年終獎金發二點五個月算安全嗎"),
+    ("人事成本占毛利比例超過警戒值要怎麼調整獎金", "人事成本占毛利比例低於警戒值要怎麼調整獎金"),
+    ("業績下滑時可以照常發放年終獎金嗎", "業績下滑時不可以照常發放年終獎金嗎"),
+])
+def test_fuzzy_never_crosses_numbers_or_guard_words(cache, cached_q, asked_q):
+    _seed(cache, cached_q, "cached answer")
+    assert _get(cache, asked_q) is None
+    assert _get(cache, cached_q) == "cached answer"
+
+
+def test_context_hash_includes_history_and_summary():
+    base = context_hash("", {}, {}, "", [], "")
+    with_history = context_hash("", {}, {}, "", [{"role": "user", "parts": ["獎金池抓多少"]}], "")
+    with_summary = context_hash("", {}, {}, "", [], "先前討論過研發部分配")
+    assert len({base, with_history, with_summary}) == 3
+
+
+def _advisor_cache_key(history, summary=""):
+    context = {
+        "current_intent": "CHAT",
+        "latest_user_question": "為什麼",
+        "history": history,
+        "conversation_summary": summary,
+    }
+    return AdvisorNode("advisor").build_request(context)["cache_key"]
+
+
+def test_follow_up_question_not_shared_across_conversations():
+    first = _advisor_cache_key([
+        {"role": "user", "content": "人事成本比例偏高會有什麼風險？"},
+        {"role": "assistant", "content": "可能壓縮獲利。"},
+    ])
+    second = _advisor_cache_key([
+        {"role": "user", "content": "研發部和業務部的獎金權重該怎麼分？"},
+        {"role": "assistant", "content": "依增長引擎決定。"},
+    ])
+    if first is None:
+        pytest.skip("回覆快取未啟用")
+    assert first[0] == second[0]
+    assert first[-1] != second[-1]
+    assert _advisor_cache_key([]) != _advisor_cache_key([], summary="先前討論過研發部分配")
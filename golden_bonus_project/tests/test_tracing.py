@@ -0,0 +1,44 @@
+# tests/test_tracing.py
+"""
+追蹤輸出：JSONL 相對路徑以專案目錄為準；OTLP 以單一背景執行緒送出，佇列滿時丟棄、可 flush。
+"""
+import threading
+from pathlib import Path
+
+import core.tracing as tracing
+from core.tracing import OtlpHttpSpanExporter, get_default_tracer
+
+PROJECT_DIR = Path(tracing.__file__).resolve().parent.parent
+
+
+def test_jsonl_path_resolves_against_project_dir(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GOLDEN_TRACE_EXPORTERS", "jsonl")
+    monkeypatch.setenv("GOLDEN_TRACE_JSONL_PATH", "traces/spans.jsonl")
+    assert get_default_tracer().exporters[0].path == PROJECT_DIR / "traces" / "spans.jsonl"
+
+    absolute = tmp_path / "spans.jsonl"
+    monkeypatch.setenv("GOLDEN_TRACE_JSONL_PATH", str(absolute))
+    assert get_default_tracer().exporters[0].path == absolute
+
+
+def test_otlp_exporter_bounded_queue_and_flush(monkeypatch):
+    release = threading.Event()
+    posted = []
+
+    def slow_post(self, payload):
+        release.wait()
+        posted.append(payload)
+
+    monkeypatch.setattr(OtlpHttpSpanExporter, "_post", slow_post)
+    exporter = OtlpHttpSpanExporter("http://collector.invalid", "test", max_queue=4)
+    threads_before = threading.active_count()
+    for _ in range(20):
+        exporter.export([])
+    # 一個送出中、四個排隊，其餘丟棄；只多出一個背景執行緒
+    assert threading.active_count() == threads_before + 1
+    assert exporter.flush(timeout=0.05) is False
+    release.set()
+    assert exporter.flush(timeout=5.0) is True
+    assert len(posted) + exporter.stats["dropped"] == 20
+    assert 4 <= len(posted) <= 5
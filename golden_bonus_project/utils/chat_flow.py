@@ -0,0 +1,134 @@
+# utils/chat_flow.py
+"""
+聊天流程中與 UI 無關的部分：判斷使用者是否貼上企業補充資訊、組出送進 Pipeline 的 context，
+以及每一輪的歷史準備與訊息保存（加入對話、寫入 Supabase、附上摘要/用量 metadata、排程背景摘要）。
+main.py 與負載測試（benchmarks/load.py）共用，壓測走的是與正式畫面相同的路徑。
+
+會話狀態 state 只需要以屬性存取 messages / history_summary / history_fold_job / company_context_text，
+main.py 直接傳 st.session_state，負載測試傳 SimulatedSession。
+"""
+from typing import Any, Dict, List, Optional
+
+COMPANY_INFO_RECEIPT_MSG = "已收到企業補充資訊，後續提問將以此作為背景資料。以下先提供一段依知識庫框架的原理解讀。"
+# 收到補充資訊後自動送出的問題（原理解讀模式，不需使用者再問一次）
+COMPANY_INFO_EXPLAIN_QUESTION = "請用知識庫框架解說這份企業補充資訊的推導與解讀，全中文，不要給建議，不要反問。"
+
+
+def looks_like_company_report_payload(text: str) -> bool:
+    """
+    判斷使用者是否貼上「結構化公司補充資訊」。
+    嚴格但不依賴 report: 開頭：只要包含 company: 且同時包含其他常見區塊即可。
+    """
+    t = (text or "").lower()
+    if "company" not in t:
+        return False
+    blocks = ["financials", "bonus", "departments", "growthengine", "warnings", "recommendations"]
+    return any(b in t for b in blocks)
+
+
+def company_info_followup_context(company_context_text: str, history: List[Dict[str, Any]],
+                                  conversation_summary: str) -> Dict[str, Any]:
+    """
+    貼上補充資訊後的自動解說：CHAT_FOLLOWUP 意圖 + 固定問題。
+    """
+    return {
+        "current_intent": "CHAT_FOLLOWUP",
+        "latest_user_question": COMPANY_INFO_EXPLAIN_QUESTION,
+        "company_context_text": company_context_text,
+        "history": history,
+        "conversation_summary": conversation_summary,
+        "stream": True,
+    }
+
+
+def chat_context(prompt: str, company_context_text: str, history: List[Dict[str, Any]],
+                 conversation_summary: str) -> Dict[str, Any]:
+    """
+    一般提問（history 不含剛送出的這則訊息）。
+    """
+    return {
+        "current_intent": "CHAT",
+        "latest_user_question": prompt,
+        "company_context_text": company_context_text,
+        "history": history,
+        "conversation_summary": conversation_summary,
+        "stream": True,
+    }
+
+
+def turn_metadata(context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    這一輪訊息的基本 metadata：意圖與是否帶企業補充資訊。
+    """
+    return {
+        "intent": context.get("current_intent", "CHAT"),
+        "company_context": "present" if context.get("company_context_text") else "absent",
+    }
+
+
+def _save(session_id: str, role: str, content: str, metadata: Dict[str, Any]) -> None:
+    try:
+        from utils.conversation_storage import save_conversation
+        save_conversation(session_id, role, content, metadata)
+    except Exception:
+        pass  # 靜默失敗，不影響主流程
+
+
+def prepare_llm_history(state: Any, messages: List[Dict[str, Any]]) -> tuple:
+    """
+    送給模型的歷史（不呼叫模型）：上一次回覆後在背景進行的摘要若已完成就採用（存回 state），
+    回傳 (摘要之後的原文訊息, 摘要文字)。
+    """
+    from utils.summarizer import collect_fold, history_for_prompt
+    state.history_fold_job, state.history_summary = collect_fold(state.history_fold_job, state.history_summary)
+    return history_for_prompt(messages, state.history_summary)
+
+
+def record_company_receipt(state: Any, session_id: str) -> None:
+    """
+    收到企業補充資訊的回執：加入對話並保存。
+    """
+    state.messages.append({"role": "assistant", "content": COMPANY_INFO_RECEIPT_MSG})
+    _save(session_id, "assistant", COMPANY_INFO_RECEIPT_MSG, {"intent": "company_info_receipt"})
+
+
+def record_user_turn(state: Any, session_id: str, prompt: str) -> None:
+    state.messages.append({"role": "user", "content": prompt})
+    _save(session_id, "user", prompt, {
+        "intent": "CHAT",
+        "company_context": "present" if state.company_context_text else "absent",
+    })
+
+
+def assistant_metadata(state: Any, session_id: str, metadata: Dict[str, Any],
+                       result_context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    助理訊息的 metadata 附上目前的對話摘要（之後重新載入歷史時可直接還原，不必重新摘要），
+    以及這次回覆的用量紀錄（token / 成本 / 延遲，同時記入本程序的用量帳本供側邊欄顯示）。
+    """
+    from utils.summarizer import summary_metadata
+    metadata = {**metadata, **summary_metadata(state.history_summary, len(state.messages))}
+    usage = (result_context or {}).get("usage")
+    if usage:
+        from utils.metering import USAGE_METADATA_KEY, get_usage_ledger
+        get_usage_ledger().add(session_id, usage)
+        metadata[USAGE_METADATA_KEY] = usage
+    return metadata
+
+
+def record_assistant_turn(state: Any, session_id: str, response: str, metadata: Dict[str, Any],
+                          result_context: Optional[Dict[str, Any]] = None) -> None:
+    """
+    助理回覆顯示後呼叫：加入對話、連同摘要/用量 metadata 保存，
+    未摘要的歷史超過預算時在背景併入摘要（下一輪才採用，不佔這一輪的等待時間）。
+    """
+    state.messages.append({"role": "assistant", "content": response})
+    _save(session_id, "assistant", response, assistant_metadata(state, session_id, metadata, result_context))
+    if state.history_fold_job is None:
+        from utils.summarizer import schedule_fold
+        state.history_fold_job = schedule_fold(state.messages, state.history_summary)
+
+
+def record_error_turn(state: Any, session_id: str, error_msg: str) -> None:
+    state.messages.append({"role": "assistant", "content": error_msg})
+    _save(session_id, "assistant", error_msg, {"error": True})
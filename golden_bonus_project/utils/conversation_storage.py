@@ -2,23 +2,35 @@
 """
 對話記錄存儲模組：使用 Supabase 持久化對話歷史
 """
+import atexit
+import json
 import os
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timezone
 try:
     import streamlit as st  # type: ignore
 except ModuleNotFoundError:  # pragma: no cover
     st = None  # 允許在非 Streamlit 環境下 import
 
-# 自動判斷是本地開發還是雲端
-try:
-    from dotenv import load_dotenv  # type: ignore
-    load_dotenv()
-except ModuleNotFoundError:
-    pass
+from config.settings import (
+    CONVERSATION_BATCH_SIZE,
+    CONVERSATION_FLUSH_INTERVAL_SEC,
+    CONVERSATION_MAX_RETRIES,
+    CONVERSATION_RETRY_BACKOFF_SEC,
+    CONVERSATION_SPILL_FILE,
+    CONVERSATION_WRITE_BEHIND,
+    SUPABASE_CONFIG_TTL_SEC,
+    SUPABASE_FAILURE_COOLDOWN_SEC,
+)
+from utils.lazy import ensure_dotenv
 
 
-def get_supabase_config() -> tuple[Optional[str], Optional[str]]:
+def _read_supabase_config() -> tuple[Optional[str], Optional[str]]:
     """
     獲取 Supabase 配置，優先使用 Streamlit Secrets（雲端），其次使用環境變數（本地）
     
@@ -39,7 +51,8 @@ def get_supabase_config() -> tuple[Optional[str], Optional[str]]:
     except Exception:
         pass
     
-    # 其次使用環境變數（適用於本地開發）
+    # 其次使用環境變數（適用於本地開發；.env 在第一次需要時才載入）
+    ensure_dotenv()
     if not url:
         url = os.getenv("NEXT_PUBLIC_SUPABASE_URL") or os.getenv("SUPABASE_URL")
     if not key:
@@ -48,33 +61,415 @@ def get_supabase_config() -> tuple[Optional[str], Optional[str]]:
     return (url, key)
 
 
-def get_supabase_client():
+_config_cache: Dict[str, Any] = {"value": None, "loaded_at": 0.0}
+
+
+def get_supabase_config() -> tuple[Optional[str], Optional[str]]:
     """
-    獲取 Supabase 客戶端實例
+    同 _read_supabase_config，但結果快取 SUPABASE_CONFIG_TTL_SEC 秒，避免每次存取都重讀 secrets/環境變數。
     
     Returns:
-        supabase.Client 或 None（如果配置缺失或錯誤）
+        tuple: (supabase_url, supabase_key) 或 (None, None) 如果未配置
     """
-    try:
-        from supabase import create_client, Client
-    except ImportError:
-        # Supabase 模組未安裝，返回 None（允許應用在沒有 Supabase 時運行）
-        return None
+    now = time.monotonic()
+    cached = _config_cache["value"]
+    if cached is not None and now - _config_cache["loaded_at"] < SUPABASE_CONFIG_TTL_SEC:
+        return cached
+    value = _read_supabase_config()
+    _config_cache["value"] = value
+    _config_cache["loaded_at"] = now
+    return value
+
+
+def _is_unavailable_error(e: BaseException) -> bool:
+    """
+    判斷是否為「連不上」類錯誤（網路/逾時），這類錯誤才讓客戶端進入冷卻；
+    SQL/權限等應用層錯誤不影響連線狀態。
+    """
+    if isinstance(e, (OSError, ConnectionError, TimeoutError)):
+        return True
+    names = {cls.__name__ for cls in type(e).__mro__}
+    return bool(names & {"TransportError", "NetworkError", "TimeoutException", "ConnectError"})
+
+
+class _SupabaseClientRegistry:
+    """
+    程序層級的 Supabase 客戶端登錄表，依 (url, key) 共用同一個客戶端（連線池因此可重複使用）。
+    建立失敗或連線中斷時記下失敗時間，冷卻期間直接回傳 None，不會每則訊息都再嘗試連線一次。
+    同時統計命中/未命中、冷卻略過次數與各操作延遲。
+    """
+
+    def __init__(self, cooldown: float):
+        self.cooldown = cooldown
+        self._clients: Dict[tuple, Any] = {}
+        self._failed_at: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        self._sdk = None
+        self._sdk_missing = False
+        self.stats: Dict[str, Any] = {
+            "hits": 0, "misses": 0, "create_failures": 0, "cooldown_skips": 0,
+            "create_ms_total": 0.0, "ops": 0, "op_errors": 0, "op_ms_total": 0.0, "op_ms_max": 0.0,
+        }
+
+    def _create_client_fn(self):
+        if self._sdk is None and not self._sdk_missing:
+            try:
+                from supabase import create_client
+                self._sdk = create_client
+            except ImportError:
+                # Supabase 模組未安裝：記住結果，之後不再嘗試 import
+                self._sdk_missing = True
+        return self._sdk
+
+    def get(self, url: str, key: str, force: bool = False):
+        create_client = self._create_client_fn()
+        if create_client is None:
+            return None
+
+        cache_key = (url, key)
+        with self._lock:
+            client = self._clients.get(cache_key)
+            if client is not None:
+                self.stats["hits"] += 1
+                return client
+            failed_at = self._failed_at.get(cache_key)
+            if not force and failed_at is not None and time.monotonic() - failed_at < self.cooldown:
+                self.stats["cooldown_skips"] += 1
+                return None
+
+            self.stats["misses"] += 1
+            started = time.perf_counter()
+            try:
+                client = create_client(url, key)
+            except Exception:
+                self.stats["create_failures"] += 1
+                self._failed_at[cache_key] = time.monotonic()
+                return None
+            finally:
+                self.stats["create_ms_total"] += (time.perf_counter() - started) * 1000
+            self._clients[cache_key] = client
+            self._failed_at.pop(cache_key, None)
+            return client
+
+    def mark_unavailable(self, url: str, key: str) -> None:
+        with self._lock:
+            self._clients.pop((url, key), None)
+            self._failed_at[(url, key)] = time.monotonic()
+
+    @contextmanager
+    def track(self, url: str, key: str):
+        """
+        包住一次 Supabase 操作：記錄延遲；若是連不上的錯誤，丟掉客戶端並進入冷卻，再把例外往上拋。
+        """
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception as e:
+            failed = True
+            if _is_unavailable_error(e):
+                self.mark_unavailable(url, key)
+            raise
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            # 背景寫入執行緒與請求執行緒會同時更新統計，需持鎖避免 += 遺失
+            with self._lock:
+                self.stats["ops"] += 1
+                self.stats["op_errors"] += int(failed)
+                self.stats["op_ms_total"] += elapsed
+                self.stats["op_ms_max"] = max(self.stats["op_ms_max"], elapsed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        統計的一致快照（持鎖複製）。
+        """
+        with self._lock:
+            return dict(self.stats)
+
+    def client_count(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+            self._failed_at.clear()
+
+
+_registry = _SupabaseClientRegistry(cooldown=SUPABASE_FAILURE_COOLDOWN_SEC)
+
+
+def get_supabase_client(force: bool = False):
+    """
+    獲取 Supabase 客戶端實例（程序內依 url/key 共用；連線失敗後冷卻期間直接回傳 None）
     
+    Args:
+        force: True 時忽略冷卻狀態重新嘗試（例如使用者手動按「測試連線」）
+    
+    Returns:
+        supabase.Client 或 None（如果配置缺失、模組未安裝或處於失敗冷卻期）
+    """
     url, key = get_supabase_config()
     if not url or not key:
         return None
-    
-    try:
-        client: Client = create_client(url, key)
-        return client
-    except Exception as e:
-        # 靜默失敗，不影響應用啟動
-        # 如果需要調試，可以在這裡記錄錯誤
-        return None
+    return _registry.get(url, key, force=force)
+
+
+def get_supabase_stats() -> Dict[str, Any]:
+    """
+    客戶端登錄表統計：命中/未命中、建立失敗、冷卻略過次數，以及操作次數與延遲（毫秒）。
+    """
+    stats = _registry.snapshot()
+    stats["op_ms_avg"] = (stats["op_ms_total"] / stats["ops"]) if stats["ops"] else 0.0
+    stats["clients"] = _registry.client_count()
+    return stats
+
+
+def reset_supabase_clients() -> None:
+    """
+    清掉共用客戶端、失敗冷卻與設定快取（例如更新 Secrets 後）。
+    """
+    _registry.clear()
+    _config_cache["value"] = None
+
+
+def _insert_rows(rows: List[Dict[str, Any]]) -> bool:
+    """
+    以單次多列 insert 寫入 conversations 表；失敗時拋出例外（由呼叫端決定重試或靜默）。
+    回傳 False 表示 Supabase 未配置/無法建立客戶端。
+    """
+    client = get_supabase_client()
+    if not client:
+        return False
+    url, key = get_supabase_config()
+    with _registry.track(url, key):
+        result = client.table("conversations").insert(rows).execute()
+    return len(result.data) > 0
+
+
+class _ConversationWriteQueue:
+    """
+    對話記錄的背景寫入佇列（write-behind）：
+    - save_conversation 只把資料放進記憶體佇列，聊天請求不再等待資料庫往返
+    - 背景執行緒累積到 batch_size 筆或等待超過 flush_interval 秒就合併成一次多列 insert
+    - 寫入失敗以指數退避重試；仍失敗（或 Supabase 無法連線）時寫入本地 JSONL 暫存檔，
+      下次成功寫入後再自動補送
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_retries: int,
+                 retry_backoff: float, spill_path: Path):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff = retry_backoff
+        self.spill_path = spill_path
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._spill_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # 尚未處理完（寫入或落地暫存）的筆數；歸零時喚醒 flush() 的等待者
+        self._pending = 0
+        self._idle = threading.Condition()
+        # spilled：累計落地到暫存檔的筆數（補送失敗留在檔案的不重複計）；dropped：連暫存檔都寫不進而放棄的筆數；
+        # quarantined：暫存檔中無法解析、移到隔離檔（<暫存檔>.bad）的行數
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "retries": 0, "spilled": 0, "replayed": 0,
+                      "dropped": 0, "quarantined": 0}
+
+    def put(self, row: Dict[str, Any]) -> None:
+        self._ensure_started()
+        with self._idle:
+            self._pending += 1
+            self.stats["queued"] += 1
+        self._queue.put(row)
+
+    def pending(self) -> int:
+        with self._idle:
+            return self._pending
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待佇列中所有資料處理完（寫入或落地暫存）；timeout 秒內未完成回傳 False。
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def _done(self, count: int) -> None:
+        with self._idle:
+            self._pending -= count
+            if self._pending <= 0:
+                self._idle.notify_all()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="conversation-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception:
+                # 背景執行緒不可中斷：任何意外都當成寫入失敗落地暫存
+                self._spill(batch)
+            finally:
+                self._done(len(batch))
+
+    def _write_batch(self, rows: List[Dict[str, Any]]) -> None:
+        if self._insert_with_retry(rows):
+            self.stats["written"] += len(rows)
+            self.stats["batches"] += 1
+            self._replay_spill()
+        else:
+            self._spill(rows)
+
+    def _insert_with_retry(self, rows: List[Dict[str, Any]]) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                if _insert_rows(rows):
+                    return True
+                # 未配置/無法建立客戶端：重試也沒有意義
+                return False
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    _debug_print(f"    錯誤詳情: {str(e)}")
+                    return False
+                self.stats["retries"] += 1
+                time.sleep(self.retry_backoff * (2 ** attempt))
+        return False
+
+    def _spill(self, rows: List[Dict[str, Any]]) -> None:
+        if self._append_spill(rows):
+            self.stats["spilled"] += len(rows)
+
+    def _append_spill(self, rows: List[Dict[str, Any]]) -> bool:
+        try:
+            with self._spill_lock:
+                with open(self.spill_path, "ab+") as f:
+                    # 上次寫到一半就中斷（例如程序崩潰）的最後一行沒有換行：先補上，避免與新資料黏成同一行
+                    if f.seek(0, os.SEEK_END) > 0:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            f.write(b"\n")
+                    f.write(b"".join(_spill_line(row) for row in rows))
+            return True
+        except OSError:
+            # 連本地檔案都寫不了（例如唯讀檔案系統）：只能放棄，不影響主流程
+            self.stats["dropped"] += len(rows)
+            return False
+
+    def _replay_spill(self) -> None:
+        """
+        把先前落地的資料分批補送。補送完成前暫存檔保留原位（中途崩潰時下次會重送，不會遺失），
+        結束後只把沒送出的資料寫入新檔再換掉原檔；無法解析的行（例如寫到一半崩潰留下的殘行）
+        移到隔離檔，不會擋住其餘資料。
+        """
+        with self._spill_lock:
+            try:
+                with open(self.spill_path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                return
 
+        rows: List[Dict[str, Any]] = []
+        bad: List[bytes] = []
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            if isinstance(row, dict):
+                rows.append(row)
+            else:
+                bad.append(line)
+        if bad:
+            self._quarantine(bad)
 
-def save_conversation(session_id: str, role: str, content: str, metadata: Optional[Dict[str, Any]] = None) -> bool:
+        sent = 0
+        for start in range(0, len(rows), self.batch_size):
+            chunk = rows[start:start + self.batch_size]
+            if not self._insert_with_retry(chunk):
+                # 剩下的資料當初落地時已計入 spilled，留在檔案中等下次補送
+                break
+            sent += len(chunk)
+            self.stats["replayed"] += len(chunk)
+        if sent or bad:
+            self._rewrite_spill(rows[sent:], len(data))
+
+    def _rewrite_spill(self, rows: List[Dict[str, Any]], read_size: int) -> None:
+        """
+        以 rows 加上讀取之後才附加到檔案的資料取代暫存檔（先寫暫存檔再 rename，過程中原檔始終完整）。
+        """
+        tmp_path = self.spill_path.with_name(self.spill_path.name + ".tmp")
+        with self._spill_lock:
+            try:
+                with open(self.spill_path, "rb") as f:
+                    f.seek(read_size)
+                    appended = f.read()
+                if not rows and not appended.strip():
+                    self.spill_path.unlink()
+                    return
+                with open(tmp_path, "wb") as f:
+                    f.write(b"".join(_spill_line(row) for row in rows))
+                    f.write(appended)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.spill_path)
+            except OSError:
+                # 換不掉原檔時原檔保持不變：已送出的資料下次會重送一次
+                return
+
+    def _quarantine(self, lines: List[bytes]) -> None:
+        """
+        無法解析的行另存到隔離檔（保留原始內容供人工檢查），不再參與補送。
+        """
+        try:
+            with open(self.spill_path.with_name(self.spill_path.name + ".bad"), "ab") as f:
+                f.write(b"".join(line + b"\n" for line in lines))
+            self.stats["quarantined"] += len(lines)
+        except OSError:
+            self.stats["dropped"] += len(lines)
+
+
+def _spill_line(row: Dict[str, Any]) -> bytes:
+    return (json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _debug_print(message: str) -> None:
+    # 在測試模式下輸出錯誤信息，幫助調試
+    import sys
+    if "test" in sys.argv[0].lower() or "test_supabase" in sys.argv[0]:
+        print(message)
+
+
+_write_queue = _ConversationWriteQueue(
+    batch_size=CONVERSATION_BATCH_SIZE,
+    flush_interval=CONVERSATION_FLUSH_INTERVAL_SEC,
+    max_retries=CONVERSATION_MAX_RETRIES,
+    retry_backoff=CONVERSATION_RETRY_BACKOFF_SEC,
+    spill_path=Path(__file__).resolve().parent.parent / CONVERSATION_SPILL_FILE,
+)
+# 程序結束前盡量把佇列寫完（最多等幾秒，不阻塞關閉流程太久）
+atexit.register(lambda: _write_queue.flush(timeout=5.0))
+
+
+def save_conversation(session_id: str, role: str, content: str, metadata: Optional[Dict[str, Any]] = None,
+                      sync: bool = False) -> bool:
     """
     保存單條對話訊息到 Supabase
     
@@ -83,34 +478,50 @@ def save_conversation(session_id: str, role: str, content: str, metadata: Option
         role: 角色（"user" 或 "assistant"）
         content: 訊息內容
         metadata: 可選的元數據（如 intent、company_context 等）
+        sync: True 時同步寫入並回傳實際結果；預設放進背景寫入佇列，不等待資料庫
     
     Returns:
-        bool: 是否成功保存
+        bool: 同步模式為是否成功保存；背景模式為是否成功排入佇列（未配置 Supabase 時為 False）
     """
-    client = get_supabase_client()
-    if not client:
+    url, key = get_supabase_config()
+    if not url or not key:
         return False
-    
+
+    data = {
+        "session_id": session_id,
+        "role": role,
+        "content": content,
+        "metadata": metadata or {},
+        # 背景批次寫入/補送會延後實際 insert 時間，因此在排入時就記下訊息時間，避免順序與時間失真
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+    if not sync and CONVERSATION_WRITE_BEHIND:
+        _write_queue.put(data)
+        return True
+
     try:
-        data = {
-            "session_id": session_id,
-            "role": role,
-            "content": content,
-            "metadata": metadata or {}
-        }
-        # 注意：created_at 會由資料庫自動設定，不需要手動傳入
-        
-        result = client.table("conversations").insert(data).execute()
-        return len(result.data) > 0
+        return _insert_rows([data])
     except Exception as e:
-        # 在測試模式下輸出錯誤信息，幫助調試
-        import sys
-        if "test" in sys.argv[0].lower() or "test_supabase" in sys.argv[0]:
-            print(f"    錯誤詳情: {str(e)}")
+        _debug_print(f"    錯誤詳情: {str(e)}")
         # 靜默失敗，不影響主流程
         return False
 
 
+def flush_conversations(timeout: Optional[float] = None) -> bool:
+    """
+    等待背景佇列中的對話記錄全部處理完（寫入 Supabase 或落地暫存檔）。
+    """
+    return _write_queue.flush(timeout)
+
+
+def get_write_queue_stats() -> Dict[str, int]:
+    """
+    背景寫入佇列的統計：排入/寫入/批次數/重試/落地暫存/補送筆數與目前待處理筆數。
+    """
+    return {**_write_queue.stats, "pending": _write_queue.pending()}
+
+
 def load_conversation_history(session_id: str, limit: int = 100) -> List[Dict[str, Any]]:
     """
     從 Supabase 載入指定會話的對話歷史
@@ -127,14 +538,16 @@ def load_conversation_history(session_id: str, limit: int = 100) -> List[Dict[st
         return []
     
     try:
-        result = (
-            client.table("conversations")
-            .select("role, content")
-            .eq("session_id", session_id)
-            .order("created_at")
-            .limit(limit)
-            .execute()
-        )
+        url, key = get_supabase_config()
+        with _registry.track(url, key):
+            result = (
+                client.table("conversations")
+                .select("role, content")
+                .eq("session_id", session_id)
+                .order("created_at")
+                .limit(limit)
+                .execute()
+            )
         
         # 轉換為標準格式
         messages = []
@@ -149,6 +562,114 @@ def load_conversation_history(session_id: str, limit: int = 100) -> List[Dict[st
         return []
 
 
+def load_conversation_page(
+    session_id: str,
+    limit: int = 50,
+    before: Optional[Tuple[str, int]] = None,
+) -> Dict[str, Any]:
+    """
+    以 (created_at, id) 為游標分頁載入對話歷史：先取最新的 limit 則，再依游標往前取更早的訊息。
+    同一時間戳的多筆訊息以 id 決定先後，翻頁時不會重複或遺漏（需要 supabase_add_history_index.sql 的複合索引才不會掃全表）。
+
+    Args:
+        session_id: Streamlit session ID
+        limit: 每頁訊息數量
+        before: 上一頁回傳的 cursor；None 表示從最新的訊息開始
+
+    Returns:
+        Dict: messages（依時間由舊到新，格式同 load_conversation_history）、
+              metadata（與 messages 一一對應的 metadata，例如對話摘要）、
+              cursor（本頁最舊一則的 (created_at, id)，用來載入更早的一頁）、has_more（是否還有更早的訊息）
+    """
+    empty = {"messages": [], "metadata": [], "cursor": before, "has_more": False}
+    client = get_supabase_client()
+    if not client:
+        return empty
+
+    try:
+        url, key = get_supabase_config()
+        query = (
+            client.table("conversations")
+            .select("id, role, content, metadata, created_at")
+            .eq("session_id", session_id)
+        )
+        if before is not None:
+            created_at, row_id = before
+            query = query.or_(
+                f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{int(row_id)})'
+            )
+        with _registry.track(url, key):
+            # 多取一筆用來判斷是否還有更早的訊息
+            result = (
+                query.order("created_at", desc=True)
+                .order("id", desc=True)
+                .limit(limit + 1)
+                .execute()
+            )
+
+        rows = result.data or []
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if not rows:
+            return empty
+
+        oldest = rows[-1]
+        rows.reverse()
+        return {
+            "messages": [{"role": row.get("role", ""), "content": row.get("content", "")} for row in rows],
+            "metadata": [row.get("metadata") or {} for row in rows],
+            "cursor": (oldest["created_at"], oldest["id"]),
+            "has_more": has_more,
+        }
+    except Exception:
+        return empty
+
+
+def load_usage_records(
+    session_id: Optional[str] = None,
+    since: Optional[str] = None,
+    limit: int = 5000,
+) -> List[Dict[str, Any]]:
+    """
+    讀取帶有用量紀錄（metadata.usage，見 utils/metering.py）的對話記錄，供彙總報表使用。
+
+    Args:
+        session_id: 只讀取指定會話；None 為全部
+        since: 起始時間（ISO 格式，例如 "2025-01-01"）
+        limit: 最多讀取筆數（由新到舊）
+
+    Returns:
+        List[Dict]: [{"session_id", "created_at", "usage"}]
+    """
+    client = get_supabase_client()
+    if not client:
+        return []
+
+    try:
+        url, key = get_supabase_config()
+        query = (
+            client.table("conversations")
+            .select("session_id, metadata, created_at")
+            .not_.is_("metadata->usage", "null")
+        )
+        if session_id:
+            query = query.eq("session_id", session_id)
+        if since:
+            query = query.gte("created_at", since)
+        with _registry.track(url, key):
+            result = query.order("created_at", desc=True).limit(limit).execute()
+        return [
+            {
+                "session_id": row.get("session_id"),
+                "created_at": row.get("created_at"),
+                "usage": (row.get("metadata") or {}).get("usage"),
+            }
+            for row in result.data or []
+        ]
+    except Exception:
+        return []
+
+
 def test_supabase_connection() -> tuple[bool, str]:
     """
     測試 Supabase 連線
@@ -156,7 +677,7 @@ def test_supabase_connection() -> tuple[bool, str]:
     Returns:
         tuple: (是否成功, 訊息)
     """
-    client = get_supabase_client()
+    client = get_supabase_client(force=True)
     if not client:
         url, key = get_supabase_config()
         if not url:
@@ -167,7 +688,9 @@ def test_supabase_connection() -> tuple[bool, str]:
     
     try:
         # 簡單查詢測試（嘗試讀取 conversations 表）
-        result = client.table("conversations").select("id").limit(1).execute()
+        url, key = get_supabase_config()
+        with _registry.track(url, key):
+            result = client.table("conversations").select("id").limit(1).execute()
         return (True, "Supabase 連線成功，conversations 表可訪問")
     except Exception as e:
         error_msg = str(e)
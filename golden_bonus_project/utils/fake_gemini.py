@@ -0,0 +1,472 @@
+# utils/fake_gemini.py
+"""
+Gemini 離線替身：不需要 API Key 與網路，用來離線測試並行、重試、快取與串流。
+
+可調整的行為：
+- 首段延遲（TTFT）與輸出速度（tokens/sec），串流時逐段輸出
+- 依機率注入 429 / 500 錯誤（例外帶有 .code，gemini_client 會照常判斷狀態碼與是否重試）
+- 依提問比對正規表示式回傳固定回覆，回覆中的 {message} 會代入提問
+- 統計請求數、錯誤數與同時進行中的最大請求數
+
+兩種用法：
+1. 程序內：GEMINI_BACKEND=fake（或 gemini_client.set_backend(FakeGemini(...))）
+2. 本地伺服器（Gemini REST 格式：generateContent / streamGenerateContent?alt=sse）：
+       python -m utils.fake_gemini --port 8089 --ttft 0.5 --tps 40 --error-429 0.1
+   再以 GEMINI_BACKEND=http://127.0.0.1:8089 啟動應用程式（多個程序可共用同一個替身）
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config.settings import (
+    FAKE_GEMINI_ERROR_429_RATE,
+    FAKE_GEMINI_ERROR_500_RATE,
+    FAKE_GEMINI_RESPONSES,
+    FAKE_GEMINI_SEED,
+    FAKE_GEMINI_TOKENS_PER_SEC,
+    FAKE_GEMINI_TTFT_SEC,
+)
+from utils.prompt_builder import estimate_tokens
+
+DEFAULT_RESPONSE = (
+    "### 初步建議\n"
+    "（離線替身回覆）已收到您的問題：{message}\n"
+    "- 年終獎金建議以淨利與人事成本比例共同評估。\n"
+    "- 發放前可先確認保留盈餘足以支應營運週轉。\n"
+)
+# 串流時每段的字數（中文約 1 字 1 token）
+CHUNK_CHARS = 16
+
+_ERROR_STATUS = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL"}
+
+
+class FakeGeminiError(Exception):
+    """
+    注入的錯誤；code 為 HTTP 狀態碼，訊息格式比照 google.api_core（例如「429 Resource exhausted」）。
+    """
+
+    def __init__(self, code: int, message: str = ""):
+        self.code = code
+        super().__init__(f"{code} {message or _ERROR_STATUS.get(code, 'ERROR')}")
+
+
+def _usage_metadata(prompt_tokens: int, output_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=output_tokens,
+        total_token_count=prompt_tokens + output_tokens,
+    )
+
+
+def _compile_responses(responses: Sequence[Any]) -> List[Tuple[re.Pattern, str]]:
+    """
+    固定回覆可寫成 [(pattern, text)] 或 [{"pattern": ..., "text": ...}]（JSON 檔用）。
+    """
+    compiled = []
+    for item in responses or []:
+        pattern, text = (item["pattern"], item["text"]) if isinstance(item, dict) else item
+        compiled.append((re.compile(pattern, re.S), text))
+    return compiled
+
+
+# ==================== 程序內替身 ====================
+
+
+class FakeResponse:
+    """
+    仿 google.generativeai 的回應：.text、usage_metadata；串流時可逐段迭代（每段有 .text）。
+    """
+
+    def __init__(self, engine: "FakeGemini", text: str, usage: SimpleNamespace, stream: bool):
+        self._engine = engine
+        self._stream = stream
+        self._full_text = text
+        self.usage_metadata = usage
+        if stream:
+            self.text = ""
+        else:
+            try:
+                for _ in engine.paced_chunks(text):
+                    pass
+            finally:
+                engine._end()
+            self.text = text
+
+    def __iter__(self) -> Iterator[SimpleNamespace]:
+        if not self._stream:
+            yield SimpleNamespace(text=self.text)
+            return
+        try:
+            for piece in self._engine.paced_chunks(self._full_text):
+                self.text += piece
+                yield SimpleNamespace(text=piece)
+        finally:
+            self._engine._end()
+
+
+class _FakeChat:
+    def __init__(self, engine: "FakeGemini", system_prompt: str, history: List[Dict[str, Any]]):
+        self._engine = engine
+        self._system_prompt = system_prompt or ""
+        self._history = history
+
+    def send_message(self, message: str, stream: bool = False) -> FakeResponse:
+        return self._engine.generate(self._system_prompt, self._history, message, stream=stream)
+
+
+class FakeGemini:
+    """
+    程序內的 Gemini 替身（gemini_client 的後端介面）；可跨執行緒共用。
+    """
+    name = "fake"
+    requires_api_key = False
+
+    def __init__(
+        self,
+        ttft: float = 0.0,
+        tokens_per_sec: float = 0.0,
+        error_429_rate: float = 0.0,
+        error_500_rate: float = 0.0,
+        responses: Sequence[Any] = (),
+        default_response: str = DEFAULT_RESPONSE,
+        seed: Optional[int] = None,
+    ):
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.error_429_rate = error_429_rate
+        self.error_500_rate = error_500_rate
+        self.responses = _compile_responses(responses)
+        self.default_response = default_response
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @classmethod
+    def from_settings(cls, **overrides) -> "FakeGemini":
+        params = dict(
+            ttft=FAKE_GEMINI_TTFT_SEC,
+            tokens_per_sec=FAKE_GEMINI_TOKENS_PER_SEC,
+            error_429_rate=FAKE_GEMINI_ERROR_429_RATE,
+            error_500_rate=FAKE_GEMINI_ERROR_500_RATE,
+            responses=FAKE_GEMINI_RESPONSES,
+            seed=FAKE_GEMINI_SEED,
+        )
+        params.update(overrides)
+        return cls(**params)
+
+    # ---------- 後端介面 ----------
+
+    def start_chat(self, api_key, system_prompt, model, temperature, max_tokens, history) -> _FakeChat:
+        return _FakeChat(self, system_prompt, list(history or []))
+
+    # ---------- 回覆與節奏 ----------
+
+    def reply_for(self, message: str) -> str:
+        for pattern, text in self.responses:
+            if pattern.search(message or ""):
+                return text.replace("{message}", message or "")
+        return self.default_response.replace("{message}", message or "")
+
+    def paced_chunks(self, text: str) -> Iterator[str]:
+        """
+        依 TTFT 與 tokens/sec 的節奏切段輸出（伺服器模式也共用）。
+        """
+        if self.ttft > 0:
+            time.sleep(self.ttft)
+        for start in range(0, len(text), CHUNK_CHARS):
+            piece = text[start:start + CHUNK_CHARS]
+            # 第一段在 TTFT 時送出，之後每段依輸出速度間隔
+            if start and self.tokens_per_sec > 0:
+                time.sleep(estimate_tokens(piece) / self.tokens_per_sec)
+            yield piece
+
+    def usage_for(self, system_prompt: str, history: List[Dict[str, Any]], message: str, text: str) -> SimpleNamespace:
+        prompt_tokens = estimate_tokens(system_prompt) + estimate_tokens(message or "") + sum(
+            estimate_tokens(m.get("content", "")) for m in history
+        )
+        return _usage_metadata(prompt_tokens, estimate_tokens(text))
+
+    def generate(self, system_prompt: str, history: List[Dict[str, Any]], message: str, stream: bool = False) -> FakeResponse:
+        self._begin()
+        text = self.reply_for(message)
+        return FakeResponse(self, text, self.usage_for(system_prompt, history, message, text), stream)
+
+    # ---------- 錯誤注入與統計 ----------
+
+    def _begin(self) -> None:
+        with self._lock:
+            self._stats["requests"] += 1
+            roll = self._random.random()
+            code = None
+            if roll < self.error_429_rate:
+                code = 429
+            elif roll < self.error_429_rate + self.error_500_rate:
+                code = 500
+            if code is not None:
+                self._stats[f"errors_{code}"] += 1
+            else:
+                self._stats["in_flight"] += 1
+                self._stats["max_in_flight"] = max(self._stats["max_in_flight"], self._stats["in_flight"])
+        if code is not None:
+            raise FakeGeminiError(code)
+
+    def _end(self) -> None:
+        with self._lock:
+            self._stats["in_flight"] -= 1
+            self._stats["completed"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        {"requests", "completed", "errors_429", "errors_500", "in_flight", "max_in_flight"}
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {
+                "requests": 0, "completed": 0, "errors_429": 0, "errors_500": 0,
+                "in_flight": 0, "max_in_flight": 0,
+            }
+
+
+# ==================== 本地替身伺服器（Gemini REST 格式） ====================
+
+
+def _candidate(text: str) -> Dict[str, Any]:
+    return {"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}
+
+
+def _usage_json(usage: SimpleNamespace) -> Dict[str, int]:
+    return {
+        "promptTokenCount": usage.prompt_token_count,
+        "candidatesTokenCount": usage.candidates_token_count,
+        "totalTokenCount": usage.total_token_count,
+    }
+
+
+def _parse_request(payload: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]], str]:
+    """
+    REST 請求 → (system_prompt, history, 本次提問)；contents 最後一則為本次提問。
+    """
+    def _text(content: Dict[str, Any]) -> str:
+        return "".join(part.get("text", "") for part in content.get("parts", []))
+
+    system_prompt = _text(payload.get("systemInstruction") or payload.get("system_instruction") or {})
+    contents = payload.get("contents") or []
+    history = [
+        {"role": "assistant" if c.get("role") == "model" else "user", "content": _text(c)}
+        for c in contents[:-1]
+    ]
+    message = _text(contents[-1]) if contents else ""
+    return system_prompt, history, message
+
+
+def _make_handler(engine: FakeGemini):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # 壓測時不逐筆輸出
+            pass
+
+        def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            match = re.match(r"^/v1beta/models/([^/:]+):(generateContent|streamGenerateContent)", self.path)
+            if not match:
+                self._send_json(404, {"error": {"code": 404, "message": f"未知路徑：{self.path}", "status": "NOT_FOUND"}})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json(400, {"error": {"code": 400, "message": "請求不是合法 JSON", "status": "INVALID_ARGUMENT"}})
+                return
+            system_prompt, history, message = _parse_request(payload)
+            stream = match.group(2) == "streamGenerateContent"
+            try:
+                response = engine.generate(system_prompt, history, message, stream=stream)
+            except FakeGeminiError as e:
+                self._send_json(e.code, {"error": {"code": e.code, "message": str(e), "status": _ERROR_STATUS.get(e.code, "UNKNOWN")}})
+                return
+
+            if not stream:
+                self._send_json(200, {"candidates": [_candidate(response.text)], "usageMetadata": _usage_json(response.usage_metadata)})
+                return
+
+            # SSE：每段一個事件，最後一段附上整段回覆的用量
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            pieces = iter(response)
+            current = next(pieces, None)
+            while current is not None:
+                following = next(pieces, None)
+                event: Dict[str, Any] = {"candidates": [_candidate(current.text)]}
+                if following is None:
+                    event["usageMetadata"] = _usage_json(response.usage_metadata)
+                self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                current = following
+
+    return Handler
+
+
+def serve(engine: FakeGemini, host: str = "127.0.0.1", port: int = 8089) -> ThreadingHTTPServer:
+    """
+    建立替身伺服器（尚未開始服務）；呼叫端執行 serve_forever()，或放到背景執行緒。
+    port=0 時由系統指定，實際埠號見 server.server_address。
+    """
+    server = ThreadingHTTPServer((host, port), _make_handler(engine))
+    server.daemon_threads = True
+    return server
+
+
+# ==================== 連線到替身伺服器的後端 ====================
+
+
+class _HttpResponse:
+    def __init__(self, text: str = "", usage: Optional[SimpleNamespace] = None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class _HttpStreamResponse(_HttpResponse):
+    def __init__(self, raw):
+        super().__init__()
+        self._raw = raw
+
+    def __iter__(self) -> Iterator[SimpleNamespace]:
+        with self._raw:
+            for line in self._raw:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                piece = _event_text(event)
+                if "usageMetadata" in event:
+                    self.usage_metadata = _usage_from_json(event["usageMetadata"])
+                if piece:
+                    self.text += piece
+                    yield SimpleNamespace(text=piece)
+
+
+def _event_text(event: Dict[str, Any]) -> str:
+    candidates = event.get("candidates") or [{}]
+    return "".join(part.get("text", "") for part in candidates[0].get("content", {}).get("parts", []))
+
+
+def _usage_from_json(meta: Dict[str, int]) -> SimpleNamespace:
+    return _usage_metadata(int(meta.get("promptTokenCount", 0)), int(meta.get("candidatesTokenCount", 0)))
+
+
+class _HttpChat:
+    def __init__(self, backend: "HttpGeminiBackend", system_prompt: str, model: str,
+                 temperature: float, max_tokens: int, history: List[Dict[str, Any]]):
+        self._backend = backend
+        self._model = model
+        self._payload = {
+            "systemInstruction": {"parts": [{"text": system_prompt or ""}]},
+            "generationConfig": {"temperature": temperature, "maxOutputTokens": max_tokens},
+        }
+        self._contents = [
+            {"role": "model" if m.get("role") == "assistant" else "user", "parts": [{"text": m.get("content", "")}]}
+            for m in history
+            if m.get("content")
+        ]
+
+    def send_message(self, message: str, stream: bool = False):
+        method = "streamGenerateContent?alt=sse" if stream else "generateContent"
+        payload = dict(self._payload, contents=self._contents + [{"role": "user", "parts": [{"text": message}]}])
+        request = urllib.request.Request(
+            f"{self._backend.base_url}/v1beta/models/{self._model}:{method}",
+            data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            raw = urllib.request.urlopen(request, timeout=self._backend.timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read() or b"{}").get("error", {}).get("message", "")
+            except ValueError:
+                message = ""
+            raise FakeGeminiError(e.code, message.split(" ", 1)[-1] if message else "") from None
+        if stream:
+            return _HttpStreamResponse(raw)
+        with raw:
+            body = json.loads(raw.read())
+        return _HttpResponse(_event_text(body), _usage_from_json(body.get("usageMetadata") or {}))
+
+
+class HttpGeminiBackend:
+    """
+    連到本地替身伺服器（GEMINI_BACKEND=http://host:port）；不需要 API Key。
+    """
+    requires_api_key = False
+
+    def __init__(self, base_url: str, timeout: float = 120.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.name = f"http:{self.base_url}"
+
+    def start_chat(self, api_key, system_prompt, model, temperature, max_tokens, history) -> _HttpChat:
+        return _HttpChat(self, system_prompt, model, temperature, max_tokens, list(history or []))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Gemini 離線替身伺服器（Gemini REST 格式）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--ttft", type=float, default=FAKE_GEMINI_TTFT_SEC, help="首段延遲（秒）")
+    parser.add_argument("--tps", type=float, default=FAKE_GEMINI_TOKENS_PER_SEC, help="輸出速度（tokens/sec，0 不延遲）")
+    parser.add_argument("--error-429", type=float, default=FAKE_GEMINI_ERROR_429_RATE, help="回 429 的機率")
+    parser.add_argument("--error-500", type=float, default=FAKE_GEMINI_ERROR_500_RATE, help="回 500 的機率")
+    parser.add_argument("--seed", type=int, default=FAKE_GEMINI_SEED)
+    parser.add_argument("--responses", default=None, help='固定回覆 JSON 檔：[{"pattern": ..., "text": ...}]')
+    args = parser.parse_args(argv)
+
+    responses = FAKE_GEMINI_RESPONSES
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            responses = json.load(f)
+    engine = FakeGemini(
+        ttft=args.ttft,
+        tokens_per_sec=args.tps,
+        error_429_rate=args.error_429,
+        error_500_rate=args.error_500,
+        responses=responses,
+        seed=args.seed,
+    )
+    server = serve(engine, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Gemini 替身伺服器：http://{host}:{port}（GEMINI_BACKEND=http://{host}:{port}）", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(engine.stats(), ensure_ascii=False), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
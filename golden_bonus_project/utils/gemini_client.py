@@ -1,17 +1,20 @@
 # utils/gemini_client.py
+import hashlib
 import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List
 try:
     import streamlit as st  # type: ignore
 except ModuleNotFoundError:  # pragma: no cover
     st = None  # 允許在非 Streamlit 環境下 import（例如測試或部分 CI）
 
-# 自動判斷是本地開發還是雲端
-try:
-    from dotenv import load_dotenv  # type: ignore
-    load_dotenv()
-except ModuleNotFoundError:
-    # dotenv 不是必需：雲端用 st.secrets，本地也可能直接用環境變數
-    pass
+from config.settings import GEMINI_BACKEND, GEMINI_MODEL_CACHE_SIZE
+from utils.lazy import ensure_dotenv, lazy_import
+
+# SDK 延遲載入：第一次建立模型實例時才 import（缺套件時的 ModuleNotFoundError 也在那時才拋出）
+genai = lazy_import("google.generativeai")
 
 def get_api_key_source() -> str | None:
     """
@@ -29,7 +32,8 @@ def get_api_key_source() -> str | None:
     except Exception:
         pass
 
-    # 環境變數（本地）
+    # 環境變數（本地；.env 在第一次需要時才載入）
+    ensure_dotenv()
     if os.getenv("GEMINI_API_KEY", ""):
         return "env"
 
@@ -48,7 +52,8 @@ def get_api_key():
     except Exception:
         pass  # 如果 st.secrets 不可用（非 Streamlit 環境），繼續嘗試環境變數
     
-    # 其次使用環境變數（適用於本地開發）
+    # 其次使用環境變數（適用於本地開發；.env 在第一次需要時才載入）
+    ensure_dotenv()
     api_key = os.getenv("GEMINI_API_KEY", "")
     if api_key:
         return api_key
@@ -56,17 +61,223 @@ def get_api_key():
     # 如果都找不到，返回 None
     return None
 
+# ==================== 模型實例快取 ====================
+# genai.configure 與 GenerativeModel 的建構只跟 (model, system_prompt, temperature, max_tokens) 有關，
+# 同一組參數在多個 Streamlit session 之間可以共用；每次對話只需要 start_chat 一個新的會話。
+_configured_api_key: str | None = None
+_model_cache: "OrderedDict[tuple, Any]" = OrderedDict()
+_model_cache_lock = threading.Lock()
+_model_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+
+def _get_genai():
+    """
+    取得真正的 google.generativeai 模組（第一次呼叫才 import；缺套件時讓 ModuleNotFoundError 往上拋，由呼叫端轉成錯誤訊息）。
+    """
+    return genai._load()
+
+
+def _ensure_configured(genai, api_key: str) -> None:
+    """
+    只在 API Key 變更（首次使用或金鑰輪替）時重新 configure，並清空以舊金鑰建立的模型實例。
+    呼叫端需持有 _model_cache_lock。
+    """
+    global _configured_api_key
+    if _configured_api_key == api_key:
+        return
+    genai.configure(api_key=api_key)
+    if _configured_api_key is not None and _model_cache:
+        _model_cache_stats["invalidations"] += len(_model_cache)
+    _model_cache.clear()
+    _configured_api_key = api_key
+
+
+def get_model_instance(api_key: str, system_prompt: str, model: str, temperature: float, max_tokens: int):
+    """
+    取得（必要時建立）已配置好的 GenerativeModel，依 (model, system_prompt 雜湊, temperature, max_tokens) 快取，
+    超過 GEMINI_MODEL_CACHE_SIZE 時以 LRU 淘汰。
+    """
+    genai = _get_genai()
+    prompt_hash = hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()
+    key = (model, prompt_hash, float(temperature), int(max_tokens))
+
+    with _model_cache_lock:
+        _ensure_configured(genai, api_key)
+        instance = _model_cache.get(key)
+        if instance is not None:
+            _model_cache.move_to_end(key)
+            _model_cache_stats["hits"] += 1
+            return instance
+
+        _model_cache_stats["misses"] += 1
+        instance = genai.GenerativeModel(
+            model_name=model,
+            system_instruction=system_prompt,
+            generation_config=genai.types.GenerationConfig(
+                temperature=temperature,
+                max_output_tokens=max_tokens,
+            )
+        )
+        _model_cache[key] = instance
+        while len(_model_cache) > max(1, GEMINI_MODEL_CACHE_SIZE):
+            _model_cache.popitem(last=False)
+            _model_cache_stats["evictions"] += 1
+        return instance
+
+
+def clear_model_cache() -> None:
+    """
+    清空模型實例快取（例如使用者在側邊欄按「清除快取」時）；下次呼叫會重新 configure。
+    """
+    global _configured_api_key
+    with _model_cache_lock:
+        _model_cache.clear()
+        _configured_api_key = None
+
+
+def get_model_cache_stats() -> Dict[str, int]:
+    """
+    回傳模型快取的命中/未命中/淘汰/失效次數與目前大小（不含任何金鑰資訊）。
+    """
+    with _model_cache_lock:
+        return {**_model_cache_stats, "size": len(_model_cache)}
+
+
+# ==================== 用量紀錄 ====================
+# 每次呼叫後把回應的 usage_metadata 記在目前執行緒，供計量（utils/metering.py）讀取；
+# 呼叫開始時先清空，失敗或沒有 usage_metadata 時讀到 None（改用本地估算）
+_usage_local = threading.local()
+
+
+def _reset_usage() -> None:
+    _usage_local.usage = None
+
+
+def _record_usage(response) -> None:
+    meta = getattr(response, "usage_metadata", None)
+    if meta is None:
+        return
+    prompt_tokens = getattr(meta, "prompt_token_count", None)
+    output_tokens = getattr(meta, "candidates_token_count", None)
+    if prompt_tokens is None and output_tokens is None:
+        return
+    _usage_local.usage = {
+        "prompt_tokens": int(prompt_tokens or 0),
+        "output_tokens": int(output_tokens or 0),
+        "total_tokens": int(getattr(meta, "total_token_count", None) or (prompt_tokens or 0) + (output_tokens or 0)),
+    }
+
+
+def get_last_usage() -> Dict[str, int] | None:
+    """
+    目前執行緒最近一次 Gemini 呼叫的 token 用量：{"prompt_tokens", "output_tokens", "total_tokens"}，不可得時為 None。
+    串流呼叫需等產生器消費完畢才會有值。
+    """
+    return getattr(_usage_local, "usage", None)
+
+
+def _to_gemini_message(role: str, content: str) -> Dict[str, Any] | None:
+    """
+    單則訊息轉成 Gemini history 格式（每次回傳新的 dict；不快取，避免跨使用者共用可變物件並長駐記憶體）。
+    """
+    if role == "user":
+        return {"role": "user", "parts": [content]}
+    if role == "assistant":
+        return {"role": "model", "parts": [content]}
+    return None
+
+
+def to_gemini_history(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    把 [{"role": "user/assistant", "content": "..."}] 轉成 Gemini 的 [{"role": "user/model", "parts": [...]}]
+    """
+    gemini_history = []
+    for msg in history or []:
+        converted = _to_gemini_message(msg.get("role", ""), msg.get("content", ""))
+        if converted is not None:
+            gemini_history.append(converted)
+    return gemini_history
+
+
+# ==================== 模型後端 ====================
+# call_gemini_logic / generate_gemini_text / stream_gemini_logic 都透過後端建立聊天會話。
+# 後端介面：name、requires_api_key，以及
+#   start_chat(api_key, system_prompt, model, temperature, max_tokens, history) → 具備 send_message(message, stream=False) 的會話，
+#   回應需有 .text（串流時可逐段迭代，每段有 .text）與 usage_metadata（可省略）。
+# 替身後端見 utils/fake_gemini.py（離線壓測用）。
+
+
+class GenaiBackend:
+    """
+    正式後端：google.generativeai（需要 API Key）。
+    """
+    name = "genai"
+    requires_api_key = True
+
+    def start_chat(self, api_key, system_prompt, model, temperature, max_tokens, history):
+        model_instance = get_model_instance(api_key, system_prompt, model, temperature, max_tokens)
+        # Gemini API 的 history 格式需要是 List[Dict] 其中 role 為 "user" 或 "model"
+        return model_instance.start_chat(history=to_gemini_history(history or []))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(spec: str | None):
+    """
+    依設定字串建立後端："genai"（預設）、"fake"（程序內替身）、"http://host:port"（utils.fake_gemini 的本地替身伺服器）。
+    """
+    spec = (spec or "genai").strip()
+    if spec == "genai":
+        return GenaiBackend()
+    if spec == "fake":
+        from utils.fake_gemini import FakeGemini
+        return FakeGemini.from_settings()
+    if spec.startswith(("http://", "https://")):
+        from utils.fake_gemini import HttpGeminiBackend
+        return HttpGeminiBackend(spec)
+    raise ValueError(f"未知的 GEMINI_BACKEND：{spec}")
+
+
+def get_backend():
+    """
+    目前的模型後端；未以 set_backend 指定時依環境變數 GEMINI_BACKEND（其次為設定檔）建立一次。
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                ensure_dotenv()
+                _backend = create_backend(os.getenv("GEMINI_BACKEND") or GEMINI_BACKEND)
+    return _backend
+
+
+def set_backend(backend) -> None:
+    """
+    替換模型後端（例如壓測時換成 FakeGemini）；傳入 None 則下次使用時依設定重新建立。
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
 def test_gemini_connection(model: str = "gemini-2.0-flash-exp") -> tuple[bool, str]:
     """
     最小連線測試：不回傳敏感資訊，只回報是否成功與原因。
     """
+    backend = get_backend()
+    if not backend.requires_api_key:
+        return (True, f"目前使用替身後端（{backend.name}），未連線 Gemini")
+
     api_key = get_api_key()
     if not api_key:
         return (False, "未找到 GEMINI_API_KEY（請檢查 Streamlit Secrets 或環境變數）")
 
     try:
-        import google.generativeai as genai
-        genai.configure(api_key=api_key)
+        genai = _get_genai()
+        with _model_cache_lock:
+            _ensure_configured(genai, api_key)
         model_instance = genai.GenerativeModel(model_name=model)
         resp = model_instance.generate_content("ping")
         if getattr(resp, "text", None):
@@ -92,40 +303,20 @@ def call_gemini_logic(system_prompt, user_message, history=[], model="gemini-2.0
     Returns:
         str: AI 回應內容，或錯誤訊息
     """
-    # 動態獲取 API Key（每次調用時重新讀取，確保使用最新的 Secrets）
-    api_key = get_api_key()
-    if not api_key:
+    # 動態獲取 API Key（每次調用時重新讀取，確保使用最新的 Secrets；金鑰輪替會使模型快取失效）
+    _reset_usage()
+    backend = get_backend()
+    api_key = get_api_key() if backend.requires_api_key else None
+    if backend.requires_api_key and not api_key:
         return "⚠️ 錯誤：未找到 GEMINI_API_KEY。請檢查 Streamlit Secrets 或 .env 檔案。"
     
     try:
-        import google.generativeai as genai
-        # 每次調用時重新配置（確保使用最新的 API Key）
-        genai.configure(api_key=api_key)
-        # 使用 system_instruction 參數設定系統提示詞
-        model_instance = genai.GenerativeModel(
-            model_name=model,
-            system_instruction=system_prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=temperature,
-                max_output_tokens=max_tokens,
-            )
-        )
-        
-        # 建立聊天會話，直接使用歷史對話
-        # Gemini API 的 history 格式需要是 List[Dict] 其中 role 為 "user" 或 "model"
-        gemini_history = []
-        for msg in history:
-            role = msg.get("role", "")
-            content = msg.get("content", "")
-            if role == "user":
-                gemini_history.append({"role": "user", "parts": [content]})
-            elif role == "assistant":
-                gemini_history.append({"role": "model", "parts": [content]})
-        
-        chat = model_instance.start_chat(history=gemini_history)
+        # 建立聊天會話，直接使用歷史對話（正式後端的模型實例依參數快取共用；API Key 變更時自動重新 configure）
+        chat = backend.start_chat(api_key, system_prompt, model, temperature, max_tokens, history)
         
         # 發送當前用戶訊息並取得回應
         response = chat.send_message(user_message)
+        _record_usage(response)
         return response.text
         
     except ModuleNotFoundError as e:
@@ -133,3 +324,82 @@ def call_gemini_logic(system_prompt, user_message, history=[], model="gemini-2.0
     except Exception as e:
         return f"⚠️ AI 連線錯誤: {str(e)}"
 
+
+class GeminiCallError(RuntimeError):
+    """
+    generate_gemini_text 的失敗例外；status 為 HTTP 狀態碼（無法判斷時為 None）。
+    """
+
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def retryable(self) -> bool:
+        # 429（配額/速率限制）與 5xx（服務端暫時性錯誤）值得重試
+        return self.status is not None and (self.status == 429 or self.status >= 500)
+
+
+def _error_status(exc: Exception) -> int | None:
+    """
+    從 google.api_core 例外（.code 為 HTTP 狀態碼）或錯誤訊息中取出狀態碼。
+    """
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code
+    match = re.search(r"\b(429|5\d\d)\b", str(exc))
+    return int(match.group(1)) if match else None
+
+
+def generate_gemini_text(system_prompt, user_message, history=None, model="gemini-2.0-flash-exp", temperature=0.7, max_tokens=2000) -> str:
+    """
+    與 call_gemini_logic 相同的呼叫，但失敗時拋出 GeminiCallError（而不是回傳錯誤字串），
+    讓批次工作可以依狀態碼決定是否重試。
+    """
+    _reset_usage()
+    backend = get_backend()
+    api_key = get_api_key() if backend.requires_api_key else None
+    if backend.requires_api_key and not api_key:
+        raise GeminiCallError("未找到 GEMINI_API_KEY。請檢查 Streamlit Secrets 或 .env 檔案。")
+
+    try:
+        chat = backend.start_chat(api_key, system_prompt, model, temperature, max_tokens, history)
+        response = chat.send_message(user_message)
+        _record_usage(response)
+        return response.text
+    except ModuleNotFoundError as e:
+        raise GeminiCallError(f"缺少相依套件（{str(e)}）。請先安裝 requirements.txt。") from e
+    except Exception as e:
+        raise GeminiCallError(str(e), status=_error_status(e)) from e
+
+
+def stream_gemini_logic(system_prompt, user_message, history=None, model="gemini-2.0-flash-exp", temperature=0.7, max_tokens=2000) -> Iterator[str]:
+    """
+    串流版的 call_gemini_logic：逐段 yield 模型輸出的文字，讓 UI 可以在第一段回來時就開始顯示。
+    參數與 call_gemini_logic 相同；錯誤時與非串流版一樣 yield 一段錯誤訊息，而不是拋出例外。
+    """
+    _reset_usage()
+    backend = get_backend()
+    api_key = get_api_key() if backend.requires_api_key else None
+    if backend.requires_api_key and not api_key:
+        yield "⚠️ 錯誤：未找到 GEMINI_API_KEY。請檢查 Streamlit Secrets 或 .env 檔案。"
+        return
+
+    try:
+        chat = backend.start_chat(api_key, system_prompt, model, temperature, max_tokens, history)
+        response = chat.send_message(user_message, stream=True)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # 被安全策略擋下的片段沒有 text，略過即可
+                continue
+            if text:
+                yield text
+        # 串流結束後，回應物件上的 usage_metadata 為整段回覆的用量
+        _record_usage(response)
+
+    except ModuleNotFoundError as e:
+        yield f"⚠️ AI 連線錯誤: 缺少相依套件（{str(e)}）。請先安裝 requirements.txt。"
+    except Exception as e:
+        yield f"⚠️ AI 連線錯誤: {str(e)}"
@@ -0,0 +1,58 @@
+# utils/keyword_router.py
+"""
+多關鍵字路由：把「類別 → 關鍵字清單」編譯成純字面 re alternation，
+比對在 re 的 C 引擎內完成（取代對每個清單逐一 any(k in text ...) 的做法，也不在 Python 層逐字掃描）。
+"""
+import re
+from typing import Dict, FrozenSet, Iterable, List, Pattern
+
+
+class KeywordRouter:
+    """
+    建立一次、重複使用。關鍵字全部 re.escape 後依長度由長到短串成 alternation：
+    每個類別一個（contains() 只關心單一類別，找到第一個命中即返回），另有一個合併全部類別的（match() 一次掃描）。
+    """
+
+    def __init__(self, tables: Dict[str, Iterable[str]]):
+        self.categories: List[str] = list(tables)
+        self._patterns: Dict[str, Pattern[str]] = {}
+        keywords_of: Dict[str, List[str]] = {}
+        for category, keywords in tables.items():
+            words = sorted({k for k in keywords if k}, key=len, reverse=True)
+            if words:
+                self._patterns[category] = re.compile("|".join(re.escape(w) for w in words))
+                keywords_of[category] = words
+
+        # match() 用的合併 alternation：同一位置由最長的關鍵字勝出，因此每個關鍵字對應
+        # 「所有是它子字串的關鍵字」的類別聯集，較短的前綴關鍵字不會被漏掉
+        all_words = sorted({w for words in keywords_of.values() for w in words}, key=len, reverse=True)
+        self._any: Pattern[str] | None = (
+            re.compile("|".join(re.escape(w) for w in all_words)) if all_words else None
+        )
+        self._categories_of: Dict[str, FrozenSet[str]] = {
+            word: frozenset(c for c, words in keywords_of.items() if any(k in word for k in words))
+            for word in all_words
+        }
+
+    def contains(self, category: str, text: str) -> bool:
+        """
+        text 是否出現 category 的任一關鍵字（未定義或空的類別視為不命中）。
+        """
+        pattern = self._patterns.get(category)
+        return bool(text) and pattern is not None and pattern.search(text) is not None
+
+    def match(self, text: str) -> FrozenSet[str]:
+        """
+        回傳 text 中出現任一關鍵字的所有類別。每次命中後從下一個字元繼續搜尋（而非命中結尾），
+        跨越命中邊界、互相重疊的關鍵字也會被找到。
+        """
+        if not text or self._any is None:
+            return frozenset()
+        search = self._any.search
+        categories_of = self._categories_of
+        found: set = set()
+        m = search(text)
+        while m is not None:
+            found |= categories_of[m.group()]
+            m = search(text, m.start() + 1)
+        return frozenset(found)
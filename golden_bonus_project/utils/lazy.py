@@ -0,0 +1,216 @@
+# utils/lazy.py
+"""
+延遲載入與啟動匯入時間報告：
+- lazy_import：回傳代理模組，第一次存取屬性時才真正 import（SDK 缺套件時的錯誤也延後到使用時才拋出）
+- ensure_dotenv：第一次需要讀環境變數時才載入 .env，整個程序只做一次
+- install_import_timer / report_startup_once：記錄每個模組的匯入耗時（類似 python -X importtime），
+  應用程式第一次執行完成時輸出報告（格式同 diagnose_imports.py），找出拖慢冷啟動的模組
+
+本模組只用標準函式庫，且不 import config.settings，main.py 可以在其他匯入之前先安裝計時器。
+"""
+import importlib
+import importlib.abc
+import sys
+import threading
+import time
+import types
+from typing import Any, Dict, List, Optional, TextIO
+
+# ==================== 延遲載入 ====================
+
+
+class LazyModule(types.ModuleType):
+    """
+    模組代理：第一次存取屬性時 import 真正的模組，之後直接轉交。
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __dir__(self) -> List[str]:
+        return dir(self._load())
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.__dict__["_lazy_module"] is not None
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    延遲 import：已載入的模組也包成代理（介面一致），未載入的模組等到第一次使用才 import。
+    """
+    proxy = LazyModule(name)
+    if name in sys.modules:
+        proxy.__dict__["_lazy_module"] = sys.modules[name]
+    return proxy
+
+
+_dotenv_lock = threading.Lock()
+_dotenv_loaded = False
+
+
+def ensure_dotenv() -> None:
+    """
+    載入 .env（本地開發用；雲端使用 st.secrets）。整個程序只做一次，未安裝 python-dotenv 時略過。
+    """
+    global _dotenv_loaded
+    if _dotenv_loaded:
+        return
+    with _dotenv_lock:
+        if _dotenv_loaded:
+            return
+        try:
+            from dotenv import load_dotenv  # type: ignore
+            load_dotenv()
+        except ModuleNotFoundError:
+            # dotenv 不是必需：雲端用 st.secrets，本地也可能直接用環境變數
+            pass
+        _dotenv_loaded = True
+
+
+# ==================== 匯入計時 ====================
+
+_timings: Dict[str, Dict[str, Any]] = {}
+_timings_lock = threading.Lock()
+_local = threading.local()
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """
+    包住真正的 loader，量測 exec_module（含巢狀匯入）的耗時；執行完把 __loader__/__spec__.loader 還原，
+    之後依 loader 型別判斷的程式（pkg_resources 等）不受影響。
+    """
+
+    def __init__(self, loader, name: str):
+        self._loader = loader
+        self._name = name
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module) -> None:
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        depth = len(stack)
+        stack.append(0.0)  # 子模組累計耗時
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with _timings_lock:
+                _timings[self._name] = {
+                    "cumulative_ms": elapsed,
+                    "self_ms": max(elapsed - children, 0.0),
+                    "depth": depth,
+                    "order": len(_timings),
+                }
+            module.__loader__ = self._loader
+            if getattr(module, "__spec__", None) is not None and module.__spec__.loader is self:
+                module.__spec__.loader = self._loader
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    排在 sys.meta_path 最前面：交給其餘 finder 找到 spec 後，把 loader 換成 _TimedLoader。
+    """
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader, fullname)
+            return spec
+        return None
+
+
+_timer: Optional[_ImportTimer] = None
+_started_at: Optional[float] = None
+_reported = False
+
+
+def install_import_timer() -> None:
+    """
+    開始記錄之後的模組匯入耗時（重複呼叫無副作用；Streamlit 每次 rerun 都會執行 main.py）。
+    報告輸出後不再安裝：計時器只量冷啟動，之後的匯入不必再多經過一層 finder。
+    """
+    global _timer, _started_at
+    if _timer is not None or _reported:
+        return
+    _timer = _ImportTimer()
+    _started_at = time.perf_counter()
+    sys.meta_path.insert(0, _timer)
+
+
+def uninstall_import_timer() -> None:
+    global _timer
+    if _timer is not None and _timer in sys.meta_path:
+        sys.meta_path.remove(_timer)
+    _timer = None
+
+
+def import_timings() -> Dict[str, Dict[str, Any]]:
+    """
+    目前為止記錄到的匯入耗時：{模組: {"cumulative_ms", "self_ms", "depth", "order"}}。
+    """
+    with _timings_lock:
+        return {name: dict(info) for name, info in _timings.items()}
+
+
+def format_import_report(top: int = 10, title: str = "啟動匯入時間") -> str:
+    """
+    報告：最外層匯入（由 main.py 直接觸發）依累計耗時排序，再列出自身耗時最久的模組。
+    """
+    timings = import_timings()
+    roots = sorted(
+        ((name, info) for name, info in timings.items() if info["depth"] == 0),
+        key=lambda item: -item[1]["cumulative_ms"],
+    )
+    slowest = sorted(timings.items(), key=lambda item: -item[1]["self_ms"])[:top]
+    total = sum(info["cumulative_ms"] for _, info in roots)
+    wall = (time.perf_counter() - _started_at) * 1000 if _started_at is not None else total
+
+    lines = ["=" * 70, title, "=" * 70]
+    lines.append(f"1. 最外層匯入（共 {len(timings)} 個模組，匯入合計 {total:.1f} ms，啟動至今 {wall:.1f} ms）")
+    for name, info in roots[:top]:
+        lines.append(f"   ⏱️  {name:<40} {info['cumulative_ms']:8.1f} ms")
+    lines.append("\n2. 自身耗時最久的模組")
+    for name, info in slowest:
+        lines.append(f"   ⏱️  {name:<40} {info['self_ms']:8.1f} ms（含子模組 {info['cumulative_ms']:.1f} ms）")
+    return "\n".join(lines)
+
+
+def report_startup_once(top: int = 10, stream: Optional[TextIO] = None) -> bool:
+    """
+    程序第一次呼叫時輸出啟動匯入報告（預設 stderr，部署平台的日誌看得到）並移除計時器；之後呼叫不再輸出。
+    計時器未安裝時不輸出。回傳這次是否有輸出。
+    """
+    global _reported
+    if _reported or _timer is None:
+        return False
+    _reported = True
+    uninstall_import_timer()
+    print(format_import_report(top=top), file=stream or sys.stderr, flush=True)
+    return True
@@ -0,0 +1,217 @@
+# utils/metering.py
+"""
+用量計量：每次顧問回覆記錄輸入/輸出 token、成本估算、延遲、快取命中與提示詞各區段 token，
+並彙總成每個會話 / 每天的報表，用來找出最花錢的提示詞區段。
+
+token 數優先採用 Gemini 回應的 usage_metadata（見 gemini_client.get_last_usage），缺少時以本地估算；
+各區段（模板+知識庫主體、檢索知識塊、企業補充資訊、摘要、歷史、提問）一律是 build_prompt 的本地估算。
+
+報表（從 Supabase 對話記錄讀取，在專案目錄執行）：
+    python -m utils.metering --by day
+    python -m utils.metering --by session --since 2025-01-01
+"""
+import argparse
+import sys
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from config.settings import (
+    METERING_ENABLED,
+    METERING_PRICE_PER_1M_INPUT,
+    METERING_PRICE_PER_1M_OUTPUT,
+)
+from utils.prompt_builder import estimate_tokens
+
+# 寫進對話記錄 metadata 的欄位名稱
+USAGE_METADATA_KEY = "usage"
+
+
+def estimate_cost(tokens_in: int, tokens_out: int) -> float:
+    """
+    依 METERING_PRICE_PER_1M_* 估算成本（美元）。
+    """
+    return (tokens_in * METERING_PRICE_PER_1M_INPUT + tokens_out * METERING_PRICE_PER_1M_OUTPUT) / 1_000_000
+
+
+def meter_request(
+    prompt_stats: Optional[Dict[str, Any]],
+    response: str,
+    latency_ms: Optional[float],
+    cache_hit: bool = False,
+    usage: Optional[Dict[str, int]] = None,
+    ttft_ms: Optional[float] = None,
+    intent: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    組出一筆用量紀錄；快取命中時沒有呼叫模型，token 與成本記為 0（區段估計仍保留，可看出省下多少）。
+
+    Args:
+        prompt_stats: build_prompt 回傳的 stats（含各區段 token 估計）
+        response: 模型回覆（用於估算輸出 token）
+        latency_ms: 端到端延遲（毫秒）
+        cache_hit: 是否命中回覆快取
+        usage: gemini_client.get_last_usage() 的結果，None 表示改用本地估算
+        ttft_ms: 串流模式的首段延遲（毫秒）
+        intent: 意圖
+
+    Returns:
+        Dict 或 None（METERING_ENABLED 關閉時）
+    """
+    if not METERING_ENABLED:
+        return None
+    stats = prompt_stats or {}
+    if cache_hit:
+        tokens_in, tokens_out, source = 0, 0, "cache"
+    elif usage:
+        tokens_in, tokens_out, source = usage["prompt_tokens"], usage["output_tokens"], "gemini"
+    else:
+        tokens_in, tokens_out, source = int(stats.get("total_tokens", 0)), estimate_tokens(response or ""), "estimate"
+
+    record: Dict[str, Any] = {
+        "intent": intent,
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "token_source": source,
+        "cost_usd": round(estimate_cost(tokens_in, tokens_out), 8),
+        "latency_ms": round(latency_ms, 1) if latency_ms is not None else None,
+        "cache_hit": bool(cache_hit),
+        "sections": dict(stats.get("sections") or {}),
+        "truncated": list(stats.get("truncated") or []),
+    }
+    if ttft_ms is not None:
+        record["ttft_ms"] = round(ttft_ms, 1)
+    return record
+
+
+def _new_bucket() -> Dict[str, Any]:
+    return {
+        "requests": 0, "cache_hits": 0, "tokens_in": 0, "tokens_out": 0, "cost_usd": 0.0,
+        "latency_ms_total": 0.0, "latency_ms_max": 0.0, "latency_count": 0,
+        "sections": defaultdict(int),
+    }
+
+
+def _add(bucket: Dict[str, Any], usage: Dict[str, Any]) -> None:
+    bucket["requests"] += 1
+    bucket["cache_hits"] += int(bool(usage.get("cache_hit")))
+    bucket["tokens_in"] += int(usage.get("tokens_in") or 0)
+    bucket["tokens_out"] += int(usage.get("tokens_out") or 0)
+    bucket["cost_usd"] += float(usage.get("cost_usd") or 0.0)
+    latency = usage.get("latency_ms")
+    if latency is not None:
+        bucket["latency_ms_total"] += latency
+        bucket["latency_ms_max"] = max(bucket["latency_ms_max"], latency)
+        bucket["latency_count"] += 1
+    # 快取命中沒有實際送出提示詞，不計入區段成本
+    if not usage.get("cache_hit"):
+        for name, tokens in (usage.get("sections") or {}).items():
+            bucket["sections"][name] += int(tokens or 0)
+
+
+def _finish(bucket: Dict[str, Any]) -> Dict[str, Any]:
+    count = bucket.pop("latency_count")
+    total = bucket.pop("latency_ms_total")
+    sections = dict(sorted(bucket["sections"].items(), key=lambda item: -item[1]))
+    return {
+        **bucket,
+        "cost_usd": round(bucket["cost_usd"], 6),
+        "cache_hit_rate": round(bucket["cache_hits"] / bucket["requests"], 4) if bucket["requests"] else 0.0,
+        "latency_ms_avg": round(total / count, 1) if count else None,
+        "latency_ms_max": round(bucket["latency_ms_max"], 1),
+        "sections": sections,
+    }
+
+
+def _day(created_at: Any) -> str:
+    if isinstance(created_at, datetime):
+        return created_at.astimezone(timezone.utc).date().isoformat()
+    return str(created_at or "")[:10] or "unknown"
+
+
+def aggregate_usage(records: Iterable[Dict[str, Any]], by: str = "day") -> Dict[str, Dict[str, Any]]:
+    """
+    彙總用量紀錄。records 每筆為 {"session_id", "created_at", "usage"}；by 為 "day"、"session" 或 "all"。
+    每組回傳請求數、快取命中率、輸入/輸出 token、成本、平均/最大延遲，以及各提示詞區段的 token 合計（由大到小）。
+    """
+    if by not in ("day", "session", "all"):
+        raise ValueError(f"未知的彙總方式：{by}")
+    buckets: Dict[str, Dict[str, Any]] = defaultdict(_new_bucket)
+    for record in records:
+        usage = record.get("usage")
+        if not usage:
+            continue
+        if by == "day":
+            key = _day(record.get("created_at"))
+        elif by == "session":
+            key = str(record.get("session_id") or "unknown")
+        else:
+            key = "all"
+        _add(buckets[key], usage)
+    return {key: _finish(bucket) for key, bucket in sorted(buckets.items())}
+
+
+class UsageLedger:
+    """
+    程序內的用量紀錄（執行緒安全），供側邊欄即時顯示；長期彙總以 Supabase 中的紀錄為準。
+    """
+
+    def __init__(self, max_records: int = 10000):
+        self.max_records = max_records
+        self._records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, session_id: str, usage: Optional[Dict[str, Any]]) -> None:
+        if not usage:
+            return
+        record = {"session_id": session_id, "created_at": datetime.now(timezone.utc), "usage": usage}
+        with self._lock:
+            self._records.append(record)
+            if len(self._records) > self.max_records:
+                del self._records[: len(self._records) - self.max_records]
+
+    def report(self, by: str = "session", session_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            records = [r for r in self._records if session_id is None or r["session_id"] == session_id]
+        return aggregate_usage(records, by=by)
+
+
+_ledger = UsageLedger()
+
+
+def get_usage_ledger() -> UsageLedger:
+    return _ledger
+
+
+def format_report(report: Dict[str, Dict[str, Any]], top_sections: int = 3) -> str:
+    lines = []
+    for key, row in report.items():
+        sections = "、".join(f"{name} {tokens}" for name, tokens in list(row["sections"].items())[:top_sections])
+        lines.append(
+            f"{key}：{row['requests']} 次（快取 {row['cache_hit_rate']:.0%}），"
+            f"輸入 {row['tokens_in']} / 輸出 {row['tokens_out']} token，約 ${row['cost_usd']:.4f}，"
+            f"平均延遲 {row['latency_ms_avg']} ms；主要區段：{sections or '無'}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="顧問回覆用量報表（讀取 Supabase 對話記錄）")
+    parser.add_argument("--by", choices=("day", "session", "all"), default="day")
+    parser.add_argument("--session", default=None, help="只看指定 session_id")
+    parser.add_argument("--since", default=None, help="起始日期（YYYY-MM-DD）")
+    parser.add_argument("--limit", type=int, default=5000, help="最多讀取的紀錄數")
+    args = parser.parse_args(argv)
+
+    from utils.conversation_storage import load_usage_records
+    records = load_usage_records(session_id=args.session, since=args.since, limit=args.limit)
+    if not records:
+        print("沒有用量紀錄（Supabase 未配置或尚無資料）", file=sys.stderr)
+        return 1
+    print(format_report(aggregate_usage(records, by=args.by)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+# utils/prompt_builder.py
+"""
+提示詞組裝：把 PROMPT_TEMPLATES 預先編譯成「靜態片段 + 動態欄位」，
+靜態部分（模板文字 + 知識庫主體）每個 (模板, 知識庫版本) 只渲染一次，
+每次請求只拼接數據/風險/企業補充資訊，並依 token 預算裁切歷史與補充資訊。
+"""
+import hashlib
+import string
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import PROMPT_TEMPLATES, PROMPT_TOKEN_BUDGET
+
+# 知識庫欄位：模板中的 {knowledge_base} 會拆成「靜態主體」+ 動態的檢索知識塊
+KNOWLEDGE_FIELD = "knowledge_base"
+KNOWLEDGE_CHUNKS_FIELD = "knowledge_chunks"
+
+COMPANY_CONTEXT_TRUNCATED_NOTE = "\n（以下補充資訊因長度限制省略）"
+
+_formatter = string.Formatter()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗估 token 數（不呼叫 API）：中日韓文字約 1 字 1 token，其餘字元約 4 字 1 token。
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _format_value(value: Any, conversion: Optional[str], spec: str) -> str:
+    if conversion:
+        value = _formatter.convert_field(value, conversion)
+    return format(value, spec or "")
+
+
+def compile_template(template: str, static_fields: Dict[str, str]) -> Tuple[Any, ...]:
+    """
+    把 str.format 模板編譯成片段序列：str 為已渲染好的靜態文字，tuple 為 (欄位, conversion, spec)。
+    static_fields 中的欄位在編譯時就代入；{knowledge_base} 代入靜態主體後，緊接著保留一個知識塊動態欄位。
+    """
+    segments: List[Any] = []
+    buffer: List[str] = []
+    for literal, field, spec, conversion in _formatter.parse(template):
+        if literal:
+            buffer.append(literal)
+        if field is None:
+            continue
+        if field in static_fields:
+            buffer.append(_format_value(static_fields[field], conversion, spec))
+            if field != KNOWLEDGE_FIELD:
+                continue
+            field, conversion, spec = KNOWLEDGE_CHUNKS_FIELD, None, ""
+        if buffer:
+            segments.append("".join(buffer))
+            buffer = []
+        segments.append((field, conversion, spec))
+    if buffer:
+        segments.append("".join(buffer))
+    return tuple(segments)
+
+
+def render_compiled(segments: Tuple[Any, ...], fields: Dict[str, Any]) -> str:
+    """
+    用動態欄位值把編譯後的片段拼成完整文字（缺欄位時與 str.format 一樣拋 KeyError）。
+    """
+    return "".join(
+        seg if isinstance(seg, str) else _format_value(fields[seg[0]], seg[1], seg[2])
+        for seg in segments
+    )
+
+
+def template_version(template_name: str) -> str:
+    """
+    模板內容的短雜湊；模板文字一改，版本就跟著變（供快取失效判斷）。
+    """
+    return hashlib.sha256(PROMPT_TEMPLATES[template_name].encode("utf-8")).hexdigest()[:12]
+
+
+@lru_cache(maxsize=32)
+def _compiled(template_name: str, template_text: str, kb_version: str) -> Tuple[Any, ...]:
+    from assets.knowledge import get_static_knowledge_text
+    return compile_template(template_text, {KNOWLEDGE_FIELD: get_static_knowledge_text()})
+
+
+def get_compiled_template(template_name: str) -> Tuple[Any, ...]:
+    """
+    取得預先渲染好靜態前綴的模板；快取鍵含模板文字與知識庫版本，任一變更都會重新編譯。
+    """
+    from assets.knowledge import KB_VERSION
+    return _compiled(template_name, PROMPT_TEMPLATES[template_name], KB_VERSION)
+
+
+def _company_context_block(text: str) -> str:
+    return f"\n\n【企業補充資訊】\n{text}\n" if text else ""
+
+
+def _summary_block(text: str) -> str:
+    return f"\n\n【先前對話摘要】\n{text}\n" if text else ""
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    從開頭保留文字直到接近 max_tokens（補充資訊的重點通常在前面）。
+    """
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def build_prompt(
+    template_name: str,
+    fields: Dict[str, Any],
+    knowledge_chunks: str = "",
+    company_context_text: str = "",
+    history: Optional[List[Dict[str, Any]]] = None,
+    user_message: str = "",
+    token_budget: Optional[int] = None,
+    conversation_summary: str = "",
+) -> Dict[str, Any]:
+    """
+    組出最終的 system prompt 與要送出的歷史訊息，並在超過 token 預算時依優先順序裁切：
+    1. 先從最舊的歷史訊息開始丟
+    2. 再從尾端截短企業補充資訊
+    3. 最後才拿掉檢索到的知識塊
+    模板本體、數據、知識庫主體與對話摘要（見 utils/summarizer.py，長度已受控）不會被裁切。
+
+    Returns:
+        Dict: {"system_prompt": str, "history": list, "stats": dict}
+              stats 含各區段 token 估計、最終 prompt 字數/token 數、預算與被裁切的項目
+    """
+    budget = PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    segments = get_compiled_template(template_name)
+    history = list(history or [])
+    company_text = company_context_text or ""
+
+    base_fields = dict(fields)
+    base_fields[KNOWLEDGE_CHUNKS_FIELD] = ""
+    base_prompt = render_compiled(segments, base_fields)
+
+    summary_text = _summary_block(conversation_summary)
+    base_tokens = estimate_tokens(base_prompt)
+    summary_tokens = estimate_tokens(summary_text)
+    chunk_tokens = estimate_tokens(knowledge_chunks)
+    company_tokens = estimate_tokens(_company_context_block(company_text))
+    history_token_list = [estimate_tokens(m.get("content", "")) for m in history]
+    history_tokens = sum(history_token_list)
+    user_tokens = estimate_tokens(user_message)
+
+    truncated: List[str] = []
+    if budget:
+        def _total() -> int:
+            return base_tokens + chunk_tokens + company_tokens + summary_tokens + history_tokens + user_tokens
+
+        # 1) 歷史訊息：由舊到新丟棄
+        dropped = 0
+        while history and _total() > budget:
+            history_tokens -= history_token_list[dropped]
+            history.pop(0)
+            dropped += 1
+        if dropped:
+            truncated.append(f"history:{dropped}")
+
+        # 2) 企業補充資訊：截短尾端
+        if company_text and _total() > budget:
+            overflow = _total() - budget
+            note_tokens = estimate_tokens(COMPANY_CONTEXT_TRUNCATED_NOTE)
+            keep = estimate_tokens(company_text) - overflow - note_tokens
+            kept = _truncate_to_tokens(company_text, keep)
+            company_text = (kept + COMPANY_CONTEXT_TRUNCATED_NOTE) if kept else ""
+            company_tokens = estimate_tokens(_company_context_block(company_text))
+            truncated.append("company_context")
+
+        # 3) 檢索知識塊：整段拿掉
+        if knowledge_chunks and _total() > budget:
+            knowledge_chunks = ""
+            chunk_tokens = 0
+            truncated.append("knowledge_chunks")
+
+    if knowledge_chunks:
+        render_fields = dict(fields)
+        render_fields[KNOWLEDGE_CHUNKS_FIELD] = knowledge_chunks
+        system_prompt = render_compiled(segments, render_fields)
+    else:
+        system_prompt = base_prompt
+    system_prompt += _company_context_block(company_text) + summary_text
+
+    prompt_tokens = base_tokens + chunk_tokens + company_tokens + summary_tokens
+    return {
+        "system_prompt": system_prompt,
+        "history": history,
+        "stats": {
+            "template": template_name,
+            "template_version": template_version(template_name),
+            "prompt_chars": len(system_prompt),
+            "prompt_tokens": prompt_tokens,
+            "sections": {
+                "template_and_kb": base_tokens,
+                "knowledge_chunks": chunk_tokens,
+                "company_context": company_tokens,
+                "history_summary": summary_tokens,
+                "history": history_tokens,
+                "user_message": user_tokens,
+            },
+            "total_tokens": prompt_tokens + history_tokens + user_tokens,
+            "budget": budget,
+            "truncated": truncated,
+        },
+    }
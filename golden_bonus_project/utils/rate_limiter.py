@@ -0,0 +1,78 @@
+# utils/rate_limiter.py
+"""
+每分鐘請求數（RPM）與每分鐘 token 數（TPM）的雙 token bucket 限流器（執行緒安全）。
+批次呼叫 Gemini 時，每個請求先 acquire(預估 token 數)，兩個額度都足夠才放行。
+"""
+import threading
+import time
+from typing import Optional
+
+
+class _Bucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    rpm / tpm 設為 None 或 0 表示該項不限制。單一請求的 token 數超過 tpm 時以 tpm 計（否則永遠等不到）。
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self._requests = _Bucket(rpm) if rpm else None
+        self._tokens = _Bucket(tpm) if tpm else None
+        self._lock = threading.Lock()
+        # penalize 設定的暫停期限（monotonic）；只限 TPM 或完全不限流時也要暫停
+        self._paused_until = 0.0
+        self.waited_sec = 0.0
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        阻塞直到額度足夠並扣除；回傳等待秒數。
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                need_tokens = min(float(tokens), self._tokens.capacity) if self._tokens else 0.0
+                wait = max(0.0, self._paused_until - now)
+                if self._requests:
+                    self._requests.refill(now)
+                    wait = max(wait, self._requests.wait_time(1.0))
+                if self._tokens:
+                    self._tokens.refill(now)
+                    wait = max(wait, self._tokens.wait_time(need_tokens))
+                if wait <= 0:
+                    if self._requests:
+                        self._requests.tokens -= 1.0
+                    if self._tokens:
+                        self._tokens.tokens -= need_tokens
+                    self.waited_sec += waited
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def penalize(self, seconds: float) -> None:
+        """
+        收到 429 時呼叫：讓所有執行緒一起暫停約 seconds 秒，避免繼續撞限制（只限 TPM 或不限流時同樣暫停）；
+        各項額度同時清空，暫停結束後從零開始回補，不會一次湧出。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            for bucket in (self._requests, self._tokens):
+                if bucket:
+                    bucket.refill(now)
+                    bucket.tokens = min(bucket.tokens, -seconds * bucket.rate)
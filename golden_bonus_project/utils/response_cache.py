@@ -0,0 +1,244 @@
+# utils/response_cache.py
+"""
+顧問回覆快取：相同（或幾乎相同）的問題在相同條件下直接回傳先前的回覆，完全略過模型呼叫。
+
+快取鍵 = 正規化問題 + 意圖 + 知識庫版本 + 提示詞模板版本 + 企業上下文雜湊；
+後四者組成「分桶」，同一桶內先找完全相同的問題，找不到再用字元 bigram 相似度做模糊比對；
+模糊命中另需兩題的數字與關鍵詞（金額單位、安全/危險、否定等）完全相同。
+支援 TTL、LRU 淘汰，以及可選的 SQLite 落地（跨程序/重啟共用）。
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, FrozenSet, Optional, Tuple
+
+from config.settings import (
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_FUZZY_GUARD_WORDS,
+    RESPONSE_CACHE_FUZZY_THRESHOLD,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_SQLITE_PATH,
+    RESPONSE_CACHE_TTL_SEC,
+)
+
+_STRIP_CHARS = re.compile(r"[\s\W_]+", re.UNICODE)
+# 模糊比對的守門詞：阿拉伯數字（含小數點）、中文數字串，以及設定中的單位/方向/否定詞（長詞優先）
+_GUARD_RE = re.compile("|".join(
+    [r"\d+(?:\.\d+)?", "[零〇一二兩三四五六七八九十百千萬億壹貳參肆伍陸柒捌玖拾佰仟半點]+"]
+    + [re.escape(w) for w in sorted(RESPONSE_CACHE_FUZZY_GUARD_WORDS, key=len, reverse=True)]
+))
+
+
+def normalize_question(question: str) -> str:
+    """
+    正規化問題：全形轉半形（NFKC）、英文轉小寫、去掉空白與標點。
+    「為什麼階段不看 HR Ratio？」與「為什麼階段不看hr ratio」視為同一題。
+    """
+    text = unicodedata.normalize("NFKC", question or "").lower()
+    return _STRIP_CHARS.sub("", text)
+
+
+def _bigrams(text: str) -> FrozenSet[str]:
+    if len(text) < 2:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + 2] for i in range(len(text) - 1))
+
+
+def guard_terms(text: str) -> Tuple[str, ...]:
+    """
+    問題中的數字與守門詞（依出現順序）；模糊命中要求兩題完全相同。
+    """
+    return tuple(_GUARD_RE.findall(text or ""))
+
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """
+    bigram 集合的 Jaccard 相似度（0~1）。
+    """
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def context_hash(*parts: Any) -> str:
+    """
+    企業上下文雜湊：補充資訊、表單數據、計算結果等任何會影響回覆的內容都應放進來。
+    """
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    記憶體 LRU（OrderedDict）為主、SQLite 為選配的第二層。
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 86400.0, fuzzy_threshold: float = 0.9,
+                 sqlite_path: Optional[str] = None):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.fuzzy_threshold = fuzzy_threshold
+        # (bucket, question) -> (response, expires_at, bigrams, guard_terms)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, float, FrozenSet[str], Tuple[str, ...]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " bucket TEXT NOT NULL, question TEXT NOT NULL, response TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, last_used REAL NOT NULL,"
+                " PRIMARY KEY (bucket, question))"
+            )
+            self._db.commit()
+        self.stats = {"hits": 0, "fuzzy_hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+
+    @staticmethod
+    def bucket(intent: str, kb_version: str, template_version: str, ctx_hash: str) -> str:
+        return f"{intent}|{kb_version}|{template_version}|{ctx_hash}"
+
+    def get(self, question: str, intent: str, kb_version: str, template_version: str,
+            ctx_hash: str) -> Optional[str]:
+        """
+        回傳快取的回覆；沒有（或已過期）時回傳 None。
+        """
+        norm = normalize_question(question)
+        bucket = self.bucket(intent, kb_version, template_version, ctx_hash)
+        now = time.time()
+        with self._lock:
+            found = self._lookup_memory(bucket, norm, now)
+            if found is None and self._db is not None:
+                found = self._lookup_sqlite(bucket, norm, now)
+            if found is None:
+                self.stats["misses"] += 1
+                return None
+            response, fuzzy = found
+            self.stats["fuzzy_hits" if fuzzy else "hits"] += 1
+            return response
+
+    def put(self, question: str, intent: str, kb_version: str, template_version: str,
+            ctx_hash: str, response: str) -> None:
+        norm = normalize_question(question)
+        bucket = self.bucket(intent, kb_version, template_version, ctx_hash)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(bucket, norm, response, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?)",
+                    (bucket, norm, response, expires_at, time.time()),
+                )
+                self._db.execute(
+                    "DELETE FROM response_cache WHERE rowid IN ("
+                    " SELECT rowid FROM response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                self._db.commit()
+            self.stats["puts"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM response_cache")
+                self._db.commit()
+
+    # ---- 內部：呼叫端需持有 self._lock ----
+
+    def _remember(self, bucket: str, norm: str, response: str, expires_at: float) -> None:
+        key = (bucket, norm)
+        self._entries[key] = (response, expires_at, _bigrams(norm), guard_terms(norm))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _lookup_memory(self, bucket: str, norm: str, now: float) -> Optional[Tuple[str, bool]]:
+        key = (bucket, norm)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                return entry[0], False
+            del self._entries[key]
+
+        if self.fuzzy_threshold >= 1.0:
+            return None
+        grams = _bigrams(norm)
+        guards = guard_terms(norm)
+        best_key, best_score = None, self.fuzzy_threshold
+        expired = []
+        for (entry_bucket, entry_norm), (response, expires_at, entry_grams, entry_guards) in self._entries.items():
+            if entry_bucket != bucket:
+                continue
+            if expires_at <= now:
+                expired.append((entry_bucket, entry_norm))
+                continue
+            if entry_guards != guards:
+                continue
+            score = similarity(grams, entry_grams)
+            if score >= best_score:
+                best_key, best_score = (entry_bucket, entry_norm), score
+        for k in expired:
+            del self._entries[k]
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key][0], True
+
+    def _lookup_sqlite(self, bucket: str, norm: str, now: float) -> Optional[Tuple[str, bool]]:
+        rows = self._db.execute(
+            "SELECT question, response, expires_at FROM response_cache WHERE bucket = ? AND expires_at > ?",
+            (bucket, now),
+        ).fetchall()
+        grams = _bigrams(norm)
+        guards = guard_terms(norm)
+        best, best_score, fuzzy = None, self.fuzzy_threshold, True
+        for question, response, expires_at in rows:
+            if question == norm:
+                best, fuzzy = (question, response, expires_at), False
+                break
+            if guard_terms(question) != guards:
+                continue
+            score = similarity(grams, _bigrams(question))
+            if self.fuzzy_threshold < 1.0 and score >= best_score:
+                best, best_score = (question, response, expires_at), score
+        if best is None:
+            return None
+        question, response, expires_at = best
+        self._db.execute(
+            "UPDATE response_cache SET last_used = ? WHERE bucket = ? AND question = ?",
+            (time.time(), bucket, question),
+        )
+        self._db.commit()
+        # 提升到記憶體層，下次不必再查 SQLite
+        self._remember(bucket, question, response, expires_at)
+        return response, fuzzy
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    依設定建立的程序層級快取（RESPONSE_CACHE_ENABLED=False 時回傳 None）。
+    """
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                    ttl=RESPONSE_CACHE_TTL_SEC,
+                    fuzzy_threshold=RESPONSE_CACHE_FUZZY_THRESHOLD,
+                    sqlite_path=RESPONSE_CACHE_SQLITE_PATH,
+                )
+    return _cache
@@ -0,0 +1,202 @@
+# utils/summarizer.py
+"""
+滾動對話摘要：未摘要的歷史超過 token 預算時，把較舊的訊息增量濃縮進摘要，
+送給模型的內容 = 摘要 + 最近幾則原文，長對話的提示詞大小維持大致固定又不會丟掉早期脈絡。
+
+摘要狀態是一個 dict：{"summary": 摘要文字, "covered": 訊息列表開頭已併入摘要的則數}，
+由呼叫端保存（main.py 放在 session_state，並隨對話記錄的 metadata 寫進 Supabase）；
+摘要失敗後另帶 "failures" / "retry_at"（退避用，不寫進 metadata）。
+
+組提示詞時只用 history_for_prompt（不呼叫模型）；摘要（fold_history）在回覆送出後以 schedule_fold 於背景進行，
+下一輪再以 collect_fold 取回，摘要呼叫不會出現在使用者等待首段回覆的路徑上。
+"""
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config.settings import (
+    HISTORY_KEEP_RECENT,
+    HISTORY_SUMMARY_ENABLED,
+    HISTORY_SUMMARY_MAX_TOKENS,
+    HISTORY_SUMMARY_PROMPT,
+    HISTORY_SUMMARY_RETRY_BACKOFF_SEC,
+    HISTORY_SUMMARY_RETRY_MAX_SEC,
+    HISTORY_SUMMARY_WORKERS,
+    HISTORY_TOKEN_BUDGET,
+)
+from utils.prompt_builder import estimate_tokens
+
+# 寫進對話記錄 metadata 的欄位名稱
+SUMMARY_METADATA_KEY = "history_summary"
+PENDING_METADATA_KEY = "summary_pending"
+
+_ROLE_LABELS = {"user": "使用者", "assistant": "顧問"}
+
+
+def new_summary_state() -> Dict[str, Any]:
+    return {"summary": "", "covered": 0}
+
+
+def _format_turns(messages: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"{_ROLE_LABELS.get(m.get('role'), m.get('role'))}：{m.get('content', '')}" for m in messages)
+
+
+def summarize_turns(previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    """
+    呼叫 Gemini：先前摘要 + 新增對話 → 新摘要。失敗時拋出 GeminiCallError。
+    """
+    from utils.gemini_client import generate_gemini_text
+
+    system_prompt = HISTORY_SUMMARY_PROMPT.format(max_tokens=HISTORY_SUMMARY_MAX_TOKENS)
+    user_message = f"【先前摘要】\n{previous_summary or '（無）'}\n\n【新增對話】\n{_format_turns(messages)}"
+    return generate_gemini_text(
+        system_prompt, user_message, temperature=0.2, max_tokens=HISTORY_SUMMARY_MAX_TOKENS * 2,
+    ).strip()
+
+
+def history_for_prompt(
+    messages: List[Dict[str, Any]],
+    state: Optional[Dict[str, Any]] = None,
+) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    依摘要狀態切出要送給模型的歷史（不呼叫模型）：摘要之後的原文訊息 + 摘要文字。
+    尚未摘要的部分超過預算時由 build_prompt 的 token 預算裁切保底。
+
+    Returns:
+        tuple: (要送出的歷史訊息 [{"role", "content"}], 摘要文字)
+    """
+    state = state or new_summary_state()
+    covered = min(max(int(state.get("covered", 0)), 0), len(messages))
+    history = [{"role": m["role"], "content": m["content"]} for m in messages[covered:]]
+    return history, state.get("summary", "")
+
+
+def fold_history(
+    messages: List[Dict[str, Any]],
+    state: Optional[Dict[str, Any]] = None,
+    token_budget: Optional[int] = None,
+    keep_recent: Optional[int] = None,
+    summarize: Optional[Callable[[str, List[Dict[str, Any]]], str]] = None,
+    now: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    未摘要的訊息超過預算時，把最舊的部分併入摘要，回傳新的摘要狀態（會呼叫模型，阻塞）。
+
+    只有新併入的訊息會送去摘要（與先前摘要合併），已摘要的部分不會重送；
+    一次壓縮到預算的一半左右，避免之後每一輪都要重新摘要。
+    摘要失敗時維持原摘要並記下退避期限，期限前不再嘗試。
+
+    Args:
+        messages: 完整對話（由舊到新）
+        state: 摘要狀態，None 表示尚未摘要
+        token_budget: 未摘要歷史的 token 上限，預設 HISTORY_TOKEN_BUDGET
+        keep_recent: 至少保留原文的最近訊息數，預設 HISTORY_KEEP_RECENT
+        summarize: 摘要函式 (先前摘要, 新增訊息) → 新摘要，預設 summarize_turns
+        now: 目前時間（time.time()），測試用
+
+    Returns:
+        dict: 新的摘要狀態
+    """
+    state = dict(state or new_summary_state())
+    covered = min(max(int(state.get("covered", 0)), 0), len(messages))
+    state["covered"] = covered
+    now = time.time() if now is None else now
+    if not HISTORY_SUMMARY_ENABLED or now < state.get("retry_at", 0.0):
+        return state
+
+    pending = messages[covered:]
+    budget = HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+    keep = HISTORY_KEEP_RECENT if keep_recent is None else keep_recent
+    tokens = [estimate_tokens(m.get("content", "")) for m in pending]
+    total = sum(tokens)
+    if not budget or total <= budget or len(pending) <= keep:
+        return state
+
+    # 從最舊的開始併入，直到剩下的不超過預算一半（但最近 keep 則一定保留原文）
+    fold = 0
+    while fold < len(pending) - keep and total > budget // 2:
+        total -= tokens[fold]
+        fold += 1
+    try:
+        summary = (summarize or summarize_turns)(state.get("summary", ""), pending[:fold])
+    except Exception:
+        summary = ""
+    if summary:
+        return {"summary": summary, "covered": covered + fold}
+
+    failures = int(state.get("failures", 0)) + 1
+    backoff = min(HISTORY_SUMMARY_RETRY_BACKOFF_SEC * (2 ** (failures - 1)), HISTORY_SUMMARY_RETRY_MAX_SEC)
+    return {**state, "failures": failures, "retry_at": now + backoff}
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=HISTORY_SUMMARY_WORKERS, thread_name_prefix="history-summary")
+    return _executor
+
+
+def schedule_fold(messages: List[Dict[str, Any]], state: Optional[Dict[str, Any]] = None) -> Optional[Future]:
+    """
+    在背景執行 fold_history（messages 會先複製一份）；不需要摘要（未超過預算或仍在退避期）時回傳 None。
+    """
+    state = state or new_summary_state()
+    if not HISTORY_SUMMARY_ENABLED or time.time() < state.get("retry_at", 0.0):
+        return None
+    covered = min(max(int(state.get("covered", 0)), 0), len(messages))
+    if sum(estimate_tokens(m.get("content", "")) for m in messages[covered:]) <= HISTORY_TOKEN_BUDGET:
+        return None
+    return _get_executor().submit(fold_history, list(messages), state)
+
+
+def collect_fold(job: Optional[Future], state: Dict[str, Any]) -> Tuple[Optional[Future], Dict[str, Any]]:
+    """
+    取回背景摘要的結果：已完成時回傳 (None, 新狀態)；尚未完成時回傳 (job, 原狀態)，不等待。
+    """
+    if job is None or not job.done():
+        return job, state
+    try:
+        return None, job.result()
+    except Exception:
+        return None, state
+
+
+def shift_summary_state(state: Dict[str, Any], prepended: int) -> Dict[str, Any]:
+    """
+    訊息列表前面插入了 prepended 則更早的訊息（載入較早的歷史頁面）時，調整 covered 讓摘要邊界不變。
+    """
+    return {**state, "covered": int(state.get("covered", 0)) + prepended}
+
+
+def summary_metadata(state: Dict[str, Any], total_messages: int) -> Dict[str, Any]:
+    """
+    要寫進對話記錄 metadata 的摘要欄位：摘要文字與「截至這則為止尚未摘要的則數」。
+    存相對數量而不是索引，之後只載入最新一頁歷史也能還原摘要邊界。
+    """
+    if not state.get("summary"):
+        return {}
+    return {
+        SUMMARY_METADATA_KEY: state["summary"],
+        PENDING_METADATA_KEY: max(total_messages - int(state.get("covered", 0)), 0),
+    }
+
+
+def restore_summary_state(messages: List[Dict[str, Any]], metadata: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    由載入的歷史頁面還原摘要狀態：找最新一則帶有摘要的訊息，依其 summary_pending 推回 covered。
+    metadata 與 messages 一一對應（由舊到新）。
+    """
+    for index in range(len(metadata) - 1, -1, -1):
+        meta = metadata[index] or {}
+        summary = meta.get(SUMMARY_METADATA_KEY)
+        if summary:
+            pending = int(meta.get(PENDING_METADATA_KEY, 0))
+            return {"summary": summary, "covered": max(index + 1 - pending, 0)}
+    return new_summary_state()